@@ -4,7 +4,39 @@ import firebase_admin
 from firebase_admin import credentials, db
 import os
 import concurrent.futures
+import functools
+import threading
 import time
+from state_bus import open_backend
+from depth_archive import load_ref, colorize_depth
+from wafer_stats import HIST_BIN, HIST_LOW, MAX_WEIGHT, MIN_WEIGHT, WaferStats
+from wafer_trace import Tracer
+
+IMAGE_SIZE = (850, 850)
+DRAIN_MS = 50          # 작업 스레드가 올린 변경분을 메인 루프에서 반영하는 주기
+RESIZE_DEBOUNCE_MS = 150
+RESYNC_MS = 5000       # 구독이 끊긴 경우를 대비한 전체 상태 재동기화 주기
+STATS_REDRAW_MS = 500  # 통계 패널을 다시 그리는 주기 (이벤트가 아무리 빨리 와도 이 주기로만 그림)
+STATS_PANEL = (970, 220, 260, 650)  # x, y, 너비, 높이
+
+
+@functools.lru_cache(maxsize=16)
+def load_scaled_image(image_path, mtime_ns, size):
+    """이미지 파일을 디코딩해 표시 크기로 줄인 결과를 (경로, 수정 시각, 크기) 기준으로 캐시하는 함수"""
+    img = Image.open(image_path)
+
+    # 이미지 모드가 'RGB'가 아니면 변환
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img.resize(IMAGE_SIZE, Image.Resampling.LANCZOS)
+
+
+@functools.lru_cache(maxsize=16)
+def load_scaled_depth(depth_ref):
+    """깊이 아카이브 프레임을 컬러맵으로 변환해 표시 크기로 줄인 결과를 캐시하는 함수 (아카이브는 추가 전용)"""
+    _, depth = load_ref(depth_ref)
+    return Image.fromarray(colorize_depth(depth)).resize(IMAGE_SIZE, Image.Resampling.LANCZOS)
+
 
 class ImageUpdaterApp:
     def __init__(self, root):
@@ -17,16 +49,26 @@ class ImageUpdaterApp:
         firebase_admin.initialize_app(cred, {
             'databaseURL': 'https://moas-45385-default-rtdb.asia-southeast1.firebasedatabase.app/'})
 
-        # Firebase 데이터 참조 설정
-        self.wafer_ref = db.reference('wafer')
-        self.accuracy_ref = db.reference('accuracy')
-        self.weight_ref = db.reference('weight')
-        self.weight_state_ref = db.reference('weight_state')
-        self.image_path_ref = db.reference('image_path')
+        # 상태 백엔드 설정 (MOAS_STATE_BACKEND 로 로컬 버스 또는 Firebase 선택)
+        self.state = open_backend()
+
+        # 비동기 스레드 풀 생성
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=5)
+
+        # 작업 스레드 -> 메인 루프 변경분 큐 (같은 키는 마지막 값만 남김)
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.fetch_future = None
+
+        # 창 크기별 배경 이미지 캐시와 디바운스 작업
+        self.bg_cache = {}
+        self.bg_size = None
+        self.resize_job = None
 
         # 배경 이미지 설정
         try:
             self.bg_image = Image.open("/home/moas/Desktop/background.jpg")
+            self.bg_image.load()  # 작업 스레드에서 리사이즈하기 전에 미리 디코딩
             print("배경 이미지 로드 성공")
         except Exception as e:
             print(f"배경 이미지 로드 중 오류: {e}")
@@ -53,19 +95,51 @@ class ImageUpdaterApp:
         # 창 크기가 변경될 때 호출되는 함수
         self.root.bind("<Configure>", self.on_resize)
 
-        # 비동기 스레드 풀 생성
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=5)
+        # 마지막으로 화면에 반영한 원본 값과 이미지 키
+        self.values = {}
+        self.image_key = None
+        self.tracer = Tracer('gui')
 
-        # 데이터를 주기적으로 업데이트하고 UI를 새로고침
-        self.update_data_and_ui()
+        # 웨이퍼 이벤트 롤링 통계 패널 (구독 콜백에서 이벤트마다 O(1) 로 갱신)
+        self.stats = WaferStats()
+        self.create_stats_panel(*STATS_PANEL)
+
+        # 상태 전체를 한 번 구독하고, 초기값은 하위 트리를 한 번에 가져와 반영
+        try:
+            if self.state.replays_on_subscribe:
+                self.stats.seed(self.state.snapshot())  # 구독 직후 다시 오는 현재 값은 새 웨이퍼가 아님
+        except Exception as e:
+            print(f"상태 가져오기 중 오류: {e}")
+        self.state.subscribe(None, self.on_state_change)
+        self.resync()
+        self.drain_updates()
+        self.redraw_stats()
 
     def update_background(self):
-        """창 크기에 맞게 배경 이미지를 업데이트하는 함수"""
-        width = self.root.winfo_width()
-        height = self.root.winfo_height()
-        resized_bg = self.bg_image.resize((width, height), Image.Resampling.LANCZOS)
+        """창 크기에 맞게 배경 이미지를 업데이트하는 함수 (크기별 캐시, 없으면 작업 스레드에서 리사이즈)"""
+        self.resize_job = None
+        size = (self.root.winfo_width(), self.root.winfo_height())
+        if size == self.bg_size:
+            return
+        if size in self.bg_cache:
+            self.show_background(size, self.bg_cache[size])
+            return
+
+        def resize():
+            resized_bg = self.bg_image.resize(size, Image.Resampling.LANCZOS)
+            self.publish({'_background': (size, resized_bg)})
+        self.executor.submit(resize)
+
+    def show_background(self, size, resized_bg):
+        """리사이즈된 배경 이미지를 캐시하고 화면에 반영하는 함수 (메인 스레드)"""
+        self.bg_cache[size] = resized_bg
+        if len(self.bg_cache) > 4:
+            self.bg_cache.pop(next(iter(self.bg_cache)))  # 가장 오래된 크기 제거
+        if size != (self.root.winfo_width(), self.root.winfo_height()):
+            return  # 그 사이 창 크기가 또 바뀜
+        self.bg_size = size
         self.bg_photo = ImageTk.PhotoImage(resized_bg)
-        print(f"배경 이미지 크기: {width}x{height}")
+        print(f"배경 이미지 크기: {size[0]}x{size[1]}")
 
         if hasattr(self, 'background_label'):
             self.background_label.config(image=self.bg_photo)
@@ -76,8 +150,12 @@ class ImageUpdaterApp:
             self.background_label.lower()  # 배경을 다른 위젯 뒤로 이동
 
     def on_resize(self, event):
-        """창 크기 변경 이벤트를 처리하는 함수"""
-        self.update_background()
+        """창 크기 변경 이벤트를 처리하는 함수 (루트 창 이벤트만, 마지막 이벤트 후 한 번만 처리)"""
+        if event.widget is not self.root:
+            return  # 자식 위젯의 Configure 이벤트 무시
+        if self.resize_job is not None:
+            self.root.after_cancel(self.resize_job)
+        self.resize_job = self.root.after(RESIZE_DEBOUNCE_MS, self.update_background)
 
     def create_data_label(self, parent, text, variable, x, y, width, height, bg_color, fg_color):
         """데이터를 표시할 라벨을 생성하는 함수"""
@@ -87,33 +165,139 @@ class ImageUpdaterApp:
         label = tk.Label(frame, textvariable=variable, font=('Helvetica', 35, 'bold'), bg=bg_color, fg=fg_color)
         label.pack(fill=tk.BOTH, expand=True)
 
-    def update_data_and_ui(self):
-        """Firebase에서 데이터를 가져와 UI를 업데이트하는 함수"""
-        self.executor.submit(self.fetch_and_update_ui)  # 비동기로 작업 처리
-        self.root.after(1000, self.update_data_and_ui)  # 1초마다 업데이트
+    def create_stats_panel(self, x, y, width, height):
+        """처리량/수율/무게 분포/신뢰도 통계를 그릴 캔버스를 만들고 항목을 한 번만 생성하는 함수"""
+        self.stats_canvas = tk.Canvas(self.root, width=width, height=height, bg="#F5F5F5", highlightthickness=0)
+        self.stats_canvas.place(x=x, y=y)
+        self.stats_text = self.stats_canvas.create_text(12, 10, anchor=tk.NW, font=('Helvetica', 13), fill="#000000",
+                                                        text="")
+        # 무게 히스토그램 영역 (아래쪽), 막대는 칸 수만큼 미리 만들어 두고 좌표만 바꿈
+        bins = len(self.stats.bins)
+        self.hist_box = (10, height - 230, width - 10, height - 30)
+        left, top, right, bottom = self.hist_box
+        bar_width = (right - left) / bins
+        self.hist_bars = []
+        for i in range(bins):
+            center = HIST_LOW + (i + 0.5) * HIST_BIN
+            color = "#4CAF50" if MIN_WEIGHT <= center <= MAX_WEIGHT else "#E57373"
+            self.hist_bars.append(self.stats_canvas.create_rectangle(
+                left + i * bar_width, bottom, left + (i + 1) * bar_width - 1, bottom, fill=color, width=0))
+        for weight in (MIN_WEIGHT, MAX_WEIGHT):
+            wx = left + (weight - HIST_LOW) / HIST_BIN * bar_width
+            self.stats_canvas.create_line(wx, top, wx, bottom, dash=(3, 2))
+            self.stats_canvas.create_text(wx, bottom + 4, anchor=tk.N, text=f"{weight} g", font=('Helvetica', 10))
+        self.ewma_line = self.stats_canvas.create_line(left, top, left, bottom, fill="#1565C0", width=2,
+                                                       state=tk.HIDDEN)
+        self.stats_version = None
+
+    def redraw_stats(self):
+        """통계 스냅샷을 읽어 패널을 다시 그리는 함수 (STATS_REDRAW_MS 마다, 메인 스레드)"""
+        snap = self.stats.snapshot()
+        fmt = lambda value, spec: format(value, spec) if value is not None else '-'
+        quantiles = '  '.join(f"p{int(q * 100)} {fmt(v, '.1f')}" for q, v in snap['quantiles'].items())
+        self.stats_canvas.itemconfig(self.stats_text, text=(
+            f"Wafers/min  : {snap['per_minute']:.1f}\n"
+            f"Total  : {snap['total']}\n"
+            f"Normal  : {snap['normal']}   Broken  : {snap['broken']}\n"
+            f"Yield (last {snap['recent']})  : {fmt(snap['recent_yield'], '.1f')} %\n"
+            f"Weight EWMA  : {fmt(snap['ewma'], '.2f')} g (±{fmt(snap['ewm_std'], '.2f')})\n"
+            f"In {MIN_WEIGHT}-{MAX_WEIGHT} g  : {fmt(snap['in_spec'], '.1f')} %\n"
+            f"CNN confidence %\n  {quantiles}"))
+        if snap['version'] != self.stats_version:
+            # 히스토그램은 새 웨이퍼가 있을 때만 좌표 갱신
+            self.stats_version = snap['version']
+            left, top, right, bottom = self.hist_box
+            bar_width = (right - left) / len(self.hist_bars)
+            peak = max(snap['bins']) or 1
+            for i, (bar, count) in enumerate(zip(self.hist_bars, snap['bins'])):
+                self.stats_canvas.coords(bar, left + i * bar_width, bottom - (bottom - top) * count / peak,
+                                         left + (i + 1) * bar_width - 1, bottom)
+            if snap['ewma'] is not None:
+                ex = min(right, max(left, left + (snap['ewma'] - HIST_LOW) / HIST_BIN * bar_width))
+                self.stats_canvas.coords(self.ewma_line, ex, top, ex, bottom)
+                self.stats_canvas.itemconfig(self.ewma_line, state=tk.NORMAL)
+        self.root.after(STATS_REDRAW_MS, self.redraw_stats)
+
+    def on_state_change(self, key, value):
+        """상태 구독 콜백 (작업 스레드): 이미지는 미리 디코딩한 뒤 변경분을 큐에 올리는 함수"""
+        self.stats.observe(key, value)
+        if key in ('depth_ref', 'image_path'):
+            self.executor.submit(self.prepare_and_publish, {key: value})
+        else:
+            self.publish({key: value})
+
+    def resync(self):
+        """전체 상태 재동기화를 예약하는 함수 (동시에 하나의 요청만 진행)"""
+        if self.fetch_future is None or self.fetch_future.done():
+            self.fetch_future = self.executor.submit(self.fetch_and_update_ui)
+        self.root.after(RESYNC_MS, self.resync)
 
     def fetch_and_update_ui(self):
-        """Firebase에서 데이터를 가져오고, 변경된 경우에만 UI를 업데이트하는 함수"""
-        new_wafer = self.wafer_ref.get()
-        new_accuracy = self.accuracy_ref.get()
-        new_weight = self.weight_ref.get()
-        new_weight_state = self.weight_state_ref.get()
-        image_path = self.image_path_ref.get()
-
-        # 데이터가 변경된 경우에만 UI 업데이트
-        if new_wafer != self.wafer_var.get():
-            self.update_wafer(new_wafer)
-        if new_accuracy != self.accuracy_var.get():
-            self.update_accuracy(new_accuracy)
-        if new_weight != self.weight_var.get():
-            self.update_weight(new_weight)
-        if new_weight_state != self.weight_state_var.get():
-            self.update_weight_state(new_weight_state)
-        if image_path:  # 이미지 경로가 있을 경우에만 업데이트
-            self.update_image(image_path)
-
-        # UI 즉시 갱신
-        self.root.update_idletasks()
+        """상태 하위 트리를 한 번에 가져와 큐에 올리는 함수 (작업 스레드)"""
+        try:
+            self.prepare_and_publish(self.state.snapshot())
+        except Exception as e:
+            print(f"상태 가져오기 중 오류: {e}")
+
+    def prepare_and_publish(self, changes):
+        """이미지 디코딩/리사이즈를 작업 스레드에서 미리 캐시에 올린 뒤 변경분을 큐에 올리는 함수"""
+        try:
+            if changes.get('depth_ref'):
+                load_scaled_depth(changes['depth_ref'])
+            elif changes.get('image_path'):
+                stat = os.stat(changes['image_path'])
+                load_scaled_image(changes['image_path'], stat.st_mtime_ns, stat.st_size)
+        except Exception as e:
+            print(f"이미지 미리 읽기 중 오류: {e}")
+        self.publish(changes)
+
+    def publish(self, changes):
+        """변경분을 메인 루프용 큐에 합쳐 넣는 함수 (같은 키는 최신 값만 유지)"""
+        with self.pending_lock:
+            self.pending.update(changes)
+
+    def drain_updates(self):
+        """큐에 쌓인 변경분을 메인 스레드에서 한 번에 반영하는 함수"""
+        with self.pending_lock:
+            changes, self.pending = self.pending, {}
+        if '_background' in changes:
+            self.show_background(*changes.pop('_background'))
+        if changes:
+            self.apply_changes(changes)
+        self.root.after(DRAIN_MS, self.drain_updates)
+
+    def apply_changes(self, changes):
+        """원본 값과 비교해 실제로 바뀐 항목만 UI에 반영하는 함수"""
+        updaters = {
+            'wafer': self.update_wafer,
+            'accuracy': self.update_accuracy,
+            'weight': self.update_weight,
+            'weight_state': self.update_weight_state,
+        }
+        for key, update in updaters.items():
+            if key in changes and changes[key] != self.values.get(key):
+                self.values[key] = changes[key]
+                update(changes[key])
+        # 구간 기록용 웨이퍼 ID 와 트리거 시각
+        for key in ('wafer_id', 'trigger_time'):
+            if key in changes:
+                self.values[key] = changes[key]
+
+        # 깊이 프레임 참조는 항목마다 새 값이므로 값 비교로 충분
+        depth_ref = changes.get('depth_ref')
+        depth_changed = bool(depth_ref) and depth_ref != self.values.get('depth_ref')
+        if depth_changed:
+            self.values['depth_ref'] = depth_ref
+        # 이미지 파일은 같은 경로에 덮어쓰므로 파일 수정 시각/크기로 변경 여부 판단
+        image_key = self.image_file_key(changes['image_path']) if changes.get('image_path') else None
+        image_changed = image_key is not None and image_key != self.values.get('image_file')
+        if image_changed:
+            self.values['image_file'] = image_key
+        # 이번 변경분에서 새로 바뀐 쪽을 표시 (둘 다 바뀌면 같은 웨이퍼의 원본 깊이 우선)
+        if depth_changed:
+            self.update_depth(depth_ref)
+        elif image_changed:
+            self.update_image(image_key)
 
     def update_wafer(self, wafer):
         """웨이퍼 상태를 업데이트하는 함수"""
@@ -135,25 +319,45 @@ class ImageUpdaterApp:
         formatted_text = f"State  : {weight_state}"
         self.weight_state_var.set(formatted_text)
 
-    def update_image(self, image_path):
-        """이미지 경로를 기반으로 이미지를 업데이트하는 함수"""
-        if image_path and os.path.exists(image_path):
-            try:
-                img = Image.open(image_path)
-
-                # 이미지 모드가 'RGB'가 아니면 변환
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-
-                img = img.resize((850, 850), Image.Resampling.LANCZOS)
-                img_tk = ImageTk.PhotoImage(img)
-                self.image_label.config(image=img_tk)
-                self.image_label.image = img_tk
-                print(f"새로운 이미지로 업데이트: {image_path}")
-            except Exception as e:
-                print(f"이미지 로드 중 오류: {e}")
-        else:
+    def image_file_key(self, image_path):
+        """이미지 파일의 (경로, 수정 시각, 크기) 를 반환하는 함수 (파일이 없으면 None)"""
+        try:
+            stat = os.stat(image_path)
+        except OSError:
             print(f"이미지를 찾을 수 없습니다: {image_path}")
+            return None
+        return image_path, stat.st_mtime_ns, stat.st_size
+
+    def update_image(self, key):
+        """image_file_key 로 찾은 이미지 파일을 표시하는 함수"""
+        try:
+            self.show_image(load_scaled_image(*key))
+            self.image_key = key
+            self.trace_shown()
+            print(f"새로운 이미지로 업데이트: {key[0]}")
+        except Exception as e:
+            print(f"이미지 로드 중 오류: {e}")
+
+    def update_depth(self, depth_ref):
+        """깊이 아카이브의 원본 프레임을 컬러맵으로 변환해 표시하는 함수"""
+        try:
+            self.show_image(load_scaled_depth(depth_ref))
+            self.image_key = depth_ref
+            self.trace_shown()
+            print(f"새로운 깊이 프레임으로 업데이트: {depth_ref}")
+        except Exception as e:
+            print(f"깊이 프레임 로드 중 오류: {e}")
+
+    def trace_shown(self):
+        """트리거부터 화면에 이미지가 뜰 때까지의 구간을 기록하는 함수"""
+        if self.values.get('trigger_time') is not None:
+            self.tracer.record(self.values.get('wafer_id'), 'ui_shown', self.values['trigger_time'])
+
+    def show_image(self, img):
+        """표시 크기로 준비된 이미지를 라벨에 띄우는 함수"""
+        img_tk = ImageTk.PhotoImage(img)
+        self.image_label.config(image=img_tk)
+        self.image_label.image = img_tk
 
 if __name__ == "__main__":
     root = tk.Tk()
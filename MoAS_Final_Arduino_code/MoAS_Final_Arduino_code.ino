@@ -21,6 +21,19 @@
 #define MIN_WEIGHT 30
 #define MAX_WEIGHT 35
 
+// 1: 웨이퍼당 CRC 프레임 1개 전송, 0: 기존 key:value 텍스트 4줄 전송
+#define SERIAL_FRAMED 1
+#define FRAME_SYNC_1 0xA5
+#define FRAME_SYNC_2 0x5A
+#define FRAME_PAYLOAD_SIZE 10  // seq(2) + weight(4) + weight_state(1) + wafer(1) + accuracy x100(2)
+
+// PC 에서 받는 적재 계획 프레임 (slot_scheduler.py): 'P' flags n_normal 층... n_broken 층...
+#define PLAN_TYPE 'P'
+#define PLAN_MAX_PAYLOAD (3 + 2 * FLOOR_COUNT)
+#define FLAG_EARLY_MOVE 0x01   // 분류 대기 시간 동안 Z 축을 목표 층으로 미리 이동
+#define FLAG_LAZY_RETURN 0x02  // 1층 복귀를 다음 웨이퍼의 팔 회전/스텝 동작과 겹쳐 수행
+#define PLAN_WAIT_MS 600000UL  // 적재함이 가득 찬 뒤 새 계획을 기다리는 최대 시간 (넘으면 기존처럼 정지)
+
 const int NORMAL_WAFER_POSITION[FLOOR_COUNT] = {2, 3, 4, 5, 6, 7, 8};
 const int BROKEN_WAFER_POSITION[FLOOR_COUNT] = {2, 3, 4, 5, 6, 7, 8};
 
@@ -33,6 +46,18 @@ bool is_moving_up = true;
 bool arrived = true;
 bool weight_fault = false;
 float calibration_factor = 7900;
+uint16_t frame_seq = 0;
+
+// 적재 계획 (계획을 한 번도 받지 않으면 기존 카운터 사용)
+bool has_plan = false;
+uint8_t plan_flags = 0;
+uint8_t normal_plan[FLOOR_COUNT];
+uint8_t broken_plan[FLOOR_COUNT];
+uint8_t normal_plan_len = 0, normal_plan_head = 0;
+uint8_t broken_plan_len = 0, broken_plan_head = 0;
+bool target_ready = false;    // 분류 대기 중 이미 목표 층을 정함 (FLAG_EARLY_MOVE)
+bool return_pending = false;  // 1층 복귀를 다음 웨이퍼 동작과 겹쳐 수행할 예정 (FLAG_LAZY_RETURN)
+bool z_moving = false;
 
 void setup() {
   pinMode(Z_ACTUATOR_IN1, OUTPUT);
@@ -61,6 +86,7 @@ void setup() {
 
 void loop() {
   check_floor_position();
+  read_plan();
   
   if (arrived) {
     process_wafer();
@@ -74,12 +100,26 @@ void loop() {
 void process_wafer() {
   unknown_lack();
   Step();
+  if (return_pending) {
+    // 팔 회전/스텝 동안 다 내려오지 못했으면 나머지 복귀 (파손 팔 복귀 동작은 적재 직후 이미 수행)
+    z_home();
+    return_pending = false;
+  }
   gripper_UP();
   check_weight();
 }
 
 void set_next_floor() {
-  if (weight_fault) {
+  if (target_ready) {
+    target_ready = false;
+  } else if (has_plan) {
+    target_floor = next_planned_floor();
+    if (target_floor == 0) {
+      // 계획이 오지 않음 (PC 연결 끊김 등): 적재함 상태를 알 수 없으므로 기존 가득 참과 같이 정지
+      has_plan = false;
+      normal_index = broken_index = FLOOR_COUNT;
+    }
+  } else if (weight_fault) {
     if (broken_index < FLOOR_COUNT) {
       target_floor = BROKEN_WAFER_POSITION[broken_index++];
     }
@@ -91,7 +131,29 @@ void set_next_floor() {
   arrived = false;
 }
 
+// 계획에 이번 웨이퍼 종류의 빈 층이 남아 있는지
+bool plan_slot_available() {
+  return weight_fault ? broken_plan_head < broken_plan_len : normal_plan_head < normal_plan_len;
+}
+
+// 계획에서 이번 웨이퍼 종류의 다음 층을 꺼냄 (적재함이 가득 차면 새 계획을 PLAN_WAIT_MS 까지 기다림)
+// 그 안에 계획이 오지 않으면 0 을 반환
+int next_planned_floor() {
+  unsigned long start = millis();
+  while (!plan_slot_available()) {
+    if (millis() - start >= PLAN_WAIT_MS) {
+      return 0;
+    }
+    read_plan();
+    delay(10);
+  }
+  return weight_fault ? broken_plan[broken_plan_head++] : normal_plan[normal_plan_head++];
+}
+
 void check_floors_full() {
+  if (has_plan) {
+    return;  // 계획 사용 중에는 next_planned_floor() 에서 적재함을 비울 때까지 기다림
+  }
   if (normal_index >= FLOOR_COUNT || broken_index >= FLOOR_COUNT) {
     while (1) {}
   }
@@ -107,7 +169,12 @@ void move_to_target() {
     arrived = true;
     gripper_DOWN();
     delay(500);
-    return_to_first_floor();
+    if (has_plan && (plan_flags & FLAG_LAZY_RETURN)) {
+      return_pending = true;  // 나머지는 다음 웨이퍼의 unknown_lack()/Step() 동안 내려감
+      broken_arm_return();    // 파손 팔 복귀는 건너뛰지 않고, 도는 동안 Z 축도 내려감
+    } else {
+      return_to_first_floor();
+    }
   }
   delay(10);
 }
@@ -119,33 +186,143 @@ void check_weight() {
   
   float weight = scale.get_units(10);
 
-  Serial.print("weight:");
-  Serial.println(weight);
-  
-  if (weight >= MIN_WEIGHT && weight <= MAX_WEIGHT) {
-    Serial.print("weight_state:");
-    Serial.println("good");
-    Serial.print("wafer:");
-    Serial.println("normal");
-    Serial.print("accuracy:");
-    Serial.println("99.13");
-    weight_fault = false;
+  bool good = weight >= MIN_WEIGHT && weight <= MAX_WEIGHT;
+  send_wafer_record(weight, good, good ? 99.13 : 98.78);
+
+  weight_fault = !good;
+  if (has_plan && (plan_flags & FLAG_EARLY_MOVE) && plan_slot_available()) {
+    // 무게 측정이 끝나 종류가 정해졌고 계획에 빈 층이 있을 때만 분류 대기 시간 동안 목표 층으로 미리 이동
+    // (적재함이 가득 차 새 계획을 기다려야 하면 여기서 멈추지 않고 적재 후 set_next_floor() 에서 기다림)
+    target_floor = next_planned_floor();
+    target_ready = true;
+    z_wait(target_floor, 4000);
+  } else {
     delay(4000);
+  }
+  if (good) {
     normal_lack();
   } else {
-     Serial.print("weight_state:");
-    Serial.println("bad");
-    Serial.print("wafer:");
-    Serial.println("broken");
-    Serial.print("accuracy:");
-    Serial.println("98.78");
-    weight_fault = true;
-    delay(4000);
     broken_lack();
   }
   delay(1000);
 }
 
+// CRC-16/CCITT-FALSE (다항식 0x1021, 초기값 0xFFFF), 파이썬 binascii.crc_hqx(data, 0xFFFF) 와 같음
+uint16_t crc16_ccitt(const uint8_t *data, uint8_t len) {
+  uint16_t crc = 0xFFFF;
+  for (uint8_t i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t b = 0; b < 8; b++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+// 웨이퍼 한 장의 결과를 한 번에 전송 (형식은 serial_protocol.py 참고)
+void send_wafer_record(float weight, bool good, float accuracy) {
+#if SERIAL_FRAMED
+  uint8_t frame[2 + 1 + FRAME_PAYLOAD_SIZE + 2];
+  uint16_t acc = (uint16_t)(accuracy * 100 + 0.5);
+  frame[0] = FRAME_SYNC_1;
+  frame[1] = FRAME_SYNC_2;
+  frame[2] = FRAME_PAYLOAD_SIZE;
+  frame[3] = frame_seq & 0xFF;
+  frame[4] = frame_seq >> 8;
+  memcpy(&frame[5], &weight, 4);  // AVR float 는 IEEE 754 리틀 엔디언
+  frame[9] = good ? 1 : 0;        // weight_state: good / bad
+  frame[10] = good ? 1 : 0;       // wafer: normal / broken
+  frame[11] = acc & 0xFF;
+  frame[12] = acc >> 8;
+  uint16_t crc = crc16_ccitt(&frame[2], 1 + FRAME_PAYLOAD_SIZE);
+  frame[13] = crc & 0xFF;
+  frame[14] = crc >> 8;
+  Serial.write(frame, sizeof(frame));
+  frame_seq++;
+#else
+  Serial.print("weight:");
+  Serial.println(weight);
+  Serial.print("weight_state:");
+  Serial.println(good ? "good" : "bad");
+  Serial.print("wafer:");
+  Serial.println(good ? "normal" : "broken");
+  Serial.print("accuracy:");
+  Serial.println(accuracy);
+#endif
+}
+
+
+// 적재 계획 프레임을 읽음 (A5 5A | len | payload | crc16, 바이트가 올 때마다 조금씩 처리)
+void read_plan() {
+  static uint8_t state = 0, len = 0, pos = 0;
+  static uint8_t buf[1 + PLAN_MAX_PAYLOAD + 2];
+  while (Serial.available()) {
+    uint8_t b = Serial.read();
+    if (state == 0) {
+      state = (b == FRAME_SYNC_1) ? 1 : 0;
+    } else if (state == 1) {
+      state = (b == FRAME_SYNC_2) ? 2 : (b == FRAME_SYNC_1 ? 1 : 0);
+    } else if (state == 2) {
+      if (b < 3 || b > PLAN_MAX_PAYLOAD) {
+        state = 0;
+        continue;
+      }
+      len = b;
+      buf[0] = b;
+      pos = 1;
+      state = 3;
+    } else {
+      buf[pos++] = b;
+      if (pos < 1 + len + 2) {
+        continue;
+      }
+      state = 0;
+      uint16_t crc = buf[1 + len] | (buf[2 + len] << 8);
+      if (crc != crc16_ccitt(buf, 1 + len) || buf[1] != PLAN_TYPE) {
+        continue;
+      }
+      uint8_t n_normal = min(buf[3], FLOOR_COUNT);
+      uint8_t n_broken = (4 + n_normal <= len) ? min(buf[4 + n_normal], FLOOR_COUNT) : 0;
+      if (4 + n_normal + n_broken > len) {
+        continue;
+      }
+      plan_flags = buf[2];
+      memcpy(normal_plan, &buf[4], n_normal);
+      memcpy(broken_plan, &buf[5 + n_normal], n_broken);
+      normal_plan_len = n_normal;
+      broken_plan_len = n_broken;
+      normal_plan_head = broken_plan_head = 0;
+      has_plan = true;
+    }
+  }
+}
+
+// ms 동안 기다리면서 Z 축을 target 층 쪽으로 움직임 (도착하거나 시간이 다 되면 정지)
+void z_wait(int target, unsigned long ms) {
+  unsigned long start = millis();
+  while (millis() - start < ms) {
+    z_step_toward(target);
+    delay(1);
+  }
+  if (z_moving) {
+    stop_actuator();
+    z_moving = false;
+  }
+}
+
+void z_step_toward(int target) {
+  check_floor_position();
+  if (current_floor < target) {
+    move_up();
+    z_moving = true;
+  } else if (current_floor > target) {
+    move_down();
+    z_moving = true;
+  } else if (z_moving) {
+    stop_actuator();
+    z_moving = false;
+  }
+}
 
 void move_up() {
   digitalWrite(Z_ACTUATOR_IN1, HIGH);
@@ -249,6 +426,9 @@ void Z_actuator_delay_DOWN(unsigned long delay_time) {
 
 void Step() {
   for (int i = 0; i < 6400; i++) {
+    if (return_pending && (i & 63) == 0) {
+      z_step_toward(1);
+    }
     digitalWrite(DIR, LOW);
     digitalWrite(ENA, HIGH);
     digitalWrite(PUL, HIGH);
@@ -257,13 +437,21 @@ void Step() {
     delayMicroseconds(100);
   }
   digitalWrite(ENA, LOW);
+  if (z_moving) {
+    stop_actuator();
+    z_moving = false;
+  }
 }
 
 void unknown_lack() {
   Herkulex.moveAllAngle(MOTOR_1, 45, LED_GREEN);
   Herkulex.moveAllAngle(MOTOR_2, -16.6, LED_BLUE);
   Herkulex.actionAll(1700);
-  delay(1900);
+  if (return_pending) {
+    z_wait(1, 1900);  // 팔이 도는 동안 1층으로 내려감
+  } else {
+    delay(1900);
+  }
 }
 
 void normal_lack() {
@@ -286,18 +474,31 @@ void broken_lack() {
 
 
 void return_to_first_floor() {
-  while (current_floor > 1) {
-    move_down();
-    check_floor_position();
-    delay(10);
-  }
-  stop_actuator();
+  z_home();
   arrived = true;
+  broken_arm_return();
+}
 
+// 파손 적재함에 놓은 뒤 팔을 되돌림 (1층 복귀를 미루는 중이면 도는 동안 Z 축도 1층 쪽으로 내려감)
+void broken_arm_return() {
   if (weight_fault) {
     Herkulex.moveAllAngle(MOTOR_1, -100, LED_GREEN);
     Herkulex.moveAllAngle(MOTOR_2, 150, LED_BLUE);
     Herkulex.actionAll(1800);
-    delay(2000);
+    if (return_pending) {
+      z_wait(1, 2000);
+    } else {
+      delay(2000);
+    }
   }
 }
+
+void z_home() {
+  while (current_floor > 1) {
+    move_down();
+    check_floor_position();
+    delay(10);
+  }
+  stop_actuator();
+  z_moving = false;
+}
@@ -5,6 +5,12 @@ from firebase_admin import credentials, db
 import os
 import urllib3
 import requests
+from firebase_outbox import FirebaseOutbox
+from serial_protocol import SerialRecordParser
+from slot_scheduler import BOOT_DELAY, SlotScheduler
+from state_bus import open_backend
+from wafer_history import WaferHistory
+from wafer_trace import Tracer, new_wafer_id
 
 # 경고 메시지 비활성화
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -18,51 +24,100 @@ firebase_admin.initialize_app(cred, {
     'databaseURL': 'https://moas-45385-default-rtdb.asia-southeast1.firebasedatabase.app/'
 })
 
-# 시리얼 통신 초기화
+# 시리얼 통신 초기화 (MOAS_SERIAL_PORT 로 시뮬레이터 pty 등 다른 포트 지정)
 ser = serial.Serial(
-    port='/dev/ttyACM0',
+    port=os.environ.get('MOAS_SERIAL_PORT', '/dev/ttyACM0'),
     baudrate=115200,
     parity=serial.PARITY_NONE,
     stopbits=serial.STOPBITS_ONE,
     bytesize=serial.EIGHTBITS,
-    timeout=10
+    timeout=0.5  # read() 는 데이터가 오면 바로 돌아오고, 없으면 최대 이만큼만 기다림
 )
 ser.isOpen()
 
+# 웨이퍼 사이클 구간 기록
+tracer = Tracer('bridge')
+
+def on_flush(wafer_ids, start, end):
+    """outbox 전송이 끝나면 그 배치에 담긴 웨이퍼마다 DB 쓰기 구간을 기록하는 함수"""
+    for wafer_id in wafer_ids:
+        if wafer_id:
+            tracer.record(wafer_id, 'db_write', start, end)
+
+# Firebase 쓰기는 outbox 저널에 기록만 하고 전송은 백그라운드 스레드가 담당
+outbox = FirebaseOutbox(db.reference(), journal_path='/home/moas/firebase_outbox.db', on_flush=on_flush)
+
+# 웨이퍼별 로컬 이력 (수율 조회용, MOAS_HISTORY)
+history = WaferHistory()
+
+# 상태 백엔드 선택 (MOAS_STATE_BACKEND), 로컬 버스를 쓰면 이 프로세스가 브로커를 띄움
+state = open_backend(outbox=outbox, host=True)
+
+# 적재함 점유 상태와 적재 계획 (MOAS_SLOT_POLICY, 기본 fixed 는 스케치 카운터 그대로)
+scheduler = SlotScheduler(os.environ.get('MOAS_SLOT_POLICY', 'fixed'))
+
+def send_plan():
+    """현재 적재 계획을 스케치로 보내는 함수 (fixed 정책이면 보내지 않음)"""
+    frame = scheduler.frame()
+    if frame is not None:
+        ser.write(frame)
+        print(f"적재 계획 전송: {scheduler.plan()}")
+
+def on_unload(key, value):
+    """작업자가 적재함을 비웠다고 알리면 (unload = normal | broken | all) 계획을 다시 보내는 함수"""
+    if value not in ('normal', 'broken', 'all'):
+        return
+    scheduler.unload(value)
+    send_plan()
+    state.set('unload', '')
+
+if scheduler.send_plan:
+    time.sleep(BOOT_DELAY)  # 포트를 열면 아두이노가 재시작하므로 setup() 이 끝난 뒤 전송
+    send_plan()
+state.subscribe('unload', on_unload)
+
 def update_firebase(data_type, value):
-    """Firebase 데이터베이스 업데이트 함수"""
-    max_retries = 3
-    retry_count = 0
-    
-    while retry_count < max_retries:
-        try:
-            dir_ref = db.reference()
-            dir_ref.update({data_type: value})
-            print(f"Firebase 업데이트 성공 - {data_type}: {value}")
-            return
-        except Exception:
-            print(f"Firebase 업데이트 실패 ({retry_count + 1}/{max_retries}): {e}")
-            retry_count += 1
-            time.sleep(1)  # 재시도 전 1초 대기
-            
-    print(f"최대 재시도 횟수 초과 - {data_type}: {value}")
+    """상태 백엔드에 값을 쓰는 함수 (네트워크를 기다리지 않음)"""
+    state.set(data_type, value)
+
+def handle_record(record, read_start):
+    """파싱된 레코드(프레임이면 웨이퍼 한 장 전체, 기존 텍스트면 필드 하나)를 반영하는 함수"""
+    fields = {key: record[key] for key in ('weight_state', 'wafer', 'accuracy') if key in record}
+    if 'weight' in record:
+        # weight 가 새 웨이퍼 사이클의 시작 (상관관계 ID 부여)
+        wafer_id = outbox.begin_cycle(new_wafer_id())
+        tracer.record(wafer_id, 'serial_parse', read_start, seq=record.get('seq'))
+        fields.update({'trigger': 1, 'weight': record['weight'], 'wafer_id': wafer_id,
+                       'trigger_time': time.monotonic()})
+        history.record(wafer_id, ts=time.time(), weight=record['weight'], seq=record.get('seq'))
+    if 'weight_state' in fields or 'wafer' in fields:
+        # 기존 텍스트 형식은 무게 뒤에 판정이 따로 오므로 현재 사이클에 합침
+        history.record(outbox.cycle, weight_state=fields.get('weight_state'), wafer=fields.get('wafer'))
+    if 'weight_state' in fields:
+        # 스케치와 같은 규칙으로 적재 층을 배정해 점유 상태를 맞춤
+        slot = scheduler.on_wafer(fields['weight_state'] == 'good')
+        history.record(outbox.cycle, slot=slot)
+        fields['slot'] = slot
+    if len(fields) == 1:
+        key, value = fields.popitem()
+        update_firebase(key, value)
+    elif fields:
+        state.update(fields)
+
+parser = SerialRecordParser()
 
 # 메인 루프
-while True:
-    if ser.in_waiting > 0:
-        data = ser.readline().decode('utf-8').strip()
-        key, value = data.split(':')
-        key = key.strip()
-        value = value.strip()
-        
-        if key == 'weight':
-            update_firebase('trigger', 1)
-            update_firebase('weight', float(value))
-        elif key == 'weight_state':
-            update_firebase('weight_state', value)
-        elif key == 'wafer':
-            update_firebase('wafer', value)
-        elif key == 'accuracy':
-            update_firebase('accuracy', value)
-        
-    time.sleep(0.1)
+try:
+    while True:
+        # 첫 바이트가 올 때까지 블로킹으로 기다린 뒤 쌓인 바이트를 한 번에 읽음
+        data = ser.read(max(1, ser.in_waiting))
+        read_start = time.monotonic()
+        if ser.in_waiting:
+            data += ser.read(ser.in_waiting)
+        for record in parser.feed(data):
+            handle_record(record, read_start)
+finally:
+    state.close()
+    outbox.close()
+    history.close()
+    tracer.close()
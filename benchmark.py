@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""오프라인 성능 벤치마크와 기준값 비교
+
+python benchmark.py run --out bench.json                # 모든 항목 측정 후 JSON 저장
+python benchmark.py run --only serial depth gui         # 일부 항목만 측정
+python benchmark.py compare baseline.json bench.json --threshold 10
+    # 어느 지표든 기준보다 10% 넘게 나빠지면 종료 코드 1
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+GROUPS = ('serial', 'outbox', 'depth', 'classifier', 'gui')
+BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64)
+DEFAULT_THRESHOLD = 10.0  # %
+
+
+def measure(fn, repeat=20, warmup=2):
+    """fn 을 warmup 회 실행한 뒤 repeat 회 실행 시간의 중앙값(초)을 반환하는 함수"""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times))
+
+
+def metric(value, unit, higher_is_better):
+    return {'value': float(value), 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def machine_metadata():
+    """결과를 비교할 때 필요한 장비/소프트웨어 정보를 모으는 함수"""
+    cpu = platform.processor()
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    cpu = line.split(':', 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'host': platform.node(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu': cpu,
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'tensorflow': getattr(sys.modules.get('tensorflow'), '__version__', None),
+        'commit': commit,
+    }
+
+
+def bench_serial(quick):
+    """시리얼 프레임/기존 텍스트 줄 파싱 속도"""
+    from serial_protocol import SerialRecordParser, encode_frame
+    count = 2000 if quick else 20000
+    frames = b''.join(encode_frame(i, 32.5, i % 10 != 0, 99.13) for i in range(count))
+    lines = b''.join(b'weight:32.50\r\nweight_state:good\r\nwafer:normal\r\naccuracy:99.13\r\n' for _ in range(count))
+
+    def parse(data):
+        parser = SerialRecordParser()
+        for i in range(0, len(data), 4096):  # ser.read(ser.in_waiting) 크기의 조각
+            parser.feed(data[i:i + 4096])
+
+    return {
+        'serial_frames_per_s': metric(count / measure(lambda: parse(frames), repeat=5), 'wafers/s', True),
+        'serial_legacy_per_s': metric(count / measure(lambda: parse(lines), repeat=5), 'wafers/s', True),
+    }
+
+
+def bench_outbox(quick):
+    """outbox 저널 기록 + 배치 전송 처리량 (로컬 가짜 참조 대상)"""
+    from firebase_outbox import FakeReference, FirebaseOutbox
+    wafers = 200 if quick else 2000
+    fields = {'trigger': 1, 'weight': 32.5, 'wafer_id': 0, 'trigger_time': 0.0,
+              'weight_state': 'good', 'wafer': 'normal', 'accuracy': '99.13'}
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        ref = FakeReference()
+        outbox = FirebaseOutbox(ref, journal_path=os.path.join(tmp, 'outbox.db'))
+        t0 = time.perf_counter()
+        for i in range(wafers):
+            outbox.begin_cycle(i)
+            outbox.put_many(dict(fields, wafer_id=i))
+        enqueued = time.perf_counter() - t0
+        outbox.flush(timeout=120)
+        elapsed = time.perf_counter() - t0
+        outbox.close()
+    return {
+        'outbox_put_ms': metric(1000 * enqueued / wafers, 'ms/wafer', False),
+        'outbox_wafers_per_s': metric(wafers / elapsed, 'wafers/s', True),
+        'outbox_wafers_per_write': metric(wafers / max(len(ref.updates), 1), 'wafers/write', True),
+    }
+
+
+def bench_depth(quick):
+    """1280x720 깊이 프레임 컬러맵 변환, PNG 인코딩, 원본 아카이브 저장, 공유 메모리 전달 비용"""
+    from capture_service import SyntheticSource
+    from depth_archive import DepthArchive, colorize_depth
+    source = SyntheticSource(real_time=False)
+    source.start()
+    _, depth = source.read()
+    repeat = 5 if quick else 20
+    color = colorize_depth(depth)
+    results = {'depth_colorize_ms': metric(1000 * measure(lambda: colorize_depth(depth), repeat), 'ms', False)}
+    try:
+        import cv2
+        encode = lambda: cv2.imencode('.png', color)
+    except ImportError:
+        from PIL import Image
+        encode = lambda: Image.fromarray(color).save(io.BytesIO(), format='PNG')
+    results['depth_png_encode_ms'] = metric(1000 * measure(encode, repeat), 'ms', False)
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = DepthArchive(tmp, mode='a')
+        results['depth_archive_append_ms'] = metric(
+            1000 * measure(lambda: archive.append(depth, intrinsics=source.intrinsics), repeat), 'ms', False)
+        archive.close()
+    from frame_handoff import FrameRing
+    ring = FrameRing(f'moas_bench_{os.getpid()}', depth.shape, create=True)
+    results['depth_handoff_publish_ms'] = metric(1000 * measure(lambda: ring.publish(depth), repeat), 'ms', False)
+    ring.close()
+    return results
+
+
+def bench_classifier(quick, model_path=None):
+    """CPU 분류기 배치 크기별 지연과 처리량 (모델이 없으면 같은 구조의 무작위 가중치 모델)"""
+    from wafer_inference import load_predict_fn, predict_batch
+    with tempfile.TemporaryDirectory() as tmp:
+        if not model_path or not os.path.exists(model_path):
+            from wafer_training import build_model
+            model_path = os.path.join(tmp, 'bench_model.keras')
+            build_model(weights=None).save(model_path)
+        backend = 'onnx' if model_path.endswith('.onnx') else 'tflite' if model_path.endswith('.tflite') else 'keras'
+        predict_fn = load_predict_fn(model_path, backend)
+
+    rng = np.random.default_rng(0)
+    results = {}
+    for batch in BATCH_SIZES[:4] if quick else BATCH_SIZES:
+        size = predict_fn.input_size
+        images = rng.random((batch, size, size, 3), dtype=np.float32)
+        seconds = measure(lambda: predict_batch(predict_fn, images), repeat=3 if quick else 10)
+        results[f'classifier_b{batch}_ms'] = metric(1000 * seconds, 'ms/batch', False)
+        results[f'classifier_b{batch}_per_s'] = metric(batch / seconds, 'images/s', True)
+    return results
+
+
+def bench_gui(quick):
+    """GUI 이미지 디코딩 + 850x850 리사이즈 비용 (GUI.load_scaled_image 와 같은 처리)"""
+    from PIL import Image
+    from capture_service import SyntheticSource
+    from depth_archive import colorize_depth
+    source = SyntheticSource(real_time=False)
+    source.start()
+    buf = io.BytesIO()
+    Image.fromarray(colorize_depth(source.read()[1])).save(buf, format='PNG')
+    data = buf.getvalue()
+
+    def decode_resize():
+        img = Image.open(io.BytesIO(data))
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img.resize((850, 850), Image.Resampling.LANCZOS)
+
+    return {'gui_decode_resize_ms': metric(1000 * measure(decode_resize, 5 if quick else 20), 'ms', False)}
+
+
+def run(groups=GROUPS, quick=False, model_path=None):
+    """선택한 항목을 측정해 {'metadata', 'metrics'} 결과를 반환하는 함수"""
+    benches = {'serial': bench_serial, 'outbox': bench_outbox, 'depth': bench_depth,
+               'classifier': lambda q: bench_classifier(q, model_path), 'gui': bench_gui}
+    metrics = {}
+    for group in groups:
+        t0 = time.perf_counter()
+        try:
+            metrics.update(benches[group](quick))
+        except ImportError as e:
+            print(f"{group}: 필요한 라이브러리가 없어 건너뜀 ({e})")
+            continue
+        print(f"{group}: {time.perf_counter() - t0:.1f} s")
+    return {'metadata': machine_metadata(), 'quick': quick, 'metrics': metrics}
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD, overrides=None, allow_missing=False, out=sys.stdout):
+    """기준 결과 대비 변화율을 출력하고 임계값을 넘게 나빠진 지표 이름 목록을 반환하는 함수
+
+    기준 결과에 있는데 이번에 측정되지 않은 지표도 저하로 센다 (라이브러리가 빠져 항목을 건너뛴
+    경우 등). 일부 항목만 일부러 돌린 경우에는 allow_missing 으로 넘길 수 있다.
+    """
+    overrides = overrides or {}
+    regressions = []
+    print(f"{'metric':<28}{'baseline':>12}{'current':>12}{'change':>9}  unit", file=out)
+    for name, base in baseline['metrics'].items():
+        cur = current['metrics'].get(name)
+        if cur is None:
+            if not allow_missing:
+                regressions.append(name)
+            print(f"{name:<28}{base['value']:12.3f}{'-':>12}{'':>9}  {base['unit']}  <- 측정 안 됨", file=out)
+            continue
+        change = 100 * (cur['value'] - base['value']) / base['value'] if base['value'] else 0.0
+        worse = -change if base['higher_is_better'] else change
+        limit = overrides.get(name, threshold)
+        flag = ''
+        if worse > limit:
+            regressions.append(name)
+            flag = f'  <- {limit:g}% 초과 저하'
+        print(f"{name:<28}{base['value']:12.3f}{cur['value']:12.3f}{change:+8.1f}%  {base['unit']}{flag}", file=out)
+    if baseline.get('metadata', {}).get('cpu') != current.get('metadata', {}).get('cpu'):
+        print("주의: 기준 결과와 CPU 가 다릅니다.", file=out)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='오프라인 성능 벤치마크')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('run', help='벤치마크 실행 후 JSON 저장')
+    p.add_argument('--only', nargs='+', choices=GROUPS, default=list(GROUPS))
+    p.add_argument('--model', help='분류기 모델 경로 (기본: 같은 구조의 무작위 가중치 모델)')
+    p.add_argument('--quick', action='store_true', help='반복 횟수를 줄여 빠르게 실행')
+    p.add_argument('--out', default='benchmark.json')
+
+    p = sub.add_parser('compare', help='기준 결과와 비교해 저하가 있으면 실패')
+    p.add_argument('baseline')
+    p.add_argument('current')
+    p.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='허용 저하율 (%%)')
+    p.add_argument('--metric-threshold', nargs='*', default=[], metavar='NAME=PCT', help='지표별 허용 저하율')
+    p.add_argument('--allow-missing', action='store_true', help='기준 결과에만 있는 지표를 저하로 세지 않음')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        result = run(args.only, args.quick, args.model)
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+        for name, m in result['metrics'].items():
+            print(f"{name:<28}{m['value']:12.3f}  {m['unit']}")
+        print(f"결과 저장: {args.out}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    overrides = {name: float(pct) for name, pct in (item.split('=', 1) for item in args.metric_threshold)}
+    regressions = compare(baseline, current, args.threshold, overrides, args.allow_missing)
+    if regressions:
+        print(f"성능 저하 {len(regressions)}건: {', '.join(regressions)}")
+        return 1
+    print("성능 저하 없음")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,75 +1,153 @@
-import numpy as np
+import concurrent.futures
+import os
+import threading
 import cv2
-import pyrealsense2 as rs
 import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import db
+from state_bus import open_backend
+from capture_service import DepthCaptureService, RealSenseSource, SyntheticSource
+from depth_archive import DepthArchive, colorize_depth
+from depth_prescreen import DepthPrescreen
+from frame_handoff import DEFAULT_NAME, FrameRing
+from wafer_config import CAPTURE_DIR, CELL, DEPTH_ARCHIVE_DIR, per_cell
+from wafer_history import WaferHistory
+from wafer_trace import Tracer
 
 # Firebase 초기화
 cred = credentials.Certificate('/home/moas/google-drive/moas-45385-firebase-adminsdk-rzp7k-d54fbd59b5.json')  # 인증 정보 파일 경로 수정
 firebase_admin.initialize_app(cred, {
-    'databaseURL': 'https://moas-45385-default-rtdb.asia-southeast1.firebasedatabase.app/' 
+    'databaseURL': 'https://moas-45385-default-rtdb.asia-southeast1.firebasedatabase.app/'
 })
 
-# Firebase 데이터 참조
-trigger_ref = db.reference('trigger')
-
-# 파이프라인 설정
-pipeline = rs.pipeline()
-config = rs.config()
-
-# 스트림 활성화
-config.enable_stream(rs.stream.depth, 1280, 720, rs.format.z16, 30)
-
-# align 객체 생성
-align_to = rs.stream.color
-align = rs.align(align_to)
-
-try:
-    while True:
-        # Firebase에서 trigger 상태 가져오기
-        trigger = trigger_ref.get()
-        print(f"현재 트리거 값: {trigger}")  # 디버그 메시지 추가
-
-        if trigger == 1:
-            print("카메라 파이프라인 시작")  # 카메라 파이프라인 시작 알림
-            # 파이프라인 시작
-            pipeline.start(config)
-
-            # 프레임 받기
-            frames = pipeline.wait_for_frames()
-            aligned_frames = align.process(frames)
-
-            # Depth 프레임 가져오기
-            depth_frame = aligned_frames.get_depth_frame()
-
-            if not depth_frame:
-                print("깊이 프레임을 가져오는 데 실패했습니다.")
-                continue
-
-            # 컬러맵 설정 및 depth 프레임을 컬러맵으로 변환
-            colorizer = rs.colorizer()
-            colorizer.set_option(rs.option.color_scheme, 0)  # 다른 컬러맵 옵션으로 테스트 (0, 1, 2 등)
-            depth_color_image = np.asanyarray(colorizer.colorize(depth_frame).get_data())
-
-            # 이미지 저장 경로
-            image_path = "/home/moas/google-drive/test_image_files/depth_color.png"
-
-            # 깊이 이미지 저장
-            cv2.imwrite(image_path, depth_color_image)
-
+# 상태 백엔드 (MOAS_STATE_BACKEND 로 선택) 와 구간 기록
+state = open_backend()
+tracer = Tracer('camera')
+
+# 프레임 소스 설정 (MOAS_CAMERA_BAG: 녹화 파일 재생, MOAS_CAMERA_SOURCE=synthetic: 가짜 프레임,
+# MOAS_CAMERA_SOURCE=simulator: 상태의 wafer 값에 맞춰 정상/파손 웨이퍼를 그리는 가짜 프레임)
+source_name = os.environ.get('MOAS_CAMERA_SOURCE')
+if source_name == 'synthetic':
+    source = SyntheticSource()
+elif source_name == 'simulator':
+    from simulator import WaferDepthSource
+    source = WaferDepthSource()
+    state.subscribe('wafer', lambda key, value: source.set_wafer(value) if value in ('normal', 'broken') else None)
+else:
+    source = RealSenseSource(bag_path=os.environ.get('MOAS_CAMERA_BAG'))
+
+# 파이프라인은 한 번만 시작해서 계속 스트리밍
+service = DepthCaptureService(source, capacity=30)
+service.start()
+print("카메라 파이프라인 시작")
+
+# 원본 z16 깊이 아카이브 (컬러맵 변환은 GUI/학습 쪽에서 필요할 때만 수행, MOAS_ARCHIVE=0 이면 저장 안 함)
+# 아카이브, 공유 메모리 링, PNG 디렉터리는 MOAS_CELL 이 있으면 셀마다 따로 씀 (wafer_config.per_cell)
+archive = DepthArchive(DEPTH_ARCHIVE_DIR, mode='a') if os.environ.get('MOAS_ARCHIVE') != '0' else None
+
+# 분류기로 프레임을 넘기는 공유 메모리 링 (MOAS_HANDOFF=1, 분류기는 serve --handoff 로 실행)
+ring = FrameRing(per_cell(DEFAULT_NAME), shape=(source.height, source.width), create=True) \
+    if os.environ.get('MOAS_HANDOFF') == '1' else None
+
+# 디스크 저장(아카이브, PNG)과 결과 기록은 트리거 경로 밖의 작업 스레드 하나에서 순서대로 처리
+persist_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+# 웨이퍼별 로컬 이력에 깊이 참조/사전 검사 결과 기록 (MOAS_HISTORY)
+history = WaferHistory()
+
+# 컬러 PNG 저장 경로. 공유 메모리 링이 없으면 PNG 감시 분류기(serve)의 입력이므로 CNN 이 필요한 웨이퍼는
+# 항상 저장하고, MOAS_SAVE_PNG=1 이면 링이 있거나 사전 검사로 확정한 웨이퍼도 저장
+save_png = os.environ.get('MOAS_SAVE_PNG') == '1'
+image_dir = CAPTURE_DIR
+if CELL:
+    os.makedirs(image_dir, exist_ok=True)
+
+# 깊이 사전 검사 임계값 (MOAS_PRESCREEN), 확실한 웨이퍼는 PNG 저장과 CNN 분류를 건너뜀
+prescreen_path = os.environ.get('MOAS_PRESCREEN')
+prescreen = DepthPrescreen.load(prescreen_path) if prescreen_path else None
+
+def report_prescreen(depth_ref, verdict):
+    """사전 검사로 확정한 결과를 CNN 결과와 같은 Firestore 문서에 기록하는 함수"""
+    from firebase_admin import firestore
+    client = firestore.client()
+    result = {'prediction': verdict, 'accuracy': None, 'image_path': depth_ref, 'source': 'prescreen'}
+    batch = client.batch()
+    batch.set(client.collection('predictions').document('last_prediction'), result)
+    batch.set(client.collection('predictions').document(os.path.basename(depth_ref)), result)
+    batch.commit()
+
+def on_frame(trigger_time, frame_time, depth):
+    """트리거 이후 첫 프레임을 분류기에 넘기고 상태를 갱신하는 함수 (디스크 저장은 비동기)"""
+    print(f"트리거 후 {1000 * (frame_time - trigger_time):.1f} ms 뒤 프레임 확보")
+    wafer_id = state.get('wafer_id', -1)
+    trigger_set = state.get('trigger_time')
+    if trigger_set is not None:
+        tracer.record(wafer_id, 'trigger_observed', trigger_set, trigger_time)
+    tracer.record(wafer_id, 'frame_acquired', trigger_time, frame_time)
+
+    # 원본 깊이로 사전 검사 (None 이면 애매해서 CNN 으로 넘김)
+    verdict = None
+    fields = {'trigger': 0}
+    if prescreen is not None:
+        with tracer.span(wafer_id, 'prescreen'):
+            verdict, _ = prescreen.classify(depth, source.intrinsics['depth_scale'])
+        fields['prescreen'] = verdict or 'cnn'
+        print(f"사전 검사: {verdict or '애매함 -> CNN'}")
+
+    # CNN 이 필요하면 공유 메모리로 바로 넘김 (PNG 인코딩/파일 없음)
+    if verdict is None and ring is not None:
+        with tracer.span(wafer_id, 'handoff'):
+            fields['frame_ref'] = ring.publish(depth, wafer_id, source.intrinsics['depth_scale'], frame_time)
+
+    # trigger 값을 0으로 리셋
+    state.update(fields)
+
+    # 공유 메모리가 없으면 기존처럼 PNG 를 캡처 디렉터리에 저장해 분류기가 읽게 함
+    write_png = save_png or (verdict is None and ring is None)
+    persist_executor.submit(persist, wafer_id, depth, verdict, write_png, fields)
+
+def persist(wafer_id, depth, verdict, write_png, fields):
+    """아카이브/PNG 저장과 사전 검사 결과 기록을 작업 스레드에서 수행하는 함수"""
+    try:
+        depth_ref = image_path = None
+        if archive is not None:
+            # 원본 깊이 저장 (PNG 인코딩 없음)
+            with tracer.span(wafer_id, 'encode'):
+                number = archive.append(depth, wafer_id=wafer_id, intrinsics=source.intrinsics)
+            depth_ref = archive.ref(number)
+            state.set('depth_ref', depth_ref)
+            print(f"깊이 프레임 저장 완료: {depth_ref}")
+
+        if verdict is not None:
+            report_prescreen(depth_ref or f"wafer_{wafer_id}", verdict)
+
+        if write_png:
+            # 컬러맵 변환 (rs.colorizer color_scheme 0 과 같은 Jet 컬러맵) 후 웨이퍼 ID를 붙여 PNG 저장
+            image_path = f"{image_dir}depth_color_{wafer_id}.png"
+            with tracer.span(wafer_id, 'encode_png'):
+                cv2.imwrite(image_path, colorize_depth(depth))
+            state.set('image_path', image_path)
             print(f"깊이 이미지 저장 완료: {image_path}")
 
-            # Firebase trigger 값을 0으로 리셋
-            trigger_ref.set(0)
+        history.record(wafer_id, depth_ref=depth_ref, image_path=image_path, prescreen=fields.get('prescreen'),
+                       frame_ref=fields.get('frame_ref'))
+    except Exception as e:
+        print(f"프레임 저장 중 오류 (wafer {wafer_id}): {e}")
 
-            # 파이프라인 중지
-            pipeline.stop()
-            print("카메라 파이프라인 중지 완료")
+# trigger 이벤트를 구독 (폴링하지 않음)
+state.subscribe('trigger', service.trigger_listener(on_frame))
 
+try:
+    threading.Event().wait()
 finally:
     # 종료 시 파이프라인 중지
-    if pipeline:
-        pipeline.stop()
-        print("파이프라인이 안전하게 종료되었습니다.")
-
+    service.stop()
+    persist_executor.shutdown(wait=True)
+    if archive is not None:
+        archive.close()
+    if ring is not None:
+        ring.close()
+    history.close()
+    tracer.close()
+    print("파이프라인이 안전하게 종료되었습니다.")
+    state.close()
@@ -0,0 +1,178 @@
+import queue
+import threading
+import time
+import numpy as np
+
+DEPTH_WIDTH = 1280
+DEPTH_HEIGHT = 720
+DEPTH_FPS = 30
+
+
+class RealSenseSource:
+    """RealSense 깊이 스트림을 계속 켜 두고 프레임을 넘겨주는 소스
+
+    bag_path를 주면 카메라 대신 녹화된 .bag 파일을 반복 재생한다.
+    """
+
+    def __init__(self, width=DEPTH_WIDTH, height=DEPTH_HEIGHT, fps=DEPTH_FPS, bag_path=None):
+        import pyrealsense2 as rs
+        self.rs = rs
+        self.width, self.height, self.fps = width, height, fps
+        self.pipeline = rs.pipeline()
+        self.config = rs.config()
+        if bag_path:
+            self.config.enable_device_from_file(bag_path, repeat_playback=True)
+        self.config.enable_stream(rs.stream.depth, width, height, rs.format.z16, fps)
+        self.intrinsics = None
+
+    def start(self):
+        """파이프라인을 한 번만 시작하는 함수 (이후 계속 스트리밍)"""
+        profile = self.pipeline.start(self.config)
+        stream = profile.get_stream(self.rs.stream.depth).as_video_stream_profile()
+        intr = stream.get_intrinsics()
+        self.intrinsics = {
+            'fx': intr.fx, 'fy': intr.fy, 'ppx': intr.ppx, 'ppy': intr.ppy,
+            'depth_scale': profile.get_device().first_depth_sensor().get_depth_scale(),
+        }
+
+    def read(self):
+        """다음 깊이 프레임을 (도착 시각, uint16 배열) 로 반환하는 함수"""
+        while True:
+            frames = self.pipeline.wait_for_frames()
+            stamp = time.monotonic()
+            depth_frame = frames.get_depth_frame()
+            if depth_frame:
+                return stamp, np.asanyarray(depth_frame.get_data())
+            print("깊이 프레임을 가져오는 데 실패했습니다.")
+
+    def stop(self):
+        self.pipeline.stop()
+
+
+class SyntheticSource:
+    """카메라 없이 시험할 때 쓰는 가짜 깊이 프레임 소스 (배경 위의 원판)"""
+
+    def __init__(self, width=DEPTH_WIDTH, height=DEPTH_HEIGHT, fps=DEPTH_FPS, real_time=True, seed=0):
+        self.width, self.height, self.fps = width, height, fps
+        self.real_time = real_time
+        self.intrinsics = {'fx': 640.0, 'fy': 640.0, 'ppx': width / 2, 'ppy': height / 2,
+                           'depth_scale': 0.001}
+        rng = np.random.default_rng(seed)
+        yy, xx = np.mgrid[0:height, 0:width]
+        disc = (xx - width / 2) ** 2 + (yy - height / 2) ** 2 < (min(width, height) * 0.35) ** 2
+        self._base = np.where(disc, 400, 600).astype(np.uint16)  # mm 단위 깊이
+        self._noise = rng.integers(0, 3, size=(8, height, width), dtype=np.uint16)
+        self._count = 0
+        self._next = None
+
+    def start(self):
+        self._next = time.monotonic()
+
+    def read(self):
+        if self.real_time:
+            self._next += 1.0 / self.fps
+            delay = self._next - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        frame = self._base + self._noise[self._count % len(self._noise)]
+        self._count += 1
+        return time.monotonic(), frame
+
+    def stop(self):
+        pass
+
+
+class DepthCaptureService:
+    """파이프라인을 계속 돌리며 최근 N개 프레임을 미리 할당한 링 버퍼에 보관하는 캡처 서비스
+
+    트리거가 오면 트리거 시각 이후(보통 한 프레임 주기 안)에 도착한 첫 프레임을 돌려준다.
+    센서 워밍업과 자동 노출 안정화는 시작할 때 한 번만 치른다.
+    """
+
+    def __init__(self, source, capacity=30):
+        self.source = source
+        self.capacity = capacity
+        self.frame_period = 1.0 / source.fps
+        self._frames = np.zeros((capacity, source.height, source.width), dtype=np.uint16)
+        self._stamps = np.full(capacity, -np.inf)
+        self._count = 0  # 지금까지 버퍼에 쓴 프레임 수
+        self._cond = threading.Condition()
+        self._running = False
+        self._triggers = queue.Queue()
+
+    def start(self):
+        """소스를 시작하고 프레임 수집 스레드를 띄우는 함수"""
+        self.source.start()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='depth-capture', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """수집을 멈추고 소스를 정지하는 함수"""
+        self._running = False
+        self._triggers.put(None)
+        self._thread.join(2.0)
+        self.source.stop()
+
+    def _run(self):
+        """소스에서 프레임을 읽어 링 버퍼에 복사하는 루프"""
+        while self._running:
+            stamp, frame = self.source.read()
+            slot = self._count % self.capacity
+            with self._cond:
+                self._stamps[slot] = -np.inf  # 덮어쓰는 동안 읽히지 않도록 무효화
+            np.copyto(self._frames[slot], frame)
+            with self._cond:
+                self._stamps[slot] = stamp
+                self._count += 1
+                self._cond.notify_all()
+
+    def _find_after(self, t):
+        """버퍼에서 t 이후에 도착한 가장 이른 프레임의 슬롯을 찾는 함수"""
+        candidates = np.flatnonzero(self._stamps >= t)
+        if candidates.size == 0:
+            return None
+        return candidates[np.argmin(self._stamps[candidates])]
+
+    def capture_at(self, t=None, timeout=1.0):
+        """시각 t(time.monotonic 기준) 이후의 첫 프레임을 (시각, 복사본) 으로 반환하는 함수"""
+        t = time.monotonic() if t is None else t
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._find_after(t) is not None, timeout):
+                return None, None
+            slot = self._find_after(t)
+            return float(self._stamps[slot]), self._frames[slot].copy()
+
+    def latest(self):
+        """가장 최근 프레임을 (시각, 복사본) 으로 반환하는 함수"""
+        with self._cond:
+            if not self._count:
+                return None, None
+            slot = (self._count - 1) % self.capacity
+            return float(self._stamps[slot]), self._frames[slot].copy()
+
+    def trigger_listener(self, on_frame):
+        """상태 버스 subscribe에 넘길 트리거 콜백을 만드는 함수
+
+        trigger가 1이 된 시각을 기록해 두고, 별도 스레드에서 그 이후 프레임을 찾아
+        on_frame(트리거 시각, 프레임 시각, 프레임)을 호출한다.
+        """
+        def worker():
+            while True:
+                t = self._triggers.get()
+                if t is None:
+                    return
+                stamp, frame = self.capture_at(t)
+                if frame is None:
+                    print("트리거 이후 프레임을 받지 못했습니다.")
+                    continue
+                on_frame(t, stamp, frame)
+
+        threading.Thread(target=worker, name='depth-trigger', daemon=True).start()
+
+        def listener(key, value):
+            if value == 1:
+                self._triggers.put(time.monotonic())
+        return listener
+
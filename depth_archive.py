@@ -0,0 +1,134 @@
+import os
+import time
+import numpy as np
+
+# 프레임마다 인덱스 파일에 기록하는 고정 길이 레코드
+INDEX_DTYPE = np.dtype([
+    ('offset', '<u8'),       # depth.u16 안에서 프레임 시작 위치 (바이트)
+    ('timestamp', '<f8'),    # 캡처 시각 (time.time)
+    ('wafer_id', '<i8'),
+    ('width', '<u2'),
+    ('height', '<u2'),
+    ('fx', '<f4'),
+    ('fy', '<f4'),
+    ('ppx', '<f4'),
+    ('ppy', '<f4'),
+    ('depth_scale', '<f4'),  # z16 값 1 단위가 몇 m 인지
+])
+
+
+class DepthArchive:
+    """z16 깊이 프레임을 원본 그대로 이어 붙여 저장하는 추가 전용 아카이브
+
+    root 디렉터리에 depth.u16(프레임 데이터)과 index.bin(INDEX_DTYPE 레코드)을 두며,
+    둘 다 np.memmap 으로 열 수 있어 분석과 학습에서 복사 없이 읽을 수 있다.
+    """
+
+    def __init__(self, root, mode='r'):
+        self.root = root
+        self.data_path = os.path.join(root, 'depth.u16')
+        self.index_path = os.path.join(root, 'index.bin')
+        self._data_file = None
+        self._index_file = None
+        self._data_map = None
+        self._index_map = None
+        if mode == 'a':
+            os.makedirs(root, exist_ok=True)
+            self._data_file = open(self.data_path, 'ab')
+            self._index_file = open(self.index_path, 'ab')
+
+    def append(self, depth, wafer_id=-1, intrinsics=None, timestamp=None):
+        """깊이 프레임 하나를 추가하고 프레임 번호를 반환하는 함수"""
+        depth = np.ascontiguousarray(depth, dtype='<u2')
+        intrinsics = intrinsics or {}
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        record['offset'] = self._data_file.seek(0, os.SEEK_END)
+        record['timestamp'] = time.time() if timestamp is None else timestamp
+        record['wafer_id'] = wafer_id
+        record['height'], record['width'] = depth.shape
+        for name in ('fx', 'fy', 'ppx', 'ppy'):
+            record[name] = intrinsics.get(name, 0.0)
+        record['depth_scale'] = intrinsics.get('depth_scale', 0.001)
+
+        self._data_file.write(depth.data)
+        self._data_file.flush()
+        # 인덱스는 데이터를 다 쓴 뒤에 기록해야 잘린 프레임이 인덱스에 올라가지 않는다
+        number = self._index_file.seek(0, os.SEEK_END) // INDEX_DTYPE.itemsize
+        self._index_file.write(record.tobytes())
+        self._index_file.flush()
+        return number
+
+    def __len__(self):
+        if not os.path.exists(self.index_path):
+            return 0
+        return os.path.getsize(self.index_path) // INDEX_DTYPE.itemsize
+
+    def index(self):
+        """전체 인덱스를 memmap 레코드 배열로 반환하는 함수"""
+        count = len(self)
+        if self._index_map is None or len(self._index_map) != count:
+            self._index_map = np.memmap(self.index_path, dtype=INDEX_DTYPE, mode='r', shape=(count,))
+        return self._index_map
+
+    def frame(self, number):
+        """프레임 번호에 해당하는 깊이 배열을 복사 없이 (memmap 뷰로) 반환하는 함수"""
+        record = self.index()[number]
+        size = os.path.getsize(self.data_path)
+        if self._data_map is None or self._data_map.size * 2 != size:
+            self._data_map = np.memmap(self.data_path, dtype='<u2', mode='r')
+        start = int(record['offset']) // 2
+        count = int(record['width']) * int(record['height'])
+        return self._data_map[start:start + count].reshape(int(record['height']), int(record['width']))
+
+    def ref(self, number):
+        """상태 버스에 실을 수 있는 'root#번호' 형식의 참조 문자열을 만드는 함수"""
+        return f"{self.root}#{number}"
+
+    def close(self):
+        for f in (self._data_file, self._index_file):
+            if f is not None:
+                f.close()
+
+
+_archives = {}
+
+
+def load_ref(ref):
+    """'root#번호' 참조로 (인덱스 레코드, 깊이 배열) 을 읽는 함수"""
+    root, number = ref.rsplit('#', 1)
+    if root not in _archives:
+        _archives[root] = DepthArchive(root)
+    archive = _archives[root]
+    return archive.index()[int(number)], archive.frame(int(number))
+
+
+# librealsense colorizer 의 Jet 컬러맵 제어점 (RGB)
+_JET_POINTS = np.array([[0, 0, 255], [0, 255, 255], [255, 255, 0], [255, 0, 0], [50, 0, 0]], dtype=np.float64)
+JET_LUT = np.stack([
+    np.interp(np.linspace(0, 1, 256), np.linspace(0, 1, len(_JET_POINTS)), _JET_POINTS[:, c])
+    for c in range(3)
+], axis=1).astype(np.uint8)
+
+
+def range_lut(min_m=0.2, max_m=1.0, depth_scale=0.001):
+    """고정 깊이 범위용 z16 -> RGB 룩업 테이블 (65536x3) 을 미리 계산하는 함수"""
+    meters = np.arange(65536) * depth_scale
+    position = np.clip((meters - min_m) / (max_m - min_m), 0, 1)
+    lut = JET_LUT[np.round(position * 255).astype(np.uint8)]
+    lut[0] = 0  # 깊이 0(측정 실패)은 검은색
+    return lut
+
+
+def colorize_depth(depth, lut=None):
+    """깊이 배열을 RGB 컬러 이미지로 바꾸는 함수
+
+    lut를 주면 테이블 조회 한 번으로 끝나고, 주지 않으면 rs.colorizer(color_scheme=0)처럼
+    그 프레임의 히스토그램으로 평활화한 Jet 테이블을 만들어 쓴다.
+    """
+    if lut is None:
+        hist = np.bincount(depth.ravel(), minlength=65536)
+        hist[0] = 0
+        cum = np.cumsum(hist)
+        lut = JET_LUT[(cum * 255 // max(cum[-1], 1)).astype(np.uint8)]
+        lut[0] = 0
+    return lut[depth]
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""원본 z16 깊이 프레임으로 확실한 정상/파손 웨이퍼를 CNN 없이 판정하는 사전 검사
+
+python depth_prescreen.py calibrate --train-dir <깊이 학습셋> --out prescreen.json
+python depth_prescreen.py report --train-dir <깊이 학습셋> --thresholds prescreen.json [--model saved_model.keras]
+
+깊이 학습셋은 이미지 학습셋과 같이 클래스 이름 폴더(broken/, normal/)로 나뉘며,
+각 폴더는 DepthArchive 디렉터리(depth.u16 + index.bin)이다.
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+from depth_archive import DepthArchive
+from wafer_config import CLASS_NAMES, PRESCREEN_PATH, TRAIN_DEPTH_DIR
+
+STRIDE = 4              # 특징 계산용 다운샘플 간격 (1280x720 -> 320x180)
+MIN_HEIGHT_MM = 20      # 배경보다 이만큼 가까운 화소를 웨이퍼로 봄
+EDGE_MM = 15            # 이웃 화소와 이보다 크게 차이 나면 깊이 불연속(금, 조각 경계)
+MIN_AREA_PX = 500       # 이보다 작으면 웨이퍼를 찾지 못한 것으로 봄
+VALIDATION_SPLIT = 0.15
+FEATURES = ('fill_ratio', 'edge_density', 'residual_rms_mm', 'residual_p99_mm')
+# 정상 쪽이 작은 값인 특징 (fill_ratio 는 클수록 정상)
+LOWER_IS_NORMAL = ('edge_density', 'residual_rms_mm', 'residual_p99_mm')
+
+
+def _fit_plane(X, z):
+    """정규 방정식 (3x3) 으로 평면 계수를 구하는 함수"""
+    return np.linalg.solve((X.T @ X).astype(np.float64), (X.T @ z).astype(np.float64)).astype(np.float32)
+
+
+def extract_features(depth, depth_scale=0.001, stride=STRIDE):
+    """깊이 프레임에서 평면 맞춤 잔차, 깊이 불연속 밀도, 면적 채움 비율을 계산하는 함수
+
+    웨이퍼를 찾지 못하면 None 을 반환한다.
+    """
+    z = depth[::stride, ::stride].astype(np.float32) * (depth_scale * 1000)  # mm
+    valid = z > 0
+    if valid.sum() < MIN_AREA_PX:
+        return None
+    background = np.percentile(z[valid], 95)
+    mask = valid & (z < background - MIN_HEIGHT_MM)
+    area = int(mask.sum())
+    if area < MIN_AREA_PX:
+        return None
+
+    # 채움 비율: 웨이퍼 면적 / (중심에서 가장 먼 가장자리까지를 반지름으로 한 원의 면적)
+    ys, xs = np.nonzero(mask)
+    cy, cx = ys.mean(), xs.mean()
+    radius = np.percentile(np.hypot(ys - cy, xs - cx), 99.5)
+    fill_ratio = area / (np.pi * radius ** 2)
+
+    # 평면 z = a*x + b*y + c 최소제곱 맞춤 (정규 방정식), 큰 잔차를 빼고 한 번 더 맞춤
+    zs = z[ys, xs]
+    X = np.stack([xs, ys, np.ones_like(xs)], axis=1).astype(np.float32)
+    coef = _fit_plane(X, zs)
+    residual = zs - X @ coef
+    inlier = np.abs(residual) < 3 * max(np.median(np.abs(residual)) * 1.4826, 0.5)
+    if inlier.sum() > 3:
+        coef = _fit_plane(X[inlier], zs[inlier])
+        residual = zs - X @ coef
+    abs_res = np.abs(residual)
+
+    # 원판 안쪽(반지름 90%)에서 이웃 화소와의 깊이 차이가 큰 비율: 금이나 빠진 조각의 경계
+    # (웨이퍼 마스크가 아니라 원 영역을 쓰므로 금 자체의 화소도 포함됨)
+    h, w = z.shape
+    inside = np.hypot(np.arange(h)[:, None] - cy, np.arange(w)[None, :] - cx) < 0.9 * radius
+    jump = np.zeros_like(mask)
+    jump[:, :-1] |= np.abs(np.diff(z, axis=1)) > EDGE_MM
+    jump[:-1, :] |= np.abs(np.diff(z, axis=0)) > EDGE_MM
+    inner = max(int(inside.sum()), 1)
+
+    return {
+        'area_px': area * stride * stride,
+        'fill_ratio': float(fill_ratio),
+        'edge_density': float((jump & inside).sum() / inner),
+        'residual_rms_mm': float(np.sqrt(np.mean(residual ** 2))),
+        'residual_p99_mm': float(np.percentile(abs_res, 99)),
+    }
+
+
+class DepthPrescreen:
+    """특징 임계값으로 'normal', 'broken', None(애매함 -> CNN) 을 판정하는 클래스
+
+    thresholds['normal'] 의 모든 조건을 만족하면 normal, thresholds['broken'] 의 조건 중
+    하나라도 넘으면 broken 이다. 임계값은 calibrate() 로 학습셋에서 정한다.
+    """
+
+    def __init__(self, thresholds, stride=STRIDE):
+        self.thresholds = thresholds
+        self.stride = stride
+
+    @classmethod
+    def load(cls, path=PRESCREEN_PATH):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['thresholds'], data.get('stride', STRIDE))
+
+    def save(self, path=PRESCREEN_PATH, **info):
+        with open(path, 'w') as f:
+            json.dump(dict(info, thresholds=self.thresholds, stride=self.stride), f, indent=2)
+
+    def verdict(self, features):
+        """특징 dict 로 판정하는 함수"""
+        if features is None:
+            return None
+        broken = self.thresholds['broken']
+        if features['fill_ratio'] < broken['fill_ratio'] or \
+                any(features[name] > broken[name] for name in LOWER_IS_NORMAL):
+            return 'broken'
+        normal = self.thresholds['normal']
+        if features['fill_ratio'] >= normal['fill_ratio'] and \
+                all(features[name] <= normal[name] for name in LOWER_IS_NORMAL):
+            return 'normal'
+        return None
+
+    def classify(self, depth, depth_scale=0.001):
+        """깊이 프레임 하나를 (판정, 특징) 으로 반환하는 함수"""
+        features = extract_features(depth, depth_scale, self.stride)
+        return self.verdict(features), features
+
+    @classmethod
+    def calibrate(cls, features, labels, precision=0.995, stride=STRIDE):
+        """학습셋 특징과 라벨로, 확정 판정의 정밀도가 precision 이상인 범위에서 가장 많이 건너뛰는 임계값을 찾는 함수
+
+        임계값은 정상 웨이퍼 특징 분포의 분위수로 정한다. normal 조건은 정상 분포의 q 분위수 상자,
+        broken 조건은 정상 분포의 바깥(q' 분위수 초과)이며 각각 q 를 바꿔 가며 고른다.
+        """
+        table = {name: np.array([f[name] for f in features]) for name in FEATURES}
+        labels = np.array(labels)
+        normal = labels == 'normal'
+
+        def box(q):
+            limits = {name: float(np.quantile(table[name][normal], q)) for name in LOWER_IS_NORMAL}
+            limits['fill_ratio'] = float(np.quantile(table['fill_ratio'][normal], 1 - q))
+            return limits
+
+        def normal_hits(t):
+            hit = table['fill_ratio'] >= t['fill_ratio']
+            for name in LOWER_IS_NORMAL:
+                hit &= table[name] <= t[name]
+            return hit
+
+        def broken_hits(t):
+            hit = table['fill_ratio'] < t['fill_ratio']
+            for name in LOWER_IS_NORMAL:
+                hit |= table[name] > t[name]
+            return hit
+
+        def best(candidates, hits, target):
+            chosen = None
+            for t in candidates:
+                hit = hits(t)
+                if hit.sum() and (labels[hit] == target).mean() >= precision:
+                    if chosen is None or hit.sum() > hits(chosen).sum():
+                        chosen = t
+            return chosen
+
+        # 아무것도 판정하지 않는 임계값 (모두 CNN 으로)
+        never_normal = {name: -np.inf for name in LOWER_IS_NORMAL}
+        never_normal['fill_ratio'] = np.inf
+        never_broken = {name: np.inf for name in LOWER_IS_NORMAL}
+        never_broken['fill_ratio'] = -np.inf
+
+        qs = np.linspace(0.5, 0.99, 50)
+        normal_t = best([box(q) for q in qs], normal_hits, 'normal') or never_normal
+        # broken 은 정상 분포의 끝보다 여유(margin)를 두고 바깥
+        broken_candidates = []
+        for q in (1.0, 0.999, 0.995, 0.99, 0.98):
+            for margin in (1.5, 1.25, 1.1, 1.0):
+                t = box(q)
+                t = {**{name: t[name] * margin for name in LOWER_IS_NORMAL}, 'fill_ratio': t['fill_ratio'] / margin}
+                broken_candidates.append(t)
+        broken_t = best(broken_candidates, broken_hits, 'broken') or never_broken
+        return cls({'normal': normal_t, 'broken': broken_t}, stride)
+
+
+def load_labeled_frames(train_dir=TRAIN_DEPTH_DIR, validation_split=VALIDATION_SPLIT):
+    """클래스별 깊이 아카이브에서 (학습, 검증) 의 (아카이브, 프레임 번호, 라벨) 목록을 만드는 함수
+
+    wafer_dataset.list_split 과 같이 클래스마다 앞쪽 validation_split 비율을 검증용으로 쓴다.
+    """
+    training, validation = [], []
+    for class_name in CLASS_NAMES:
+        archive = DepthArchive(os.path.join(train_dir, class_name))
+        items = [(archive, n, class_name) for n in range(len(archive))]
+        stop = int(validation_split * len(items))
+        validation += items[:stop]
+        training += items[stop:]
+    return training, validation
+
+
+def compute_features(items, stride=STRIDE):
+    """(아카이브, 번호, 라벨) 목록의 특징과 라벨, 프레임당 계산 시간(초)을 반환하는 함수"""
+    features, labels, seconds = [], [], []
+    for archive, number, label in items:
+        depth_scale = float(archive.index()[number]['depth_scale'])
+        t0 = time.perf_counter()
+        features.append(extract_features(archive.frame(number), depth_scale, stride))
+        seconds.append(time.perf_counter() - t0)
+        labels.append(label)
+    keep = [i for i, f in enumerate(features) if f is not None]
+    if len(keep) < len(features):
+        print(f"웨이퍼를 찾지 못한 프레임 {len(features) - len(keep)}개는 제외")
+    return [features[i] for i in keep], [labels[i] for i in keep], seconds
+
+
+def calibrate(train_dir=TRAIN_DEPTH_DIR, out_path=PRESCREEN_PATH, precision=0.995):
+    """학습 분할로 임계값을 정해 저장하는 함수"""
+    training, _ = load_labeled_frames(train_dir)
+    features, labels, _ = compute_features(training)
+    prescreen = DepthPrescreen.calibrate(features, labels, precision)
+    prescreen.save(out_path, precision=precision, train_dir=train_dir, frames=len(features))
+    verdicts = [prescreen.verdict(f) for f in features]
+    decided = sum(v is not None for v in verdicts)
+    print(f"임계값 저장: {out_path} (학습 {len(features)}장 중 {decided}장 확정 판정)")
+    return prescreen
+
+
+def report(train_dir=TRAIN_DEPTH_DIR, thresholds_path=PRESCREEN_PATH, model_path=None, backend='keras'):
+    """검증 분할에서 건너뛴 웨이퍼 수, 확정 판정 정확도, (모델을 주면) CNN 단독 대비 정확도 변화를 출력하는 함수"""
+    prescreen = DepthPrescreen.load(thresholds_path)
+    _, validation = load_labeled_frames(train_dir)
+    verdicts, seconds = [], []
+    for archive, number, label in validation:
+        depth_scale = float(archive.index()[number]['depth_scale'])
+        t0 = time.perf_counter()
+        verdicts.append(prescreen.classify(archive.frame(number), depth_scale)[0])
+        seconds.append(time.perf_counter() - t0)
+    labels = [label for _, _, label in validation]
+    decided = [(v, label) for v, label in zip(verdicts, labels) if v is not None]
+    skipped = len(decided)
+    print(f"검증 {len(validation)}장: 확정 {skipped}장 ({100 * skipped / max(len(validation), 1):.1f}%, "
+          f"normal {sum(v == 'normal' for v, _ in decided)} / broken {sum(v == 'broken' for v, _ in decided)}), "
+          f"CNN 으로 {len(validation) - skipped}장")
+    if decided:
+        print(f"확정 판정 정확도: {np.mean([v == label for v, label in decided]):.4f}")
+    print(f"사전 검사 지연: p50 {1000 * np.percentile(seconds, 50):.2f} ms, p99 {1000 * np.percentile(seconds, 99):.2f} ms")
+
+    if model_path:
+        from wafer_inference import depth_to_input, format_prediction, load_predict_fn, model_input_args, predict_batch
+        predict_fn = load_predict_fn(model_path, backend)
+        input_args = model_input_args(predict_fn)
+        cnn, cnn_seconds = [], []
+        for archive, number, _ in validation:
+            t0 = time.perf_counter()
+            probs = predict_batch(predict_fn, depth_to_input(archive.frame(number), *input_args)[None])[0]
+            cnn_seconds.append(time.perf_counter() - t0)
+            cnn.append(format_prediction(probs)[0])
+        hybrid = [v if v is not None else c for v, c in zip(verdicts, cnn)]
+        cnn_acc = np.mean([c == label for c, label in zip(cnn, labels)])
+        hybrid_acc = np.mean([h == label for h, label in zip(hybrid, labels)])
+        print(f"CNN 단독 정확도 {cnn_acc:.4f}, 사전 검사 + CNN {hybrid_acc:.4f} (Δ {hybrid_acc - cnn_acc:+.4f}), "
+              f"CNN 지연 p50 {1000 * np.percentile(cnn_seconds, 50):.2f} ms")
+
+
+def make_synthetic(out_dir, count=200, broken_rate=0.5, seed=0):
+    """시뮬레이터 깊이 소스로 클래스별 깊이 학습셋을 만드는 함수 (개발/시험용)"""
+    from simulator import WaferDepthSource
+    source = WaferDepthSource(real_time=False, seed=seed)
+    source.start()
+    rng = np.random.default_rng(seed)
+    archives = {name: DepthArchive(os.path.join(out_dir, name), mode='a') for name in CLASS_NAMES}
+    for i in range(count):
+        wafer = 'broken' if rng.random() < broken_rate else 'normal'
+        source.set_wafer(wafer)
+        archives[wafer].append(source.read()[1], wafer_id=i, intrinsics=source.intrinsics)
+    for archive in archives.values():
+        archive.close()
+    print(f"합성 깊이 학습셋 저장: {out_dir} ({count}장)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='깊이 기반 웨이퍼 사전 검사')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('calibrate', help='학습셋으로 임계값 정하기')
+    p.add_argument('--train-dir', default=TRAIN_DEPTH_DIR)
+    p.add_argument('--out', default=PRESCREEN_PATH)
+    p.add_argument('--precision', type=float, default=0.995, help='확정 판정의 최소 정밀도')
+    p = sub.add_parser('report', help='검증셋에서 건너뛴 수와 정확도 변화 보고')
+    p.add_argument('--train-dir', default=TRAIN_DEPTH_DIR)
+    p.add_argument('--thresholds', default=PRESCREEN_PATH)
+    p.add_argument('--model', help='CNN 모델 (주면 CNN 단독 대비 정확도 비교)')
+    p.add_argument('--backend', default='keras')
+    p = sub.add_parser('synth', help='시뮬레이터로 합성 깊이 학습셋 만들기')
+    p.add_argument('out_dir')
+    p.add_argument('--count', type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == 'calibrate':
+        calibrate(args.train_dir, args.out, args.precision)
+    elif args.command == 'report':
+        report(args.train_dir, args.thresholds, args.model, args.backend)
+    else:
+        make_synthetic(args.out_dir, args.count)
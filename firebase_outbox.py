@@ -0,0 +1,198 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class FirebaseOutbox:
+    """Firebase 쓰기를 로컬 저널에 쌓아 두고 백그라운드에서 묶어서 전송하는 클래스
+
+    put()은 SQLite 저널에 한 줄을 추가하고 바로 반환하므로 시리얼 루프는 네트워크를
+    기다리지 않는다. 전송 스레드는 linger 동안 같은 웨이퍼 사이클의 필드가 모이기를
+    기다린 뒤, 대기 중인 항목을 하나의 다중 경로 update()로 합쳐 보낸다. 전송이 밀려 여러 사이클이
+    한 배치에 들어오면 같은 경로는 마지막 값만 보낸다 (_take_batch 참고).
+    전송에 실패하면 항목을 지우지 않고 지수 백오프 후 다시 시도하므로,
+    프로세스가 죽어도 다음 실행에서 남은 항목부터 전송한다.
+    """
+
+    def __init__(self, ref, journal_path='firebase_outbox.db', linger=0.05,
+                 max_batch=500, base_backoff=0.5, max_backoff=30.0, on_flush=None):
+        self.ref = ref  # update(dict)를 제공하는 객체 (db.reference() 또는 가짜 DB)
+        self.on_flush = on_flush  # on_flush(사이클 번호 집합, 전송 시작, 전송 끝) (time.monotonic)
+        self.linger = linger
+        self.max_batch = max_batch
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._closed = False
+        self._failures = 0
+
+        self._conn = sqlite3.connect(journal_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS outbox ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'cycle INTEGER NOT NULL, '
+            'path TEXT NOT NULL, '
+            'value TEXT NOT NULL)'
+        )
+        self._conn.commit()
+
+        # 이전 실행에서 남은 사이클 번호 이어받기
+        row = self._conn.execute('SELECT MAX(cycle) FROM outbox').fetchone()
+        self.cycle = row[0] or 0
+        self._pending = self._conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+        if self._pending:
+            print(f"저널에 남은 Firebase 업데이트 {self._pending}건을 전송합니다")
+
+        self._thread = threading.Thread(target=self._run, name='firebase-outbox', daemon=True)
+        self._thread.start()
+
+    def begin_cycle(self, cycle=None):
+        """새 웨이퍼 사이클을 시작하고 사이클 번호를 반환하는 함수 (번호를 주면 그 값을 사용)"""
+        with self._lock:
+            self.cycle = self.cycle + 1 if cycle is None else cycle
+            return self.cycle
+
+    def put(self, path, value):
+        """업데이트 한 건을 저널에 기록하는 함수 (네트워크를 기다리지 않음)"""
+        self.put_many({path: value})
+
+    def put_many(self, fields):
+        """여러 경로의 업데이트를 한 번에 저널에 기록하는 함수"""
+        rows = [(path, json.dumps(value)) for path, value in fields.items()]
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("이미 종료된 outbox 입니다")
+            self._conn.executemany(
+                'INSERT INTO outbox (cycle, path, value) VALUES (?, ?, ?)',
+                [(self.cycle, path, value) for path, value in rows]
+            )
+            self._conn.commit()
+            self._pending += len(rows)
+            self._cond.notify()
+
+    def pending(self):
+        """아직 전송되지 않은 항목 수를 반환하는 함수"""
+        with self._lock:
+            return self._pending
+
+    def flush(self, timeout=None):
+        """대기 중인 항목이 모두 전송될 때까지 기다리는 함수"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify()
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=5.0):
+        """남은 항목 전송을 잠시 기다린 뒤 전송 스레드와 저널을 닫는 함수
+
+        전송 스레드가 timeout 안에 끝나지 않으면 (update() 가 아직 응답을 기다리는 중) 그 스레드가
+        이어서 저널을 지울 수 있도록 연결을 닫지 않고 남겨 둔다.
+        """
+        if self._closed:
+            return
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"Firebase 전송이 {timeout:.1f}초 안에 끝나지 않아 저널을 열어 둔 채 종료합니다 "
+                  f"(남은 항목은 다음 실행에서 전송)")
+            return
+        with self._lock:
+            self._conn.close()
+
+    def _take_batch(self):
+        """저널에서 가장 오래된 항목들을 읽어 하나의 다중 경로 업데이트로 합치는 함수
+
+        한 배치에 여러 사이클이 들어올 수 있고, 같은 경로는 사이클과 관계없이 마지막 값만 보낸다.
+        RTDB 에는 최신 상태만 남으면 되므로 밀린 동안의 중간 값은 다시 보내지 않는다. 사이클 경계는
+        배치 크기에 걸렸을 때 한 사이클의 필드가 두 배치로 나뉘지 않게 하는 데만 쓴다.
+        """
+        rows = self._conn.execute(
+            'SELECT id, cycle, path, value FROM outbox ORDER BY id LIMIT ?', (self.max_batch,)
+        ).fetchall()
+        if not rows:
+            return None, None, None
+        if len(rows) == self.max_batch and rows[0][1] != rows[-1][1]:
+            # 배치 크기에 걸려 잘린 마지막 사이클은 다음 배치로 넘겨 한 사이클의 필드가 함께 반영되게 함
+            last_cycle = rows[-1][1]
+            rows = [row for row in rows if row[1] != last_cycle]
+        merged = {}
+        for _, _, path, value in rows:
+            merged[path] = json.loads(value)  # 같은 경로는 마지막 값이 이김
+        return rows[-1][0], {row[1] for row in rows}, merged
+
+    def _run(self):
+        """대기 항목을 모아 전송하고, 실패하면 백오프 후 재시도하는 전송 루프"""
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+
+            # 같은 사이클의 나머지 필드가 도착할 시간을 준다
+            time.sleep(self.linger)
+
+            with self._lock:
+                if self._closed and self._failures:
+                    return
+                last_id, cycles, merged = self._take_batch()
+            if merged is None:
+                continue
+
+            start = time.monotonic()
+            try:
+                self.ref.update(merged)
+            except Exception as e:
+                self._failures += 1
+                delay = min(self.max_backoff, self.base_backoff * 2 ** (self._failures - 1))
+                print(f"Firebase 업데이트 실패 ({self._failures}회), {delay:.1f}초 후 재시도: {e}")
+                with self._cond:
+                    self._cond.wait_for(lambda: self._closed, delay)
+                continue
+
+            self._failures = 0
+            with self._cond:
+                cur = self._conn.execute('DELETE FROM outbox WHERE id <= ?', (last_id,))
+                self._conn.commit()
+                self._pending -= cur.rowcount
+                self._cond.notify_all()
+            print(f"Firebase 업데이트 성공 - {merged}")
+            if self.on_flush is not None:
+                self.on_flush(cycles, start, time.monotonic())
+
+
+class FakeReference:
+    """테스트용 로컬 가짜 Firebase 참조 (update 호출을 기록하고 실패를 흉내 냄)"""
+
+    def __init__(self, fail_times=0, delay=0.0):
+        self.data = {}
+        self.updates = []
+        self.fail_times = fail_times
+        self.delay = delay
+
+    def update(self, value):
+        """db.reference().update()와 같은 방식으로 값을 반영하는 함수"""
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise ConnectionError("가짜 네트워크 오류")
+        self.updates.append(dict(value))
+        self.data.update(value)
+
+    def get(self):
+        """현재 값을 반환하는 함수"""
+        return dict(self.data)
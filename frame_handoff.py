@@ -0,0 +1,92 @@
+import time
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+DEFAULT_NAME = 'moas_frames'
+DEFAULT_SLOTS = 8
+
+# 공유 메모리 앞부분: 슬롯 수/높이/너비, 그 뒤 슬롯별 레코드, 그 뒤 프레임 데이터
+_META = np.dtype([('slots', '<i8'), ('height', '<i8'), ('width', '<i8')])
+RECORD_DTYPE = np.dtype([
+    ('seq', '<i8'),          # 이 슬롯에 들어 있는 프레임 번호 (-1: 쓰는 중/비어 있음)
+    ('wafer_id', '<i8'),
+    ('stamp', '<f8'),        # 프레임 도착 시각 (time.monotonic)
+    ('depth_scale', '<f8'),
+])
+
+
+class FrameRing:
+    """카메라 프로세스와 분류기 프로세스가 z16 깊이 프레임을 복사/인코딩 없이 주고받는 공유 메모리 링 버퍼
+
+    카메라는 publish() 로 미리 할당된 슬롯에 프레임을 쓰고 'name:seq' 참조를 상태 버스로 알린다.
+    분류기는 view(seq) 로 같은 메모리를 그대로 읽어 전처리한 뒤 still_valid(seq) 로 그 사이에
+    슬롯이 덮어쓰이지 않았는지 확인한다. 슬롯 수보다 많은 프레임이 밀리면 오래된 것부터 버려진다.
+    """
+
+    def __init__(self, name=DEFAULT_NAME, shape=None, slots=DEFAULT_SLOTS, create=False):
+        self.name = name
+        self.owner = create
+        if create:
+            height, width = shape
+            size = _META.itemsize + slots * RECORD_DTYPE.itemsize + slots * height * width * 2
+            try:
+                # 이전 실행이 비정상 종료해 남은 블록은 지우고 새로 만든다
+                shared_memory.SharedMemory(name=name).unlink()
+            except FileNotFoundError:
+                pass
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            meta = np.ndarray(1, _META, self._shm.buf)
+            meta['slots'], meta['height'], meta['width'] = slots, height, width
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            # 붙기만 한 프로세스가 종료할 때 블록이 지워지지 않도록 추적 해제
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+            meta = np.ndarray(1, _META, self._shm.buf)
+            slots, height, width = int(meta['slots'][0]), int(meta['height'][0]), int(meta['width'][0])
+        self.slots = slots
+        self.shape = (height, width)
+        offset = _META.itemsize
+        self._records = np.ndarray(slots, RECORD_DTYPE, self._shm.buf, offset)
+        offset += slots * RECORD_DTYPE.itemsize
+        self._frames = np.ndarray((slots, height, width), np.uint16, self._shm.buf, offset)
+        if create:
+            self._records['seq'] = -1
+        self._next_seq = 0
+
+    def publish(self, frame, wafer_id=-1, depth_scale=0.001, stamp=None):
+        """프레임을 다음 슬롯에 쓰고 'name:seq' 참조를 반환하는 함수 (쓰는 쪽 한 프로세스만 호출)"""
+        seq = self._next_seq
+        self._next_seq += 1
+        record = self._records[seq % self.slots]
+        record['seq'] = -1  # 덮어쓰는 동안 읽는 쪽이 유효하다고 보지 않도록 무효화
+        np.copyto(self._frames[seq % self.slots], frame)
+        record['wafer_id'] = wafer_id
+        record['stamp'] = time.monotonic() if stamp is None else stamp
+        record['depth_scale'] = depth_scale
+        record['seq'] = seq
+        return f"{self.name}:{seq}"
+
+    def view(self, seq):
+        """seq 프레임의 (레코드 복사본, 공유 메모리 뷰) 를 반환하는 함수 (이미 덮어쓰였으면 (None, None))"""
+        slot = seq % self.slots
+        record = self._records[slot].copy()
+        if record['seq'] != seq:
+            return None, None
+        return record, self._frames[slot]
+
+    def still_valid(self, seq):
+        """view() 로 읽은 뒤에도 그 슬롯이 덮어쓰이지 않았는지 확인하는 함수"""
+        return self._records[seq % self.slots]['seq'] == seq
+
+    def close(self):
+        # 공유 메모리를 가리키는 배열을 먼저 놓아야 블록을 닫을 수 있다
+        self._records = self._frames = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+
+def parse_ref(ref):
+    """'name:seq' 참조를 (name, seq) 로 나누는 함수"""
+    name, seq = ref.rsplit(':', 1)
+    return name, int(seq)
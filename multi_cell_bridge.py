@@ -0,0 +1,245 @@
+"""여러 셀(아두이노 + 카메라) 을 한 장비에서 돌리는 asyncio 시리얼 브리지
+
+셀 목록 설정 (MOAS_CELLS, 기본 /home/moas/cells.json):
+    [{"id": "cell1", "port": "/dev/ttyACM0"}, {"id": "cell2", "port": "/dev/ttyACM1", "slot_policy": "overlap"}]
+
+slot_policy 를 주면 그 셀은 slot_scheduler 의 적재 계획을 쓴다 (점유 상태는 셀마다 cassette_<id>.json).
+
+모든 셀의 시리얼 포트를 이벤트 루프 하나에서 동시에 읽고, 상태는 하나의 Firebase 연결(outbox 하나)로
+'cells/<id>/...' 경로에 쓴다. 셀마다 카메라/분류기/GUI 는 MOAS_CELL=<id> 로 실행하면 자기 셀의
+trigger 와 값만 읽고 쓴다.
+
+python multi_cell_bridge.py [--cells cells.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import serial
+from serial_protocol import SerialRecordParser
+from slot_scheduler import BOOT_DELAY, CASSETTE_PATH, SlotScheduler
+from state_bus import ScopedBackend
+from wafer_trace import new_wafer_id
+
+CELLS_PATH = os.environ.get('MOAS_CELLS', '/home/moas/cells.json')
+REOPEN_DELAY = 2.0  # 포트가 끊겼을 때 다시 여는 간격 (초)
+
+
+def load_cells(path=CELLS_PATH):
+    """셀 목록 설정을 읽어 [{'id', 'port', 'baudrate'}] 로 반환하는 함수"""
+    with open(path) as f:
+        cells = json.load(f)
+    if isinstance(cells, dict):
+        cells = cells.get('cells', [])
+    ids = [cell['id'] for cell in cells]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"셀 ID가 중복되었습니다: {ids}")
+    return [{'id': str(cell['id']), 'port': cell['port'], 'baudrate': cell.get('baudrate', 115200),
+             'slot_policy': cell.get('slot_policy')} for cell in cells]
+
+
+class CellBridge:
+    """셀 하나의 시리얼 포트를 이벤트 루프에서 읽어 'cells/<id>/...' 상태로 반영하는 클래스
+
+    포트는 논블로킹으로 열고 loop.add_reader 로 읽을 수 있을 때만 깨어나므로, 셀이 늘어도
+    스레드나 폴링이 늘지 않는다. 포트가 끊기면 REOPEN_DELAY 마다 다시 연다.
+    """
+
+    def __init__(self, cell_id, port, state, outbox, history=None, tracer=None, baudrate=115200, ids=None,
+                 scheduler=None):
+        self.cell_id = cell_id
+        self.port = port
+        self.baudrate = baudrate
+        self.state = ScopedBackend(state, f'cells/{cell_id}')
+        self.outbox = outbox
+        self.history = history
+        self.tracer = tracer
+        self.parser = SerialRecordParser()
+        self.ids = ids or _WaferIds()
+        self.wafer_id = None
+        self.wafers = 0
+        self.scheduler = scheduler
+        self._ser = None
+        self._closed = asyncio.Event()
+
+    def _open(self):
+        self._ser = serial.Serial(port=self.port, baudrate=self.baudrate, parity=serial.PARITY_NONE,
+                                  stopbits=serial.STOPBITS_ONE, bytesize=serial.EIGHTBITS, timeout=0)
+        self.parser = SerialRecordParser()  # 다시 연 포트는 시퀀스를 처음부터 봄
+
+    async def run(self):
+        """포트를 열고 닫힐 때까지 읽는 코루틴 (끊기면 다시 엶)"""
+        loop = asyncio.get_running_loop()
+        while not self._closed.is_set():
+            try:
+                self._open()
+            except (OSError, serial.SerialException) as e:
+                print(f"[{self.cell_id}] 시리얼 포트 열기 실패 ({self.port}): {e}")
+                await self._sleep(REOPEN_DELAY)
+                continue
+            print(f"[{self.cell_id}] 시리얼 포트 연결: {self.port}")
+            if self.scheduler is not None and self.scheduler.send_plan:
+                loop.call_later(BOOT_DELAY, self.send_plan)  # 아두이노 재시작이 끝난 뒤 계획 전송
+            lost = loop.create_future()
+            loop.add_reader(self._ser.fileno(), self._on_readable, lost)
+            closed = asyncio.ensure_future(self._closed.wait())
+            await asyncio.wait([lost, closed], return_when=asyncio.FIRST_COMPLETED)
+            closed.cancel()
+            loop.remove_reader(self._ser.fileno())
+            self._ser.close()
+            if lost.done():
+                print(f"[{self.cell_id}] 시리얼 포트 끊김: {lost.result()}")
+                await self._sleep(REOPEN_DELAY)
+
+    async def _sleep(self, seconds):
+        try:
+            await asyncio.wait_for(self._closed.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    def send_plan(self):
+        """현재 적재 계획을 이 셀의 스케치로 보내는 함수 (포트가 닫혀 있으면 다음 연결 때 보냄)"""
+        frame = self.scheduler.frame()
+        if frame is None or self._ser is None or not self._ser.is_open:
+            return
+        try:
+            self._ser.write(frame)
+            print(f"[{self.cell_id}] 적재 계획 전송: {self.scheduler.plan()}")
+        except (OSError, serial.SerialException) as e:
+            print(f"[{self.cell_id}] 적재 계획 전송 실패: {e}")
+
+    def watch_unload(self, loop):
+        """'cells/<id>/unload' 가 normal | broken | all 로 바뀌면 점유 상태를 지우고 계획을 다시 보내도록 등록"""
+        def on_unload(key, value):
+            if value in ('normal', 'broken', 'all'):
+                self.scheduler.unload(value)
+                loop.call_soon_threadsafe(self.send_plan)  # 구독 콜백은 다른 스레드에서 올 수 있음
+                self.state.set('unload', '')
+        self.state.subscribe('unload', on_unload)
+
+    def _on_readable(self, lost):
+        """포트에 읽을 바이트가 있을 때 쌓인 만큼 한 번에 읽어 처리하는 함수"""
+        read_start = time.monotonic()
+        try:
+            data = self._ser.read(max(1, self._ser.in_waiting))
+        except (OSError, serial.SerialException) as e:
+            if not lost.done():
+                lost.set_result(e)
+            return
+        for record in self.parser.feed(data):
+            self.handle_record(record, read_start)
+
+    def handle_record(self, record, read_start):
+        """파싱된 레코드를 이 셀의 상태로 반영하는 함수 (MoAS_Final_python_code.handle_record 와 같은 규칙)"""
+        fields = {key: record[key] for key in ('weight_state', 'wafer', 'accuracy') if key in record}
+        if 'weight' in record:
+            self.wafer_id = self.ids.next()
+            self.wafers += 1
+            if self.tracer is not None:
+                self.tracer.record(self.wafer_id, 'serial_parse', read_start, seq=record.get('seq'),
+                                   cell=self.cell_id)
+            fields.update({'trigger': 1, 'weight': record['weight'], 'wafer_id': self.wafer_id,
+                           'trigger_time': time.monotonic()})
+            if self.history is not None:
+                self.history.record(self.wafer_id, ts=time.time(), cell=self.cell_id, weight=record['weight'],
+                                    seq=record.get('seq'))
+        if self.history is not None and ('weight_state' in fields or 'wafer' in fields):
+            self.history.record(self.wafer_id, weight_state=fields.get('weight_state'), wafer=fields.get('wafer'))
+        if self.scheduler is not None and 'weight_state' in fields:
+            fields['slot'] = self.scheduler.on_wafer(fields['weight_state'] == 'good')
+            if self.history is not None:
+                self.history.record(self.wafer_id, slot=fields['slot'])
+        if fields:
+            # 다른 셀의 레코드가 사이에 끼었을 수 있으므로 이 셀의 사이클 번호로 기록
+            self.outbox.begin_cycle(self.wafer_id or self.outbox.cycle)
+            self.state.update(fields)
+
+    def close(self):
+        self._closed.set()
+
+
+class _WaferIds:
+    """여러 셀이 같은 마이크로초에 웨이퍼를 받아도 겹치지 않는 웨이퍼 ID 를 만드는 도우미"""
+
+    def __init__(self):
+        self.last = 0
+
+    def next(self):
+        self.last = max(new_wafer_id(), self.last + 1)
+        return self.last
+
+
+async def run_cells(cells, state, outbox, history=None, tracer=None, stop=None):
+    """셀마다 CellBridge 를 만들어 stop(asyncio.Event) 이 설정될 때까지 함께 돌리는 코루틴"""
+    ids = _WaferIds()
+    loop = asyncio.get_running_loop()
+    bridges = []
+    for cell in cells:
+        scheduler = None
+        if cell.get('slot_policy'):
+            scheduler = SlotScheduler(cell['slot_policy'], f"{os.path.splitext(CASSETTE_PATH)[0]}_{cell['id']}.json")
+        bridge = CellBridge(cell['id'], cell['port'], state, outbox, history, tracer, cell.get('baudrate', 115200),
+                            ids, scheduler)
+        if scheduler is not None:
+            bridge.watch_unload(loop)
+        bridges.append(bridge)
+    tasks = [asyncio.ensure_future(bridge.run()) for bridge in bridges]
+    try:
+        if stop is None:
+            await asyncio.gather(*tasks)
+        else:
+            await stop.wait()
+    finally:
+        for bridge in bridges:
+            bridge.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return bridges
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='여러 셀 시리얼 브리지')
+    parser.add_argument('--cells', default=CELLS_PATH, help='셀 목록 JSON')
+    args = parser.parse_args(argv)
+    cells = load_cells(args.cells)
+
+    import firebase_admin
+    import urllib3
+    from firebase_admin import credentials, db
+    from firebase_outbox import FirebaseOutbox
+    from state_bus import open_backend
+    from wafer_history import WaferHistory
+    from wafer_trace import Tracer
+
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    os.environ['PYTHONHTTPSVERIFY'] = '0'
+
+    # 모든 셀이 Firebase 앱/연결 하나를 함께 씀
+    cred = credentials.Certificate('/home/moas/moas-45385-firebase-adminsdk-rzp7k-d54fbd59b5.json')
+    firebase_admin.initialize_app(cred, {
+        'databaseURL': 'https://moas-45385-default-rtdb.asia-southeast1.firebasedatabase.app/'
+    })
+    tracer = Tracer('bridge')
+
+    def on_flush(wafer_ids, start, end):
+        for wafer_id in wafer_ids:
+            if wafer_id:
+                tracer.record(wafer_id, 'db_write', start, end)
+
+    outbox = FirebaseOutbox(db.reference(), journal_path='/home/moas/firebase_outbox.db', on_flush=on_flush)
+    state = open_backend(outbox=outbox, host=True, cell=None)
+    history = WaferHistory()
+    print(f"셀 {len(cells)}개 브리지 시작: {', '.join(cell['id'] for cell in cells)}")
+    try:
+        asyncio.run(run_cells(cells, state, outbox, history, tracer))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        state.close()
+        outbox.close()
+        history.close()
+        tracer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import binascii
+import struct
+
+# 웨이퍼 한 장당 프레임 하나 (아두이노 send_wafer_frame() 과 같은 형식)
+#   A5 5A | len(1) | seq(u16) weight(f32) weight_state(u8) wafer(u8) accuracy_x100(u16) | crc16(u16)
+# 여러 바이트 값은 리틀 엔디언, CRC 는 len 부터 payload 끝까지의 CRC-16/CCITT-FALSE
+SYNC = b'\xa5\x5a'
+PAYLOAD = struct.Struct('<HfBBH')
+HEADER_SIZE = len(SYNC) + 1
+CRC_SIZE = 2
+FRAME_SIZE = HEADER_SIZE + PAYLOAD.size + CRC_SIZE
+MAX_LINE = 128  # 이보다 긴 텍스트 줄은 잡음으로 보고 버림
+
+LEGACY_KEYS = ('weight', 'weight_state', 'wafer', 'accuracy')
+
+# PC -> 아두이노 적재 계획 프레임 (slot_scheduler.py, 스케치 read_plan())
+#   A5 5A | len(1) | 'P' flags(u8) n_normal(u8) 층... n_broken(u8) 층... | crc16(u16)
+PLAN_TYPE = ord('P')
+FLAG_EARLY_MOVE = 0x01   # 분류 대기 시간 동안 Z 축을 목표 층으로 미리 이동
+FLAG_LAZY_RETURN = 0x02  # 적재 후 1층 복귀를 다음 웨이퍼의 팔 회전/스텝 동작과 겹쳐 수행
+
+
+def crc16(data):
+    """CRC-16/CCITT-FALSE (다항식 0x1021, 초기값 0xFFFF) 를 계산하는 함수"""
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def encode_frame(seq, weight, good, accuracy):
+    """웨이퍼 결과 하나를 프레임 바이트로 만드는 함수 (시뮬레이터/시험용)"""
+    body = bytes([PAYLOAD.size]) + PAYLOAD.pack(seq & 0xFFFF, weight, int(good), int(good), round(accuracy * 100))
+    return SYNC + body + struct.pack('<H', crc16(body))
+
+
+def encode_plan(normal_floors, broken_floors, flags=0):
+    """정상/파손 적재함에 앞으로 넣을 층 순서를 적재 계획 프레임으로 만드는 함수"""
+    payload = (bytes([PLAN_TYPE, flags, len(normal_floors)]) + bytes(normal_floors)
+               + bytes([len(broken_floors)]) + bytes(broken_floors))
+    body = bytes([len(payload)]) + payload
+    return SYNC + body + struct.pack('<H', crc16(body))
+
+
+class SerialRecordParser:
+    """시리얼로 들어온 바이트를 조각 단위로 받아 웨이퍼 레코드로 조립하는 파서
+
+    feed() 에는 ser.read(ser.in_waiting) 으로 읽은 만큼을 그대로 넘기면 되며, 프레임이
+    여러 번에 나뉘어 도착해도 이어 붙여 처리한다. 버퍼는 하나의 bytearray 를 재사용하고
+    처리한 앞부분은 feed() 마다 한 번만 잘라낸다. 기존 'key:value' 텍스트 줄도 받는다.
+
+    반환하는 레코드는 dict 이며, 프레임은 모든 필드와 seq 를, 텍스트 줄은 필드 하나를 담는다.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self.last_seq = None
+        self.frames = 0
+        self.lines = 0
+        self.gaps = 0          # 시퀀스 번호로 확인한 누락 프레임 수
+        self.crc_errors = 0
+        self.bad_lines = 0
+
+    def feed(self, data):
+        """새로 읽은 바이트를 넣고 완성된 레코드 목록을 반환하는 함수"""
+        buf = self._buf
+        buf += data
+        records = []
+        pos = 0
+        end = len(buf)
+        while pos < end:
+            if buf[pos] == SYNC[0]:
+                if end - pos < FRAME_SIZE:
+                    break  # 프레임 나머지가 아직 도착하지 않음
+                record = self._parse_frame(pos)
+                if record is None:
+                    pos += 1  # 동기 바이트가 아니었거나 손상된 프레임: 한 바이트 밀어서 다시 찾음
+                    continue
+                records.append(record)
+                pos += FRAME_SIZE
+                continue
+
+            newline = buf.find(b'\n', pos)
+            sync = buf.find(SYNC[0], pos)
+            if newline < 0 or 0 <= sync < newline:
+                if sync >= 0:
+                    self.bad_lines += sync > pos  # 줄바꿈 없이 끊긴 텍스트
+                    pos = sync
+                    continue
+                if end - pos > MAX_LINE:
+                    self.bad_lines += 1
+                    pos = end
+                break  # 줄의 나머지가 아직 도착하지 않음
+            record = self._parse_line(pos, newline)
+            if record is not None:
+                records.append(record)
+            pos = newline + 1
+
+        del buf[:pos]
+        return records
+
+    def _parse_frame(self, pos):
+        buf = self._buf
+        if buf[pos + 1] != SYNC[1] or buf[pos + 2] != PAYLOAD.size:
+            return None
+        body_end = pos + HEADER_SIZE + PAYLOAD.size
+        (crc,) = struct.unpack_from('<H', buf, body_end)
+        if crc != crc16(memoryview(buf)[pos + 2:body_end]):
+            self.crc_errors += 1
+            return None
+        seq, weight, state, wafer, accuracy = PAYLOAD.unpack_from(buf, pos + HEADER_SIZE)
+        if self.last_seq is not None:
+            missing = (seq - self.last_seq - 1) & 0xFFFF
+            if missing:
+                self.gaps += missing
+                print(f"시리얼 프레임 누락: {missing}개 (seq {self.last_seq} -> {seq})")
+        self.last_seq = seq
+        self.frames += 1
+        return {
+            'seq': seq,
+            'weight': round(weight, 2),
+            'weight_state': 'good' if state else 'bad',
+            'wafer': 'normal' if wafer else 'broken',
+            'accuracy': f"{accuracy / 100:.2f}",
+        }
+
+    def _parse_line(self, start, newline):
+        """'key:value' 텍스트 줄 하나를 해석하는 함수 (잡음이면 None)"""
+        try:
+            line = self._buf[start:newline].decode('utf-8').strip()
+        except UnicodeDecodeError:
+            self.bad_lines += 1
+            return None
+        if not line:
+            return None
+        key, sep, value = line.partition(':')
+        key, value = key.strip(), value.strip()
+        if not sep or key not in LEGACY_KEYS or not value:
+            self.bad_lines += 1
+            return None
+        if key == 'weight':
+            try:
+                value = float(value)
+            except ValueError:
+                self.bad_lines += 1
+                return None
+        self.lines += 1
+        return {key: value}
@@ -0,0 +1,9 @@
+"""하드웨어 없이 파이썬 쪽을 돌려 보기 위한 SCARA 셀 시뮬레이터
+
+- ArduinoSimulator: 아두이노 스케치와 같은 시리얼 출력을 pty 로 내보냄
+- WaferDepthSource: 정상/파손 웨이퍼 모양의 가짜 깊이 프레임 소스
+- FakeDatabase: 프로세스 안에서 도는 가짜 Firebase Realtime Database
+"""
+from simulator.arduino import ArduinoSimulator, STAGE_SECONDS
+from simulator.depth import WaferDepthSource
+from simulator.rtdb import FakeDatabase
@@ -0,0 +1,177 @@
+"""시뮬레이터 실행 도구
+
+python -m simulator arduino --time-factor 0.1     # pty 경로를 출력하고 계속 웨이퍼 결과 전송
+python -m simulator load --wafers 5000 --depth    # 브리지/카메라 경로를 한 프로세스에서 최대 속도로 시험
+python -m simulator cells --cells 1 2 4 8         # 여러 셀 브리지의 셀당 처리량이 셀 수에 따라 유지되는지 시험
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import time
+import serial
+from capture_service import DepthCaptureService
+from depth_archive import DepthArchive
+from firebase_outbox import FirebaseOutbox
+from serial_protocol import SerialRecordParser
+from simulator import ArduinoSimulator, FakeDatabase, WaferDepthSource
+from state_bus import FirebaseBackend
+
+
+def cmd_arduino(args):
+    sim = ArduinoSimulator(broken_rate=args.broken_rate, time_factor=args.time_factor, framed=not args.legacy,
+                           continuous=args.continuous, seed=args.seed)
+    print(f"시뮬레이터 포트: {sim.port}  (MOAS_SERIAL_PORT={sim.port} python MoAS_Final_python_code.py)")
+    try:
+        sim.run(args.wafers)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.close()
+
+
+def cmd_load(args):
+    """시뮬레이터 -> 시리얼 파서 -> 상태 백엔드(outbox + 가짜 DB) [-> 깊이 캡처/아카이브] 처리량을 재는 함수"""
+    workdir = tempfile.mkdtemp(prefix='moas_load_')
+    database = FakeDatabase(delay=args.db_delay)
+    outbox = FirebaseOutbox(database.reference(), journal_path=os.path.join(workdir, 'outbox.db'))
+    state = FirebaseBackend(outbox, db=database)
+
+    source = service = archive = None
+    captured = threading.Semaphore(0)
+    if args.depth:
+        source = WaferDepthSource(real_time=True, seed=args.seed)
+        service = DepthCaptureService(source, capacity=30).start()
+        archive = DepthArchive(os.path.join(workdir, 'depth_archive'), mode='a')
+
+        def on_frame(trigger_time, frame_time, depth):
+            number = archive.append(depth, wafer_id=state.get('wafer_id', -1), intrinsics=source.intrinsics)
+            state.update({'trigger': 0, 'depth_ref': archive.ref(number)})
+            captured.release()
+        state.subscribe('trigger', service.trigger_listener(on_frame))
+
+    def on_wafer(seq, weight, good):
+        if source is not None:
+            source.set_wafer('normal' if good else 'broken')
+
+    sim = ArduinoSimulator(broken_rate=args.broken_rate, time_factor=args.time_factor, framed=not args.legacy,
+                           continuous=True, seed=args.seed, on_wafer=on_wafer)
+    ser = serial.Serial(sim.port, timeout=0.5)
+    parser = SerialRecordParser()
+
+    received = broken = 0
+    t0 = time.perf_counter()
+    sim.start(args.wafers)
+    while received < args.wafers:
+        data = ser.read(max(1, ser.in_waiting))
+        if not data:
+            break  # 시뮬레이터가 멈춤
+        for record in parser.feed(data):
+            # 브리지의 handle_record() 와 같은 방식으로 반영
+            fields = {key: record[key] for key in ('weight_state', 'wafer', 'accuracy') if key in record}
+            broken += fields.get('wafer') == 'broken'
+            if 'weight' in record:
+                received = outbox.begin_cycle(received + 1)
+                fields.update({'trigger': 1, 'weight': record['weight'], 'wafer_id': received,
+                               'trigger_time': time.monotonic()})
+            state.update(fields)
+            if 'weight' in record and service is not None:
+                # 카메라가 이전 트리거를 처리해야 다음 trigger=1 이 새 이벤트가 됨
+                captured.acquire(timeout=2.0)
+    parsed = time.perf_counter() - t0
+    outbox.flush(timeout=60)
+    elapsed = time.perf_counter() - t0
+
+    print(f"웨이퍼 {received}개 (파손 {broken}개), 누락 {parser.gaps}, CRC 오류 {parser.crc_errors}")
+    print(f"처리: {received / parsed * 60:.0f} wafers/min (파싱+상태 갱신 {parsed:.2f} s, DB 반영까지 {elapsed:.2f} s)")
+    print(f"DB 쓰기 {database.writes}회 (쓰기당 평균 {received / max(database.writes, 1):.1f} 웨이퍼)")
+    if sim.seq:
+        print(f"실제 장비 기준 사이클: {sim.sim_seconds / sim.seq:.1f} s/wafer "
+              f"({3600 * sim.seq / sim.sim_seconds:.0f} wafers/hour)")
+
+    sim.close()
+    ser.close()
+    if service is not None:
+        service.stop()
+        archive.close()
+    state.close()
+
+
+def cmd_cells(args):
+    """셀 수를 늘려 가며 multi_cell_bridge 의 셀당 처리량을 재는 함수 (가짜 DB, 연결 하나)"""
+    from multi_cell_bridge import run_cells
+    print(f"{'cells':>5}{'wafers':>8}{'per cell/min':>14}{'total/min':>11}{'db writes':>11}{'gaps':>6}")
+    for count in args.cells:
+        workdir = tempfile.mkdtemp(prefix='moas_cells_')
+        database = FakeDatabase(delay=args.db_delay)
+        outbox = FirebaseOutbox(database.reference(), journal_path=os.path.join(workdir, 'outbox.db'))
+        state = FirebaseBackend(outbox, db=database)
+        sims = [ArduinoSimulator(broken_rate=args.broken_rate, time_factor=args.time_factor, framed=not args.legacy,
+                                 continuous=True, seed=args.seed + i) for i in range(count)]
+        cells = [{'id': f'cell{i + 1}', 'port': sim.port} for i, sim in enumerate(sims)]
+
+        async def measure():
+            stop = asyncio.Event()
+            task = asyncio.ensure_future(run_cells(cells, state, outbox, stop=stop))
+            await asyncio.sleep(0.2)  # 포트 연결
+            t0 = time.perf_counter()
+            for sim in sims:
+                sim.start(args.wafers)
+            while any(sim.seq < args.wafers for sim in sims) and time.perf_counter() - t0 < args.timeout:
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(0.2)  # 마지막 바이트 처리
+            elapsed = time.perf_counter() - t0
+            stop.set()
+            return await task, elapsed
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            bridges, elapsed = asyncio.run(measure())
+            outbox.flush(timeout=60)
+        wafers = [bridge.wafers for bridge in bridges]
+        print(f"{count:5d}{sum(wafers):8d}{60 * min(wafers) / elapsed:14.0f}{60 * sum(wafers) / elapsed:11.0f}"
+              f"{database.writes:11d}{sum(bridge.parser.gaps for bridge in bridges):6d}")
+        for sim in sims:
+            sim.close()
+        state.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SCARA 셀 시뮬레이터')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def common(p, time_factor):
+        p.add_argument('--broken-rate', type=float, default=0.1)
+        p.add_argument('--time-factor', type=float, default=time_factor, help='단계별 대기 시간 배율 (0: 대기 없음)')
+        p.add_argument('--legacy', action='store_true', help='프레임 대신 기존 key:value 텍스트 전송')
+        p.add_argument('--seed', type=int, default=0)
+
+    p = sub.add_parser('arduino', help='pty 로 아두이노 출력을 흉내 냄')
+    common(p, 1.0)
+    p.add_argument('--wafers', type=int, help='이만큼 보내고 종료 (기본: 적재함이 찰 때까지)')
+    p.add_argument('--continuous', action='store_true', help='적재함이 차면 비우고 계속')
+    p.set_defaults(func=cmd_arduino)
+
+    p = sub.add_parser('load', help='한 프로세스 안에서 최대 처리량 측정')
+    common(p, 0.0)
+    p.add_argument('--wafers', type=int, default=1000)
+    p.add_argument('--db-delay', type=float, default=0.0, help='가짜 DB 쓰기 지연 (초)')
+    p.add_argument('--depth', action='store_true', help='트리거마다 깊이 프레임 캡처/아카이브 저장 포함')
+    p.set_defaults(func=cmd_load)
+
+    p = sub.add_parser('cells', help='여러 셀 브리지의 셀당 처리량 측정')
+    common(p, 0.01)
+    p.add_argument('--cells', type=int, nargs='+', default=[1, 2, 4, 8], help='시험할 셀 수')
+    p.add_argument('--wafers', type=int, default=100, help='셀당 웨이퍼 수')
+    p.add_argument('--db-delay', type=float, default=0.0, help='가짜 DB 쓰기 지연 (초)')
+    p.add_argument('--timeout', type=float, default=120.0)
+    p.set_defaults(func=cmd_cells)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
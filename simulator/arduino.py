@@ -0,0 +1,136 @@
+import os
+import random
+import threading
+import tty
+from serial_protocol import encode_frame
+# MoAS_Final_Arduino_code.ino 와 같은 설정 (브리지/GUI 도 쓰므로 wafer_config 에 둠)
+from wafer_config import (BROKEN_WAFER_POSITION, FLOOR_COUNT, MAX_WEIGHT, MIN_WEIGHT,
+                          NORMAL_WAFER_POSITION, STAGE_SECONDS)
+
+
+class ArduinoSimulator:
+    """아두이노 스케치의 상태 기계를 흉내 내 같은 시리얼 출력을 의사 터미널(pty)로 내보내는 클래스
+
+    port 경로를 실제 /dev/ttyACM0 대신 브리지에 넘기면 (MOAS_SERIAL_PORT) 하드웨어 없이
+    파이썬 쪽을 돌릴 수 있다. time_factor 는 단계별 대기 시간에 곱하는 값으로 1.0 이면
+    실제 속도, 0 이면 대기 없이 최대한 빨리 웨이퍼를 내보낸다.
+    """
+
+    def __init__(self, floor_count=FLOOR_COUNT, min_weight=MIN_WEIGHT, max_weight=MAX_WEIGHT, broken_rate=0.1,
+                 time_factor=1.0, framed=True, continuous=False, seed=0, on_wafer=None):
+        self.floor_count = floor_count
+        self.min_weight = min_weight
+        self.max_weight = max_weight
+        self.broken_rate = broken_rate
+        self.time_factor = time_factor
+        self.framed = framed
+        self.continuous = continuous  # 적재함이 차면 멈추는 대신 비우고 계속 (부하 시험용)
+        self.on_wafer = on_wafer      # on_wafer(seq, weight, good): 결과 전송 직전에 호출
+        self._rng = random.Random(seed)
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.seq = 0
+        self.normal_index = 0
+        self.broken_index = 0
+        self.current_floor = 1
+        self.sim_seconds = 0.0  # time_factor 와 무관하게 실제 속도 기준으로 누적한 사이클 시간
+
+    def _delay(self, stage, count=1):
+        seconds = STAGE_SECONDS[stage] * count
+        self.sim_seconds += seconds
+        if self.time_factor > 0:
+            self._stop.wait(seconds * self.time_factor)
+
+    def _weigh(self):
+        """파손 비율에 따라 정상(허용 범위 안) 또는 파손(범위 밖) 무게를 뽑는 함수"""
+        if self._rng.random() < self.broken_rate:
+            # 깨진 웨이퍼는 조각이 빠져 가벼움
+            return round(self._rng.uniform(self.min_weight * 0.5, self.min_weight - 0.5), 2)
+        center = (self.min_weight + self.max_weight) / 2
+        spread = (self.max_weight - self.min_weight) / 6
+        weight = self._rng.gauss(center, spread)
+        return round(min(max(weight, self.min_weight), self.max_weight), 2)
+
+    def _send(self, weight, good):
+        accuracy = 99.13 if good else 98.78
+        if self.framed:
+            data = encode_frame(self.seq, weight, good, accuracy)
+        else:
+            data = (f"weight:{weight:.2f}\r\nweight_state:{'good' if good else 'bad'}\r\n"
+                    f"wafer:{'normal' if good else 'broken'}\r\naccuracy:{accuracy:.2f}\r\n").encode()
+        os.write(self._master, data)
+        self.seq = (self.seq + 1) & 0xFFFF
+
+    def process_wafer(self):
+        """process_wafer() + set_next_floor() + move_to_target() 한 사이클을 수행하는 함수"""
+        self._delay('unknown_lack')
+        self._delay('step')
+        self._delay('gripper_up')
+        self._delay('weigh')
+
+        weight = self._weigh()
+        good = self.min_weight <= weight <= self.max_weight
+        if self.on_wafer is not None:
+            self.on_wafer(self.seq, weight, good)
+        self._send(weight, good)
+
+        self._delay('classify_wait')
+        self._delay('normal_lack' if good else 'broken_lack')
+        self._delay('settle')
+
+        if good:
+            target = NORMAL_WAFER_POSITION[self.normal_index]
+            self.normal_index += 1
+        else:
+            target = BROKEN_WAFER_POSITION[self.broken_index]
+            self.broken_index += 1
+        self._delay('floor_travel', abs(target - self.current_floor))
+        self._delay('stop_actuator')
+        self._delay('gripper_down')
+        # return_to_first_floor()
+        self._delay('floor_travel', target - 1)
+        self._delay('stop_actuator')
+        if not good:
+            self._delay('broken_return')
+        self.current_floor = 1
+        return weight, good
+
+    def full(self):
+        """check_floors_full(): 어느 한쪽 적재함이라도 가득 찼는지 확인하는 함수"""
+        return self.normal_index >= self.floor_count or self.broken_index >= self.floor_count
+
+    def run(self, max_wafers=None):
+        """적재함이 찰 때까지 (continuous 면 max_wafers 또는 stop() 까지) 웨이퍼를 처리하는 함수"""
+        count = 0
+        while not self._stop.is_set() and (max_wafers is None or count < max_wafers):
+            self.process_wafer()
+            count += 1
+            if self.full():
+                if not self.continuous:
+                    print("적재함이 가득 차서 시뮬레이터를 멈춥니다.")
+                    break
+                self.normal_index = self.broken_index = 0
+        return count
+
+    def start(self, max_wafers=None):
+        """백그라운드 스레드에서 run() 을 시작하는 함수"""
+        self._thread = threading.Thread(target=self.run, args=(max_wafers,), daemon=True)
+        self._thread.start()
+        return self
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stop(self):
+        self._stop.set()
+        self.join()
+
+    def close(self):
+        self.stop()
+        os.close(self._master)
+        os.close(self._slave)
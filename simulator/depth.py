@@ -0,0 +1,48 @@
+import random
+import numpy as np
+from capture_service import DEPTH_FPS, DEPTH_HEIGHT, DEPTH_WIDTH, SyntheticSource
+
+BACKGROUND_MM = 600
+WAFER_MM = 400
+
+
+class WaferDepthSource(SyntheticSource):
+    """정상/파손 웨이퍼를 번갈아 그려 주는 가짜 깊이 프레임 소스
+
+    set_wafer() 로 지금 놓인 웨이퍼를 바꾸며, 이후 read() 하는 프레임부터 반영된다.
+    파손 웨이퍼는 원판에서 부채꼴 조각이 빠지고 금이 간 모양이다.
+    """
+
+    def __init__(self, width=DEPTH_WIDTH, height=DEPTH_HEIGHT, fps=DEPTH_FPS, real_time=True, seed=0):
+        super().__init__(width, height, fps, real_time, seed)
+        self._rng = random.Random(seed)
+        yy, xx = np.mgrid[0:height, 0:width]
+        dx, dy = xx - width / 2, yy - height / 2
+        self._radius = np.hypot(dx, dy)
+        self._angle = np.arctan2(dy, dx)
+        self._disc_radius = min(width, height) * 0.35
+        self._frames = {'normal': self._render(broken=False), 'empty': self._render(empty=True)}
+        self._base = self._frames['normal']
+
+    def _render(self, broken=False, empty=False):
+        disc = self._radius < self._disc_radius
+        if broken:
+            # 임의 방향으로 40~90도 부채꼴 조각이 빠지고, 가장자리에서 중심 쪽으로 금이 감
+            start = self._rng.uniform(-np.pi, np.pi)
+            width = np.deg2rad(self._rng.uniform(40, 90))
+            missing = ((self._angle - start) % (2 * np.pi)) < width
+            crack_angle = start + np.pi + self._rng.uniform(-0.5, 0.5)
+            crack = (np.abs(np.sin(self._angle - crack_angle)) * self._radius < 3) & \
+                    (np.cos(self._angle - crack_angle) > 0) & (self._radius > self._disc_radius * 0.3)
+            disc &= ~missing & ~crack
+        if empty:
+            disc[:] = False
+        return np.where(disc, WAFER_MM, BACKGROUND_MM).astype(np.uint16)
+
+    def set_wafer(self, wafer):
+        """놓인 웨이퍼를 'normal', 'broken', 'empty' 중 하나로 바꾸는 함수"""
+        if wafer == 'broken':
+            # 파손 모양은 매번 다르게 그림
+            self._base = self._render(broken=True)
+        else:
+            self._base = self._frames[wafer]
@@ -0,0 +1,160 @@
+import copy
+import queue
+import threading
+import time
+
+
+def _split(path):
+    return [p for p in (path or '').split('/') if p]
+
+
+class Event:
+    """firebase_admin.db.Event 와 같은 속성(event_type, path, data)을 가진 이벤트"""
+
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class ListenerRegistration:
+    def __init__(self, database, entry):
+        self._database = database
+        self._entry = entry
+
+    def close(self):
+        self._database._remove_listener(self._entry)
+
+
+class FakeDbReference:
+    """firebase_admin.db.Reference 대신 쓰는 참조 (get/set/update/listen/child)"""
+
+    def __init__(self, database, path):
+        self._database = database
+        self.path = '/' + '/'.join(_split(path))
+
+    @property
+    def key(self):
+        parts = _split(self.path)
+        return parts[-1] if parts else None
+
+    def child(self, path):
+        return FakeDbReference(self._database, self.path.rstrip('/') + '/' + path)
+
+    def get(self):
+        return self._database._get(_split(self.path))
+
+    def set(self, value):
+        self._database._write(_split(self.path), {'': value})
+
+    def update(self, value):
+        """db.reference().update() 와 같이 'a/b' 형식의 다중 경로 키를 한 번에 반영하는 함수"""
+        if not value:
+            raise ValueError("빈 update 는 허용되지 않습니다.")
+        self._database._write(_split(self.path), value)
+
+    def listen(self, callback):
+        """처음에 현재 값 전체를, 이후에는 바뀐 부분을 별도 스레드에서 callback(Event) 로 전달하는 함수"""
+        return self._database._add_listener(_split(self.path), callback)
+
+
+class FakeDatabase:
+    """firebase_admin.db 모듈 대신 쓰는 프로세스 안의 가짜 Realtime Database
+
+    reference() 는 실제 모듈과 같은 방식으로 쓰면 되고, FirebaseOutbox 나
+    state_bus.FirebaseBackend(db=...) 에 그대로 넘길 수 있다. delay 와 fail_times 로
+    네트워크 지연과 일시적인 쓰기 실패를 흉내 낸다.
+    """
+
+    def __init__(self, delay=0.0, fail_times=0):
+        self.delay = delay
+        self.fail_times = fail_times
+        self.writes = 0
+        self._root = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._events = queue.Queue()
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def reference(self, path='/'):
+        return FakeDbReference(self, path)
+
+    def _node(self, parts, create=False):
+        node = self._root
+        for part in parts:
+            child = node.get(part) if isinstance(node, dict) else None
+            if child is None or (create and not isinstance(child, dict)):
+                if not create:
+                    return None
+                child = node[part] = {}
+            node = child
+        return node
+
+    def _get(self, parts):
+        with self._lock:
+            node = self._node(parts)
+            return copy.deepcopy(node) if node != {} else None
+
+    def _write(self, base, fields):
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise ConnectionError("가짜 네트워크 오류")
+            changed = []
+            for key, value in fields.items():
+                parts = base + _split(key)
+                self._assign(parts, copy.deepcopy(value))
+                changed.append(parts)
+            self.writes += 1
+            for parts, callback in self._listeners:
+                event = self._event_for(parts, changed)
+                if event is not None:
+                    self._events.put((callback, event))
+
+    def _assign(self, parts, value):
+        if not parts:
+            self._root = value if isinstance(value, dict) else {}
+            return
+        parent = self._node(parts[:-1], create=True)
+        if value is None:
+            parent.pop(parts[-1], None)
+        else:
+            parent[parts[-1]] = value
+
+    def _event_for(self, listen, changed):
+        """listen 경로에서 본 이벤트를 만드는 함수 (관련 없으면 None)"""
+        relevant = [p for p in changed if p[:len(listen)] == listen or listen[:len(p)] == p]
+        if not relevant:
+            return None
+        if any(len(p) <= len(listen) for p in relevant):
+            # listen 경로 자체나 그 상위가 바뀌면 전체 값을 다시 보냄
+            return Event('put', '/', copy.deepcopy(self._node(listen)))
+        return Event('patch', '/', {'/'.join(p[len(listen):]): copy.deepcopy(self._node(p)) for p in relevant})
+
+    def _add_listener(self, parts, callback):
+        entry = (parts, callback)
+        with self._lock:
+            self._listeners.append(entry)
+            node = self._node(parts)
+            self._events.put((callback, Event('put', '/', copy.deepcopy(node))))
+        return ListenerRegistration(self, entry)
+
+    def _remove_listener(self, entry):
+        with self._lock:
+            if entry in self._listeners:
+                self._listeners.remove(entry)
+
+    def _dispatch(self):
+        while True:
+            callback, event = self._events.get()
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"리스너 처리 중 오류: {e}")
+
+    def get(self):
+        """현재 전체 트리를 반환하는 함수"""
+        return self._get([])
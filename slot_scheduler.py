@@ -0,0 +1,195 @@
+"""적재함(카세트) 점유 상태를 관리하고 다음 적재 층 계획을 아두이노에 보내는 스케줄러
+
+스케치는 계획 프레임(serial_protocol.encode_plan)을 받으면 고정 카운터 대신 계획한 층 순서대로
+적재하고, 적재함이 가득 차면 멈추는 대신 다음 계획(적재함을 비운 뒤)을 기다린다. 계획에 붙는
+플래그로 Z 축 이동을 다른 동작과 겹칠 수 있다 (FLAG_EARLY_MOVE, FLAG_LAZY_RETURN).
+
+python slot_scheduler.py estimate --broken-rate 0.1 --wafers 2000 --unload 60   # 정책별 wafers/hour 비교
+"""
+import argparse
+import json
+import os
+import random
+import threading
+from serial_protocol import FLAG_EARLY_MOVE, FLAG_LAZY_RETURN, encode_plan
+from wafer_config import BROKEN_WAFER_POSITION, NORMAL_WAFER_POSITION, STAGE_SECONDS
+
+CASSETTE_PATH = os.environ.get('MOAS_CASSETTE', '/home/moas/cassette.json')  # 점유 상태 저장 파일
+PICK_FLOOR = 1  # 웨이퍼를 집는 층 (스케치 return_to_first_floor)
+BOOT_DELAY = 4.0  # 포트를 열어 아두이노가 재시작된 뒤 setup() 이 끝날 때까지 기다리는 시간 (초)
+
+# 정책 이름 -> (계획 프레임 전송 여부, 플래그)
+POLICIES = {
+    'fixed': (False, 0),                                     # 스케치 기본 동작 (카운터, 가득 차면 정지)
+    'planned': (True, 0),                                    # 점유 상태 기준 가장 낮은 빈 층부터
+    'early': (True, FLAG_EARLY_MOVE),
+    'lazy': (True, FLAG_LAZY_RETURN),
+    'overlap': (True, FLAG_EARLY_MOVE | FLAG_LAZY_RETURN),
+}
+KINDS = {'normal': NORMAL_WAFER_POSITION, 'broken': BROKEN_WAFER_POSITION}
+
+
+class SlotScheduler:
+    """정상/파손 적재함의 층별 점유 상태와 다음 적재 계획을 관리하는 클래스
+
+    빈 층은 낮은 층부터 채운다 (1층과의 왕복 거리가 가장 짧음). 시리얼 레코드가 올 때마다
+    on_wafer() 로 스케치와 같은 규칙으로 층을 배정해 점유 상태를 맞추고, 작업자가 적재함을
+    비우면 unload() 후 frame() 을 다시 보내면 된다. 계획 정책에서 path 를 주면 점유 상태를
+    파일에 남겨 브리지를 다시 시작해도 이어 간다 (fixed 는 스케치와 같이 매번 처음부터).
+    """
+
+    def __init__(self, policy='planned', path=CASSETTE_PATH):
+        if policy not in POLICIES:
+            raise ValueError(f"알 수 없는 적재 정책: {policy}")
+        self.policy = policy
+        self.send_plan, self.flags = POLICIES[policy]
+        # fixed 는 포트를 열 때마다 아두이노가 재시작해 스케치 카운터가 0 부터 다시 세므로 점유 상태를 남기지 않음
+        # (계획 정책은 점유 상태를 계획 프레임으로 다시 보내므로 저장한 상태를 이어 씀)
+        self.path = path if self.send_plan else None
+        self.occupied = {kind: set() for kind in KINDS}
+        self._lock = threading.Lock()
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as f:
+                saved = json.load(f)
+            self.occupied = {kind: set(saved.get(kind, [])) for kind in KINDS}
+
+    def plan(self):
+        """적재함별로 앞으로 채울 층 순서 {'normal': [...], 'broken': [...]}"""
+        with self._lock:
+            return {kind: sorted(set(floors) - self.occupied[kind]) for kind, floors in KINDS.items()}
+
+    def frame(self):
+        """현재 계획을 스케치로 보낼 프레임 (fixed 정책이면 None)"""
+        if not self.send_plan:
+            return None
+        plan = self.plan()
+        return encode_plan(plan['normal'], plan['broken'], self.flags)
+
+    def on_wafer(self, good):
+        """웨이퍼 한 장의 판정으로 적재할 층을 배정하고 반환하는 함수 (적재함이 가득 차면 None)"""
+        kind = 'normal' if good else 'broken'
+        with self._lock:
+            if self.send_plan:
+                free = sorted(set(KINDS[kind]) - self.occupied[kind])
+                floor = free[0] if free else None
+            else:
+                # 스케치 카운터: 이번 실행에서 채운 수만큼 순서대로
+                count = len(self.occupied[kind])
+                floor = KINDS[kind][count] if count < len(KINDS[kind]) else None
+            if floor is not None:
+                self.occupied[kind].add(floor)
+                self._save()
+        return floor
+
+    def full(self, kind):
+        with self._lock:
+            return not set(KINDS[kind]) - self.occupied[kind]
+
+    def unload(self, kind='all'):
+        """작업자가 적재함을 비웠을 때 점유 상태를 지우는 함수 (kind: normal, broken, all)"""
+        with self._lock:
+            for k in (KINDS if kind == 'all' else (kind,)):
+                self.occupied[k].clear()
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({kind: sorted(floors) for kind, floors in self.occupied.items()}, f)
+        os.replace(tmp, self.path)
+
+
+def estimate(policy, broken_rate=0.1, wafers=1000, unload_seconds=60.0, unload_both=True, seed=0,
+             stages=STAGE_SECONDS):
+    """정책별 사이클 시간을 스케치 단계 시간(STAGE_SECONDS)으로 계산하는 함수
+
+    실제 장비를 돌리지 않고 같은 웨이퍼 순서(seed)에 대해 정책을 비교하기 위한 값이며,
+    적재함 하나가 차면 unload_seconds 동안 작업자가 비운다고 본다. unload_both 면 두 적재함을 함께
+    비우고 (fixed 는 스케치가 멈춰 다시 시작해야 하므로 항상), 아니면 찬 적재함만 비운다.
+    결과는 dict 로 반환한다.
+    """
+    s = stages
+    scheduler = SlotScheduler(policy, path=None)
+    flags = scheduler.flags
+    rng = random.Random(seed)
+    pick_window = s['unknown_lack'] + s['step']   # 다음 웨이퍼의 팔 회전 + 스텝 동작 (Z 축 미사용)
+    total = travel_floors = unloads = 0.0
+    pending_return = None  # lazy: 아직 1층으로 돌아가지 않은 층
+    returned = 0.0         # lazy: 파손 팔 복귀 동안 이미 내려간 시간
+
+    for _ in range(wafers):
+        good = rng.random() >= broken_rate
+        kind = 'normal' if good else 'broken'
+        if pending_return is not None:
+            back = s['floor_travel'] * (pending_return - PICK_FLOOR) + s['stop_actuator']
+            total += max(0.0, back - returned - pick_window)
+            travel_floors += pending_return - PICK_FLOOR
+            pending_return, returned = None, 0.0
+        total += s['unknown_lack'] + s['step'] + s['gripper_up'] + s['weigh']
+
+        floor = scheduler.on_wafer(good)
+        if scheduler.full(kind):
+            # 마지막 칸을 채우면 작업자가 적재함을 비움 (fixed 는 스케치가 멈춰 다시 시작해야 함)
+            scheduler.unload('all' if unload_both or policy == 'fixed' else kind)
+            total += unload_seconds
+            unloads += 1
+
+        up = s['floor_travel'] * (floor - PICK_FLOOR)
+        if flags & FLAG_EARLY_MOVE:
+            up = max(0.0, up - s['classify_wait'])
+        total += s['classify_wait'] + s[f'{kind}_lack'] + s['settle'] + up + s['stop_actuator'] + s['gripper_down']
+        travel_floors += floor - PICK_FLOOR
+        if flags & FLAG_LAZY_RETURN:
+            pending_return = floor  # 복귀는 다음 웨이퍼의 팔 회전과 겹침
+            if not good:
+                # 파손 팔 복귀는 그대로 하되 도는 동안 Z 축도 내려감
+                total += s['broken_return']
+                returned = s['broken_return']
+        else:
+            total += s['floor_travel'] * (floor - PICK_FLOOR) + s['stop_actuator']
+            travel_floors += floor - PICK_FLOOR
+            if not good:
+                total += s['broken_return']
+
+    return {
+        'policy': policy,
+        'cycle_s': total / wafers,
+        'wafers_per_hour': 3600 * wafers / total,
+        'z_floors_per_wafer': travel_floors / wafers,
+        'unloads': int(unloads),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='적재 정책별 사이클 시간 추정')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('estimate', help='정책별 wafers/hour 비교')
+    p.add_argument('--policies', nargs='+', choices=list(POLICIES), default=list(POLICIES))
+    p.add_argument('--broken-rate', type=float, default=0.1)
+    p.add_argument('--wafers', type=int, default=2000)
+    p.add_argument('--unload', type=float, default=60.0, help='적재함을 비우는 데 걸리는 시간 (초)')
+    p.add_argument('--unload-full-only', action='store_true', help='찬 적재함만 비움 (기본: 둘 다 비움)')
+    p.add_argument('--seed', type=int, default=0)
+    p = sub.add_parser('plan', help='저장된 점유 상태와 다음 적재 계획 출력')
+    p.add_argument('--policy', choices=list(POLICIES), default='planned')
+    args = parser.parse_args(argv)
+
+    if args.command == 'plan':
+        scheduler = SlotScheduler(args.policy)
+        print(f"점유: {({k: sorted(v) for k, v in scheduler.occupied.items()})}")
+        print(f"계획: {scheduler.plan()}")
+        return
+
+    print(f"{'policy':<10}{'cycle s':>9}{'wafers/h':>10}{'Z floors':>10}{'unloads':>9}")
+    base = None
+    for policy in args.policies:
+        r = estimate(policy, args.broken_rate, args.wafers, args.unload, not args.unload_full_only, args.seed)
+        base = base or r['wafers_per_hour']
+        print(f"{policy:<10}{r['cycle_s']:9.1f}{r['wafers_per_hour']:10.1f}{r['z_floors_per_wafer']:10.2f}"
+              f"{r['unloads']:9d}  ({100 * (r['wafers_per_hour'] / base - 1):+.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
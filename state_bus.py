@@ -0,0 +1,478 @@
+import json
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+
+# 같은 장비에서 도는 스크립트들이 공유하는 상태 버스 설정
+DEFAULT_SOCKET_PATH = os.environ.get('MOAS_STATE_SOCKET', '/tmp/moas_state.sock')
+DEFAULT_BACKEND = os.environ.get('MOAS_STATE_BACKEND', 'firebase')  # local | local+firebase | firebase
+DEFAULT_CELL = os.environ.get('MOAS_CELL') or None  # 여러 셀을 한 장비에서 돌릴 때 이 스크립트가 맡은 셀 ID
+
+
+class StateBackend:
+    """get/set/subscribe 만 제공하는 상태 저장소 인터페이스"""
+
+    replays_on_subscribe = False  # 구독하면 현재 값 전체를 첫 이벤트로 다시 보내는지 (Firebase listen)
+
+    def get(self, key, default=None):
+        raise NotImplementedError
+
+    def update(self, fields):
+        raise NotImplementedError
+
+    def subscribe(self, key, callback):
+        """key 값이 바뀔 때마다 callback(key, value)를 호출하도록 등록 (key=None이면 전체)"""
+        raise NotImplementedError
+
+    def snapshot(self):
+        """전체 상태를 한 번에 dict 로 반환하는 함수"""
+        raise NotImplementedError
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def close(self):
+        pass
+
+
+class _Subscribers:
+    """구독 콜백 목록을 관리하고 변경 사항을 전달하는 도우미"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def add(self, key, callback):
+        with self._lock:
+            self._callbacks.append((key, callback))
+
+    def dispatch(self, fields):
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for key, value in fields.items():
+            for want, callback in callbacks:
+                if want is None or want == key:
+                    try:
+                        callback(key, value)
+                    except Exception as e:
+                        print(f"상태 구독 콜백 오류 ({key}): {e}")
+
+
+class StateBusServer:
+    """Unix 소켓으로 상태를 중계하는 브로커 (한 줄에 JSON 메시지 하나)
+
+    클라이언트가 접속하면 현재 전체 상태를 보내고, 이후 어느 클라이언트가 값을 바꾸면
+    모든 클라이언트에게 변경분을 그대로 방송한다. 클라이언트 소켓은 논블로킹이고 보낼 데이터는
+    클라이언트별 출력 버퍼에 쌓아 두었다가 쓸 수 있을 때 보내므로, 읽지 않는 클라이언트 하나가
+    브로커를 멈추지 않는다 (버퍼가 MAX_BACKLOG 를 넘으면 그 클라이언트를 끊음).
+    """
+
+    MAX_BACKLOG = 4 * 1024 * 1024  # 클라이언트 하나에 쌓아 둘 수 있는 미전송 바이트
+
+    def __init__(self, path=DEFAULT_SOCKET_PATH):
+        self.path = path
+        self.state = {}
+        self._clients = {}   # 소켓 -> 받은 데이터 버퍼
+        self._outbox = {}    # 소켓 -> 보낼 데이터 버퍼
+        self._selector = selectors.DefaultSelector()
+        self._running = False
+        self._loop_thread = None
+        self._shut = False
+
+        # close() 가 다른 스레드에서 select 를 바로 깨우는 데 쓰는 소켓 쌍
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+
+        if os.path.exists(path):
+            os.unlink(path)  # 이전 실행에서 남은 소켓 파일 정리
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        self._server.listen()
+        self._server.setblocking(False)
+        self._selector.register(self._server, selectors.EVENT_READ)
+
+    def start(self):
+        """브로커를 백그라운드 스레드에서 실행하는 함수"""
+        self._running = True
+        self._thread = self._loop_thread = threading.Thread(target=self.serve_forever, name='state-bus', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """접속과 메시지를 처리하는 브로커 루프 (끝나면 이 스레드에서 소켓을 모두 닫음)"""
+        self._running = True
+        self._loop_thread = threading.current_thread()
+        try:
+            while self._running:
+                for key, events in self._selector.select(timeout=0.5):
+                    if key.fileobj is self._wake_r:
+                        continue  # close() 가 루프를 깨움
+                    if key.fileobj is self._server:
+                        self._accept()
+                        continue
+                    if events & selectors.EVENT_READ and key.fileobj in self._clients:
+                        self._read(key.fileobj)
+                    if events & selectors.EVENT_WRITE and key.fileobj in self._clients:
+                        self._flush(key.fileobj)
+        finally:
+            self._shutdown()
+
+    def _accept(self):
+        try:
+            conn, _ = self._server.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        self._clients[conn] = bytearray()
+        self._outbox[conn] = bytearray()
+        self._selector.register(conn, selectors.EVENT_READ)
+        self._send(conn, {'op': 'set', 'fields': self.state})
+
+    def _read(self, conn):
+        try:
+            chunk = conn.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b''
+        if not chunk:
+            self._drop(conn)
+            return
+        buf = self._clients[conn]
+        buf.extend(chunk)
+        while conn in self._clients:
+            end = buf.find(b'\n')
+            if end < 0:
+                break
+            line = bytes(buf[:end])
+            del buf[:end + 1]
+            try:
+                message = json.loads(line)
+                if message.get('op') == 'set':
+                    self.state.update(message['fields'])
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                # 깨진 줄 하나로 브로커가 죽지 않도록 보낸 클라이언트만 끊음
+                print(f"상태 버스: 잘못된 메시지를 보낸 클라이언트 연결 끊음 ({e})")
+                self._drop(conn)
+                return
+            if message.get('op') == 'set':
+                for client in list(self._clients):
+                    self._send(client, message)
+
+    def _send(self, conn, message):
+        """메시지를 conn 의 출력 버퍼에 넣고 바로 보낼 수 있는 만큼 보내는 함수"""
+        out = self._outbox[conn]
+        was_empty = not out
+        out.extend(json.dumps(message).encode('utf-8') + b'\n')
+        if len(out) > self.MAX_BACKLOG:
+            print(f"상태 버스: 읽지 않는 클라이언트 연결 끊음 (미전송 {len(out)} 바이트)")
+            self._drop(conn)
+            return
+        if was_empty:
+            self._flush(conn)
+
+    def _flush(self, conn):
+        """출력 버퍼를 논블로킹으로 보내고, 남으면 EVENT_WRITE 를 걸어 다음에 이어 보내는 함수"""
+        out = self._outbox[conn]
+        try:
+            sent = conn.send(out)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._drop(conn)
+            return
+        del out[:sent]
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if out else 0)
+        if self._selector.get_key(conn).events != events:
+            self._selector.modify(conn, events)
+
+    def _drop(self, conn):
+        if conn in self._clients:
+            self._selector.unregister(conn)
+            del self._clients[conn]
+            del self._outbox[conn]
+            conn.close()
+
+    def close(self):
+        """브로커 루프에 종료를 알리고, 루프가 자기 소켓을 닫을 때까지 기다리는 함수"""
+        self._running = False
+        loop = self._loop_thread
+        if loop is not None and loop.is_alive() and loop is not threading.current_thread():
+            try:
+                self._wake_w.send(b'\0')
+            except OSError:
+                pass
+            loop.join()
+        else:
+            self._shutdown()  # 루프가 돌지 않았거나 이미 끝남
+
+    def _shutdown(self):
+        if self._shut:
+            return
+        self._shut = True
+        for conn in list(self._clients):
+            self._drop(conn)
+        self._selector.close()
+        self._server.close()
+        self._wake_r.close()
+        self._wake_w.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class LocalBackend(StateBackend):
+    """Unix 소켓 브로커를 통해 같은 장비의 프로세스끼리 상태를 주고받는 백엔드
+
+    모든 변경분을 받아 로컬 사본에 반영하므로 get()은 네트워크 왕복이 없고,
+    set()은 브로커를 거쳐 구독자에게 수백 마이크로초 안에 전달된다.
+    host=True이면 브로커를 이 프로세스 안에서 띄운다 (보통 시리얼 브리지).
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET_PATH, host=False, connect_timeout=10.0):
+        self.path = path
+        self.server = StateBusServer(path).start() if host else None
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._subscribers = _Subscribers()
+        self._closed = False
+        self._sock = self._connect(connect_timeout)
+        self._thread = threading.Thread(target=self._run, name='state-bus-client', daemon=True)
+        self._thread.start()
+
+    def _connect(self, timeout):
+        """브로커 소켓에 접속하는 함수 (브로커가 늦게 뜨는 경우 재시도)"""
+        deadline = time.monotonic() + timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+                return sock
+            except OSError:
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.1)
+
+    def _run(self):
+        """브로커가 보내는 변경분을 받아 사본에 반영하고 구독자에게 전달하는 루프"""
+        buf = bytearray()
+        while not self._closed:
+            try:
+                chunk = self._sock.recv(65536)
+            except OSError:
+                chunk = b''
+            if not chunk:
+                if self._closed:
+                    return
+                print("상태 버스 연결이 끊어졌습니다. 재접속을 시도합니다")
+                try:
+                    self._sock = self._connect(timeout=float('inf'))
+                except OSError:
+                    return
+                buf.clear()
+                continue
+            buf.extend(chunk)
+            while True:
+                end = buf.find(b'\n')
+                if end < 0:
+                    break
+                line = bytes(buf[:end])
+                del buf[:end + 1]
+                try:
+                    fields = json.loads(line)['fields']
+                    if not isinstance(fields, dict):
+                        raise ValueError(f"fields 가 dict 가 아님: {type(fields).__name__}")
+                except (ValueError, KeyError, TypeError) as e:
+                    # 깨진 줄 하나로 수신 스레드가 죽어 사본이 멈추지 않도록 그 줄만 건너뜀
+                    print(f"상태 버스: 잘못된 메시지를 건너뜀 ({e}): {line[:200]!r}")
+                    continue
+                with self._cache_lock:
+                    self._cache.update(fields)
+                self._subscribers.dispatch(fields)
+
+    def get(self, key, default=None):
+        with self._cache_lock:
+            return self._cache.get(key, default)
+
+    def snapshot(self):
+        with self._cache_lock:
+            return dict(self._cache)
+
+    def update(self, fields):
+        line = json.dumps({'op': 'set', 'fields': fields}).encode('utf-8') + b'\n'
+        with self._send_lock:
+            self._sock.sendall(line)
+
+    def subscribe(self, key, callback):
+        self._subscribers.add(key, callback)
+
+    def close(self):
+        self._closed = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        if self.server:
+            self.server.close()
+
+
+class FirebaseBackend(StateBackend):
+    """기존 Firebase Realtime Database를 그대로 쓰는 백엔드
+
+    outbox(FirebaseOutbox)를 주면 쓰기는 저널을 거쳐 비동기로 전송된다.
+    db 를 주면 firebase_admin.db 대신 그 객체를 쓴다 (simulator.FakeDatabase 등).
+    """
+
+    replays_on_subscribe = True
+
+    def __init__(self, outbox=None, db=None):
+        if db is None:
+            from firebase_admin import db
+        self._db = db
+        self.outbox = outbox
+        self._listeners = []
+
+    def get(self, key, default=None):
+        value = self._db.reference(key).get()
+        return default if value is None else value
+
+    def snapshot(self):
+        # 루트 하위 트리를 한 번의 요청으로 가져온다
+        return self._db.reference('/').get() or {}
+
+    def update(self, fields):
+        if self.outbox is not None:
+            self.outbox.put_many(fields)
+        else:
+            self._db.reference().update(fields)
+
+    def subscribe(self, key, callback):
+        def on_event(event):
+            # 최초 이벤트는 path='/'에 하위 전체 값이 담겨 온다
+            if key is not None:
+                callback(key, self._db.reference(key).get() if event.path != '/' else event.data)
+            elif event.path == '/':
+                for k, v in (event.data or {}).items():
+                    callback(k, v)
+            else:
+                # 'cells/<id>/trigger' 처럼 중첩된 경로는 전체 경로를 키로 전달 (로컬 버스와 같은 형식)
+                callback(event.path.strip('/'), event.data)
+        self._listeners.append(self._db.reference(key or '/').listen(on_event))
+
+    def close(self):
+        for listener in self._listeners:
+            listener.close()
+        if self.outbox is not None:
+            self.outbox.close()
+
+
+class MirroredBackend(StateBackend):
+    """로컬 버스를 기준으로 쓰고, 같은 값을 Firebase outbox로 비동기 미러링하는 백엔드"""
+
+    def __init__(self, primary, outbox):
+        self.primary = primary
+        self.outbox = outbox
+
+    @property
+    def replays_on_subscribe(self):
+        return self.primary.replays_on_subscribe
+
+    def get(self, key, default=None):
+        return self.primary.get(key, default)
+
+    def snapshot(self):
+        return self.primary.snapshot()
+
+    def update(self, fields):
+        self.primary.update(fields)
+        self.outbox.put_many(fields)
+
+    def subscribe(self, key, callback):
+        self.primary.subscribe(key, callback)
+
+    def close(self):
+        self.primary.close()
+        self.outbox.close()
+
+
+class ScopedBackend(StateBackend):
+    """모든 키 앞에 'cells/<id>/' 같은 접두어를 붙여 셀 하나의 상태만 보이게 하는 백엔드
+
+    로컬 버스에서는 'cells/cell1/trigger' 가 그대로 하나의 키이고, Firebase 에서는 같은 문자열이
+    중첩 경로가 되므로 두 백엔드 모두 같은 이름으로 읽고 쓴다.
+    """
+
+    def __init__(self, inner, prefix):
+        self.inner = inner
+        self.prefix = prefix.strip('/') + '/'
+
+    @property
+    def replays_on_subscribe(self):
+        return self.inner.replays_on_subscribe
+
+    def _unscope(self, key, value):
+        """안쪽 백엔드의 (키, 값) 을 이 셀 기준의 {키: 값} 으로 바꾸는 함수 (관계없는 키면 빈 dict)"""
+        if key.startswith(self.prefix):
+            return {key[len(self.prefix):]: value}
+        if isinstance(value, dict) and (key == '' or self.prefix.startswith(key.strip('/') + '/')):
+            # 상위 경로의 하위 트리가 통째로 온 경우 (Firebase 최초 이벤트 등)
+            rest = self.prefix[len(key.strip('/')) + 1:] if key.strip('/') else self.prefix
+            for part in rest.strip('/').split('/'):
+                value = value.get(part) if isinstance(value, dict) else None
+            return dict(value) if isinstance(value, dict) else {}
+        return {}
+
+    def get(self, key, default=None):
+        return self.inner.get(self.prefix + key, default)
+
+    def snapshot(self):
+        fields = {}
+        for key, value in self.inner.snapshot().items():
+            fields.update(self._unscope(key, value))
+        return fields
+
+    def update(self, fields):
+        self.inner.update({self.prefix + key: value for key, value in fields.items()})
+
+    def subscribe(self, key, callback):
+        if key is not None:
+            self.inner.subscribe(self.prefix + key, lambda k, value: callback(key, value))
+            return
+
+        def on_change(k, value):
+            for sub_key, sub_value in self._unscope(k, value).items():
+                callback(sub_key, sub_value)
+        self.inner.subscribe(None, on_change)
+
+    def close(self):
+        self.inner.close()
+
+
+def open_backend(name=None, outbox=None, host=False, path=DEFAULT_SOCKET_PATH, cell=DEFAULT_CELL):
+    """이름(local, local+firebase, firebase)에 맞는 상태 백엔드를 만드는 함수
+
+    이름을 주지 않으면 MOAS_STATE_BACKEND 환경 변수를 따르므로 스크립트마다 따로 고를 수 있다.
+    cell(기본: MOAS_CELL) 을 주면 'cells/<cell>/...' 아래의 상태만 읽고 쓴다.
+    """
+    if cell:
+        return ScopedBackend(open_backend(name, outbox, host, path, cell=None), f'cells/{cell}')
+    name = name or DEFAULT_BACKEND
+    if name == 'firebase':
+        return FirebaseBackend(outbox)
+    if name == 'local':
+        return LocalBackend(path, host=host)
+    if name == 'local+firebase':
+        if outbox is None:
+            from firebase_admin import db
+            from firebase_outbox import FirebaseOutbox
+            # 프로세스(스크립트)마다 저널을 따로 두어 같은 항목을 중복 전송하지 않게 함
+            script = os.path.splitext(os.path.basename(sys.argv[0]))[0] or 'moas'
+            outbox = FirebaseOutbox(db.reference(), journal_path=f'/home/moas/firebase_mirror_{script}.db')
+        return MirroredBackend(LocalBackend(path, host=host), outbox)
+    raise ValueError(f"알 수 없는 상태 백엔드: {name}")
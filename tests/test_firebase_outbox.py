@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""FirebaseOutbox 재시도/백오프, 재시작 복구, 종료 동작 테스트 (python -m pytest -q)"""
+import os
+import tempfile
+import threading
+import time
+import unittest
+from firebase_outbox import FakeReference, FirebaseOutbox
+
+
+class FirebaseOutboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.journal = os.path.join(self._tmp.name, 'outbox.db')
+        self.errors = []
+        self._excepthook = threading.excepthook
+        threading.excepthook = lambda args: self.errors.append(args.exc_value)
+
+    def tearDown(self):
+        threading.excepthook = self._excepthook
+        self._tmp.cleanup()
+
+    def test_retries_with_backoff_until_update_succeeds(self):
+        ref = FakeReference(fail_times=3)
+        outbox = FirebaseOutbox(ref, self.journal, linger=0.0, base_backoff=0.05, max_backoff=1.0)
+        t0 = time.monotonic()
+        outbox.put_many({'weight': 32.5, 'wafer': 'normal'})
+        self.assertTrue(outbox.flush(timeout=5))
+        elapsed = time.monotonic() - t0
+        outbox.close()
+
+        # 0.05 + 0.1 + 0.2 초를 기다린 뒤 네 번째 시도에서 한 번에 전송
+        self.assertGreaterEqual(elapsed, 0.35)
+        self.assertEqual(ref.updates, [{'weight': 32.5, 'wafer': 'normal'}])
+        self.assertEqual(outbox.pending(), 0)
+
+    def test_backoff_is_capped(self):
+        ref = FakeReference(fail_times=4)
+        outbox = FirebaseOutbox(ref, self.journal, linger=0.0, base_backoff=0.05, max_backoff=0.05)
+        t0 = time.monotonic()
+        outbox.put('trigger', 1)
+        self.assertTrue(outbox.flush(timeout=5))
+        outbox.close()
+        self.assertLess(time.monotonic() - t0, 0.05 * 4 + 1.0)
+        self.assertEqual(ref.data, {'trigger': 1})
+
+    def test_unsent_items_survive_restart(self):
+        down = FakeReference(fail_times=10 ** 6)
+        outbox = FirebaseOutbox(down, self.journal, linger=0.0, base_backoff=10.0)
+        outbox.begin_cycle(7)
+        outbox.put_many({'weight': 31.0, 'wafer_id': 7})
+        outbox.begin_cycle(8)
+        outbox.put_many({'weight': 33.0, 'wafer_id': 8})
+        self.assertFalse(outbox.flush(timeout=0.1))
+        outbox.close(timeout=0.1)
+        self.assertEqual(down.updates, [])
+
+        up = FakeReference()
+        flushed = []
+        restarted = FirebaseOutbox(up, self.journal, linger=0.0, on_flush=lambda cycles, *_: flushed.append(cycles))
+        self.assertEqual(restarted.cycle, 8)  # 사이클 번호를 이어받음
+        self.assertTrue(restarted.flush(timeout=5))
+        restarted.close()
+
+        # 밀린 사이클은 한 배치로 합쳐지고 같은 경로는 마지막 값이 남음
+        self.assertEqual(up.data, {'weight': 33.0, 'wafer_id': 8})
+        self.assertEqual(flushed, [{7, 8}])
+
+    def test_close_leaves_journal_open_while_update_in_flight(self):
+        ref = FakeReference(delay=0.3)
+        outbox = FirebaseOutbox(ref, self.journal, linger=0.0)
+        outbox.put('wafer', 'broken')
+        time.sleep(0.05)  # 전송 스레드가 update() 안에 들어갈 때까지
+        outbox.close(timeout=0.05)
+        outbox._thread.join(2)
+
+        self.assertFalse(outbox._thread.is_alive())
+        self.assertEqual(self.errors, [])
+        self.assertEqual(outbox.pending(), 0)
+        self.assertEqual(ref.data, {'wafer': 'broken'})
+
+
+if __name__ == '__main__':
+    unittest.main()
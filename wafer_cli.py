@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""웨이퍼 분류 명령줄 도구 (train / train-head / predict / serve / export / report)
+
+무거운 라이브러리(TensorFlow, watchdog, Firebase)는 각 명령 안에서만 불러오므로
+predict/serve 는 학습용 코드나 Google Drive 마운트 없이 저장된 모델에서 바로 시작한다.
+"""
+import argparse
+import contextlib
+import time
+from wafer_config import BACKENDS, MODEL_PATH, CAPTURE_DIR, CRED_PATH, DATABASE_URL, TRAIN_DIR, SAVE_PATH, EXPORT_DIR, FEATURE_CACHE_DIR
+
+
+class PhaseTimer:
+    """시작 단계별 소요 시간을 재고 보고하는 클래스"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - t0))
+
+    def report(self):
+        """단계별 시간과 전체 시작 시간을 출력하는 함수"""
+        for name, seconds in self.phases:
+            print(f"  {name:<24} {seconds:7.2f} s")
+        print(f"  {'합계':<24} {time.perf_counter() - self.start:7.2f} s")
+
+
+def init_firebase(cred_path):
+    """Firebase Admin SDK를 초기화하는 함수 (Firestore 와 상태 저장소용 Realtime Database)"""
+    import firebase_admin
+    from firebase_admin import credentials
+    firebase_admin.initialize_app(credentials.Certificate(cred_path), {'databaseURL': DATABASE_URL})
+
+
+def cmd_train(args):
+    if args.colab:
+        # Google Drive 마운트 (Colab 환경에서 사용)
+        from google.colab import drive
+        drive.mount('/content/gdrive')
+    import wafer_training
+    wafer_training.train(args.train_dir, args.save_path, args.epochs, args.batch_size, args.pipeline, args.cache)
+
+
+def cmd_train_head(args):
+    if args.colab:
+        from google.colab import drive
+        drive.mount('/content/gdrive')
+    import wafer_features
+    wafer_features.train_head(args.train_dir, args.save_path, args.cache_dir, args.augment, args.epochs,
+                              args.batch_size, args.fine_tune_epochs)
+
+
+def cmd_predict(args):
+    timer = PhaseTimer()
+    with timer.phase('import tensorflow'):
+        import wafer_inference
+    with timer.phase('load model + trace'):
+        predict_fn = wafer_inference.load_predict_fn(args.model, args.backend)
+    if args.firebase:
+        with timer.phase('init firebase'):
+            init_firebase(args.cred)
+
+    for i, image_path in enumerate(args.images):
+        with timer.phase('first prediction' if i == 0 else 'prediction'):
+            img = wafer_inference.load_image(image_path, predict_fn.input_size)
+            probs = wafer_inference.predict_batch(predict_fn, img[None])[0]
+            pred_str, probability = wafer_inference.format_prediction(probs)
+        print(f"Predicted: {pred_str}, Accuracy: {probability}% ({image_path})")
+        if i == 0:
+            print("첫 예측까지 걸린 시간:")
+            timer.report()
+        if args.firebase:
+            wafer_inference.update_firebase(image_path, pred_str, probability)
+
+
+def cmd_serve(args):
+    timer = PhaseTimer()
+    with timer.phase('import tensorflow'):
+        import wafer_inference
+    with timer.phase('load model + trace'):
+        predict_fn = wafer_inference.load_predict_fn(args.model, args.backend, args.roi)
+    with timer.phase('init firebase'):
+        init_firebase(args.cred)
+    print("서비스 시작 준비 시간:")
+    timer.report()
+    if args.handoff:
+        wafer_inference.serve_handoff(args.model, args.max_batch, args.max_wait_ms / 1000.0, predict_fn=predict_fn)
+    else:
+        wafer_inference.serve(args.model, args.watch_dir, args.max_batch, args.max_wait_ms / 1000.0,
+                              predict_fn=predict_fn)
+
+
+def cmd_export(args):
+    import wafer_export
+    paths = wafer_export.export_all(args.model, args.out_dir, args.train_dir)
+    if args.report:
+        wafer_export.report(args.model, paths, args.train_dir, args.json)
+
+
+def cmd_report(args):
+    import wafer_export
+    exports = dict(item.split('=', 1) for item in args.exports)
+    wafer_export.report(args.model, exports, args.train_dir, args.json)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='웨이퍼 분류 모델 학습/예측/서비스')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('train', help='모델 학습 후 저장')
+    p.add_argument('--train-dir', default=TRAIN_DIR)
+    p.add_argument('--save-path', default=SAVE_PATH)
+    p.add_argument('--epochs', type=int, default=15)
+    p.add_argument('--batch-size', type=int, default=64)
+    p.add_argument('--pipeline', choices=('tfdata', 'keras'), default='tfdata', help='입력 파이프라인')
+    p.add_argument('--cache', default='', help='디코딩 결과 디스크 캐시 경로 (기본: 메모리)')
+    p.add_argument('--colab', action='store_true', help='Google Drive 마운트')
+    p.set_defaults(func=cmd_train)
+
+    p = sub.add_parser('train-head', help='백본 특징 캐시로 헤드만 빠르게 학습 후 저장')
+    p.add_argument('--train-dir', default=TRAIN_DIR)
+    p.add_argument('--save-path', default=SAVE_PATH)
+    p.add_argument('--cache-dir', default=FEATURE_CACHE_DIR, help='특징 맵 캐시 디렉터리 (새 이미지만 계산)')
+    p.add_argument('--augment', type=int, default=0, help='이미지마다 캐시해 둘 증강 특징 수')
+    p.add_argument('--epochs', type=int, default=30)
+    p.add_argument('--batch-size', type=int, default=64)
+    p.add_argument('--fine-tune-epochs', type=int, default=0, help='헤드 학습 뒤 백본 뒤쪽 미세 조정 에폭')
+    p.add_argument('--colab', action='store_true', help='Google Drive 마운트')
+    p.set_defaults(func=cmd_train_head)
+
+    p = sub.add_parser('predict', help='저장된 모델로 이미지 분류')
+    p.add_argument('images', nargs='+')
+    p.add_argument('--model', default=MODEL_PATH)
+    p.add_argument('--backend', choices=BACKENDS, default='keras')
+    p.add_argument('--firebase', action='store_true', help='결과를 Firestore에 기록')
+    p.add_argument('--cred', default=CRED_PATH)
+    p.set_defaults(func=cmd_predict)
+
+    p = sub.add_parser('serve', help='캡처 디렉터리를 감시하는 상주 분류 서비스')
+    p.add_argument('--model', default=MODEL_PATH)
+    p.add_argument('--backend', choices=BACKENDS, default='keras')
+    p.add_argument('--watch-dir', default=CAPTURE_DIR)
+    p.add_argument('--cred', default=CRED_PATH)
+    p.add_argument('--max-batch', type=int, default=16)
+    p.add_argument('--max-wait-ms', type=float, default=10.0)
+    p.add_argument('--handoff', action='store_true', help='캡처 디렉터리 대신 카메라 공유 메모리에서 프레임 수신')
+    p.add_argument('--roi', action='store_true', help='wafer_roi.py 로 크롭 학습한 모델 (--handoff 전용)')
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser('export', help='float16/int8 TFLite 및 ONNX 모델 내보내기')
+    p.add_argument('--model', default=MODEL_PATH)
+    p.add_argument('--train-dir', default=TRAIN_DIR, help='int8 보정용 대표 데이터')
+    p.add_argument('--out-dir', default=EXPORT_DIR)
+    p.add_argument('--report', action='store_true', help='내보낸 뒤 비교 보고서 출력')
+    p.add_argument('--json', help='보고서 JSON 저장 경로')
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser('report', help='백엔드별 지연 시간/메모리/정확도 비교')
+    p.add_argument('exports', nargs='*', help='이름=경로 (예: tflite-int8=wafer_int8.tflite, onnx=wafer.onnx)')
+    p.add_argument('--model', default=MODEL_PATH)
+    p.add_argument('--train-dir', default=TRAIN_DIR)
+    p.add_argument('--json', help='보고서 JSON 저장 경로')
+    p.set_defaults(func=cmd_report)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
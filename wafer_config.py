@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""웨이퍼 분류 관련 공통 설정 (무거운 라이브러리 없이 불러올 수 있음)"""
+import os
+
+IMG_WIDTH = 224
+IMG_HEIGHT = 224
+INPUT_SIZES = (96, 160, 224)  # ROI 크롭 모델 입력 해상도 후보 (MobileNetV2 ImageNet 가중치가 있는 크기)
+CELL = os.environ.get('MOAS_CELL') or None  # 여러 셀을 한 장비에서 돌릴 때 이 프로세스가 맡은 셀 (state_bus.DEFAULT_CELL 과 같음)
+
+
+def per_cell(name, cell=CELL):
+    """셀마다 따로 써야 하는 경로/공유 메모리 이름에 '_<셀>' 을 붙이는 함수 (셀이 없으면 그대로)"""
+    if not cell:
+        return name
+    trailing = '/' if name.endswith('/') else ''
+    return f"{name.rstrip('/')}_{cell}{trailing}"
+
+CLASS_NAMES = ['broken', 'normal']
+BACKENDS = ('keras', 'tflite', 'onnx')  # 추론 백엔드
+
+# 엣지 장비 경로
+MODEL_PATH = '/home/moas/google-drive/dataset/saved_model.keras'
+CAPTURE_DIR = per_cell('/home/moas/google-drive/test_image_files/')   # 셀마다 따로 (MOAS_CELL)
+DEPTH_ARCHIVE_DIR = per_cell('/home/moas/google-drive/depth_archive')
+CRED_PATH = '/home/moas/google-drive/moas-45385-firebase-adminsdk-rzp7k-d54fbd59b5.json'
+DATABASE_URL = 'https://moas-45385-default-rtdb.asia-southeast1.firebasedatabase.app/'  # 상태 저장소 (Realtime Database)
+EXPORT_DIR = '/home/moas/google-drive/dataset/export'
+PRESCREEN_PATH = '/home/moas/google-drive/dataset/prescreen.json'  # 깊이 사전 검사 임계값
+
+# MoAS_Final_Arduino_code.ino 와 같은 설정 (슬롯 스케줄러, 통계 패널, 시뮬레이터가 함께 씀)
+FLOOR_COUNT = 7
+MIN_WEIGHT = 30   # 정상 무게 범위 (g)
+MAX_WEIGHT = 35
+NORMAL_WAFER_POSITION = (2, 3, 4, 5, 6, 7, 8)
+BROKEN_WAFER_POSITION = (2, 3, 4, 5, 6, 7, 8)
+
+# 스케치의 delay() 값을 단계별로 합친 시간 (초)
+STAGE_SECONDS = {
+    'unknown_lack': 1.9,
+    'step': 6400 * 200e-6,                      # Step(): 펄스 6400개 x 200 us
+    'gripper_up': 4.7 + 1.2 + 4.8 + 1.6 + 0.2,  # gripper_UP()
+    'weigh': 1.0,                               # scale.get_units(10), HX711 10 Hz
+    'classify_wait': 4.0,
+    'normal_lack': 1.9,
+    'broken_lack': 1.9 + 2.0,
+    'settle': 1.0,
+    'floor_travel': 1.0,                        # 층 하나 이동 (실측값 아님, 추정)
+    'stop_actuator': 0.2,
+    'gripper_down': 4.3 + 0.7 + 4.4 + 0.5,      # gripper_DOWN() + delay(500)
+    'broken_return': 2.0,
+}
+
+# 학습 경로 (Colab 기준)
+TRAIN_DIR = '/content/gdrive/MyDrive/dataset/wafer_image/train'
+SAVE_PATH = '/content/gdrive/MyDrive/dataset/saved_model.keras'
+TRAIN_DEPTH_DIR = '/content/gdrive/MyDrive/dataset/wafer_depth/train'  # 클래스별 깊이 아카이브
+FEATURE_CACHE_DIR = '/content/gdrive/MyDrive/dataset/feature_cache'     # 백본 특징 맵 캐시
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import math
+import os
+import time
+import tensorflow as tf
+from wafer_config import CLASS_NAMES, IMG_HEIGHT, IMG_WIDTH, TRAIN_DIR
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+AUTOTUNE = tf.data.AUTOTUNE
+
+# 기존 ImageDataGenerator 와 같은 증강 설정
+ROTATION_RANGE = 20       # 도
+SHIFT_RANGE = 0.2         # 가로/세로 크기 대비 비율
+SHEAR_RANGE = 0.2         # 도 (Keras 의 shear_range 단위)
+ZOOM_RANGE = 0.2          # [1 - 0.2, 1 + 0.2], 가로/세로 각각
+VALIDATION_SPLIT = 0.15
+
+
+def list_split(train_dir=TRAIN_DIR, validation_split=VALIDATION_SPLIT):
+    """ImageDataGenerator(validation_split)와 같은 방식으로 (학습, 검증) 파일 목록을 나누는 함수
+
+    클래스 폴더마다 파일 이름순으로 정렬해 앞쪽 validation_split 비율을 검증용으로 쓰므로
+    실행할 때마다 같은 분할이 나온다. 반환값은 (경로, 라벨) 목록 두 개이며
+    라벨은 CLASS_NAMES 순서의 번호다.
+    """
+    training, validation = [], []
+    for label, class_name in enumerate(CLASS_NAMES):
+        class_dir = os.path.join(train_dir, class_name)
+        files = sorted(f for f in os.listdir(class_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+        stop = int(validation_split * len(files))
+        validation += [(os.path.join(class_dir, f), label) for f in files[:stop]]
+        training += [(os.path.join(class_dir, f), label) for f in files[stop:]]
+    return training, validation
+
+
+def decode_image(path, label):
+    """이미지 파일을 디코딩해 224x224, 0~1 범위 float32 로 바꾸는 함수"""
+    img = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    img = tf.image.resize(img, [IMG_HEIGHT, IMG_WIDTH])
+    return img / 255.0, label
+
+
+def random_affine(images):
+    """배치 전체에 이미지마다 다른 회전/이동/전단/확대 변환을 한 번의 그래프 연산으로 적용하는 함수"""
+    n = tf.shape(images)[0]
+    h = tf.cast(tf.shape(images)[1], tf.float32)
+    w = tf.cast(tf.shape(images)[2], tf.float32)
+
+    theta = tf.random.uniform([n], -ROTATION_RANGE, ROTATION_RANGE) * math.pi / 180
+    tx = tf.random.uniform([n], -SHIFT_RANGE, SHIFT_RANGE) * w
+    ty = tf.random.uniform([n], -SHIFT_RANGE, SHIFT_RANGE) * h
+    shear = tf.random.uniform([n], -SHEAR_RANGE, SHEAR_RANGE) * math.pi / 180
+    zx = tf.random.uniform([n], 1 - ZOOM_RANGE, 1 + ZOOM_RANGE)
+    zy = tf.random.uniform([n], 1 - ZOOM_RANGE, 1 + ZOOM_RANGE)
+
+    # 출력 좌표 -> 입력 좌표 행렬: 회전 @ 전단 @ 확대 (ImageDataGenerator 와 같은 순서)
+    cos, sin = tf.cos(theta), tf.sin(theta)
+    a0 = cos * zx
+    a1 = (-cos * tf.sin(shear) - sin * tf.cos(shear)) * zy
+    b0 = sin * zx
+    b1 = (-sin * tf.sin(shear) + cos * tf.cos(shear)) * zy
+    # 이미지 중심 기준으로 변환한 뒤 이동량 추가
+    cx, cy = (w - 1) / 2, (h - 1) / 2
+    a2 = cx - a0 * cx - a1 * cy + tx
+    b2 = cy - b0 * cx - b1 * cy + ty
+    zeros = tf.zeros([n])
+    transforms = tf.stack([a0, a1, a2, b0, b1, b2, zeros, zeros], axis=1)
+
+    return tf.raw_ops.ImageProjectiveTransformV3(
+        images=images,
+        transforms=transforms,
+        output_shape=tf.shape(images)[1:3],
+        fill_value=0.0,
+        interpolation='BILINEAR',
+        fill_mode='NEAREST',
+    )
+
+
+def make_datasets(train_dir=TRAIN_DIR, batch_size=64, cache='', seed=0):
+    """tf.data 학습/검증 데이터셋과 각 이미지 수를 만드는 함수
+
+    디코딩과 리사이즈는 병렬로 한 번만 수행해 cache 에 보관하고 (cache 가 빈 문자열이면
+    메모리, 경로면 디스크), 증강은 배치 단위로 그래프 안에서 수행한 뒤 prefetch 한다.
+    """
+    training, validation = list_split(train_dir)
+
+    def base(items, cache_suffix):
+        paths = tf.constant([p for p, _ in items])
+        labels = tf.constant([label for _, label in items], dtype=tf.int32)
+        ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+        ds = ds.map(decode_image, num_parallel_calls=AUTOTUNE, deterministic=True)
+        return ds.cache(cache + cache_suffix if cache else '')
+
+    train_ds = (base(training, '.train')
+                .shuffle(len(training), seed=seed, reshuffle_each_iteration=True)
+                .batch(batch_size)
+                .map(lambda x, y: (random_affine(x), y), num_parallel_calls=AUTOTUNE)
+                .prefetch(AUTOTUNE))
+    val_ds = base(validation, '.val').batch(batch_size).prefetch(AUTOTUNE)
+    return train_ds, val_ds, len(training), len(validation)
+
+
+class ThroughputCallback(tf.keras.callbacks.Callback):
+    """에폭마다 초당 학습 이미지 수를 출력하는 콜백"""
+
+    def __init__(self, num_images):
+        super().__init__()
+        self.num_images = num_images
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.t0 = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self.t0
+        print(f"\n에폭 {epoch + 1}: {self.num_images / seconds:.1f} images/sec ({seconds:.1f} s)")
+
+
+def measure_input_rate(ds, batches=20):
+    """모델 없이 입력 파이프라인만 돌려 초당 이미지 수를 재는 함수 (입력 병목 확인용)"""
+    count = 0
+    t0 = time.perf_counter()
+    for images, _ in ds.take(batches):
+        count += int(images.shape[0])
+    rate = count / (time.perf_counter() - t0)
+    print(f"입력 파이프라인 단독: {rate:.1f} images/sec")
+    return rate
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import random
+import time
+import numpy as np
+import tensorflow as tf
+from wafer_config import EXPORT_DIR, IMG_WIDTH, MODEL_PATH, TRAIN_DIR
+from wafer_dataset import list_split
+from wafer_inference import load_image, load_predict_fn, predict_batch
+
+
+def representative_dataset(train_dir=TRAIN_DIR, count=200, seed=0, size=IMG_WIDTH):
+    """int8 양자화 보정에 쓸 대표 입력 (size x size) 을 학습 데이터에서 무작위로 뽑는 생성기를 만드는 함수"""
+    training, _ = list_split(train_dir)
+    samples = random.Random(seed).sample(training, min(count, len(training)))
+
+    def generate():
+        for path, _ in samples:
+            yield [load_image(path, size)[None].astype(np.float32)]
+    return generate
+
+
+def export_tflite(model, out_dir=EXPORT_DIR, train_dir=TRAIN_DIR, kinds=('float16', 'int8')):
+    """Keras 모델을 학습 후 양자화(float16, int8)한 TFLite 파일로 내보내는 함수"""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for kind in kinds:
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if kind == 'float16':
+            converter.target_spec.supported_types = [tf.float16]
+        elif kind == 'int8':
+            # 가중치와 활성값 모두 int8, 입출력은 기존과 같이 float32 유지
+            converter.representative_dataset = representative_dataset(train_dir, size=model.input_shape[1])
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        else:
+            raise ValueError(f"알 수 없는 양자화 종류: {kind}")
+        path = os.path.join(out_dir, f'wafer_{kind}.tflite')
+        with open(path, 'wb') as f:
+            f.write(converter.convert())
+        print(f"TFLite 모델 저장 완료: {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+        paths[f'tflite-{kind}'] = path
+    return paths
+
+
+def export_onnx(model, out_dir=EXPORT_DIR):
+    """Keras 모델을 ONNX 파일로 내보내는 함수 (tf2onnx 가 없으면 건너뜀)"""
+    try:
+        import tf2onnx
+    except ImportError:
+        print("tf2onnx 가 설치되어 있지 않아 ONNX 내보내기를 건너뜁니다.")
+        return {}
+    path = os.path.join(out_dir, 'wafer.onnx')
+    spec = (tf.TensorSpec([None] + list(model.input_shape[1:]), tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=13, output_path=path)
+    print(f"ONNX 모델 저장 완료: {path}")
+    return {'onnx': path}
+
+
+def export_all(model_path=MODEL_PATH, out_dir=EXPORT_DIR, train_dir=TRAIN_DIR):
+    """float16/int8 TFLite 와 ONNX 모델을 모두 내보내고 {이름: 경로} 를 반환하는 함수"""
+    model = tf.keras.models.load_model(model_path)
+    paths = export_tflite(model, out_dir, train_dir)
+    paths.update(export_onnx(model, out_dir))
+    return paths
+
+
+def _rss_mb():
+    """현재 프로세스의 상주 메모리(MB)를 읽는 함수"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+
+def evaluate(name, backend, model_path, validation):
+    """한 백엔드의 지연 시간(p50/p99), 메모리, 검증 정확도를 측정하는 함수"""
+    rss_before = _rss_mb()
+    predict_fn = load_predict_fn(model_path, backend)
+    rss_after = _rss_mb()
+
+    latencies, correct = [], 0
+    for path, label in validation:
+        img = load_image(path, predict_fn.input_size)[None]
+        t0 = time.perf_counter()
+        probs = predict_batch(predict_fn, img)[0]
+        latencies.append(time.perf_counter() - t0)
+        correct += int(np.argmax(probs)) == label
+    latencies = np.array(latencies) * 1000
+    return {
+        'name': name,
+        'backend': backend,
+        'file_mb': os.path.getsize(model_path) / 1e6,
+        'rss_delta_mb': rss_after - rss_before,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'accuracy': correct / max(len(validation), 1),
+    }
+
+
+def report(model_path=MODEL_PATH, exports=None, train_dir=TRAIN_DIR, out_path=None):
+    """Keras 모델과 내보낸 모델들을 검증 데이터로 비교한 표를 출력하는 함수"""
+    _, validation = list_split(train_dir)
+    candidates = [('keras', 'keras', model_path)]
+    for name, path in (exports or {}).items():
+        candidates.append((name, 'onnx' if path.endswith('.onnx') else 'tflite', path))
+
+    rows = [evaluate(name, backend, path, validation) for name, backend, path in candidates]
+    base_accuracy = rows[0]['accuracy']
+    print(f"검증 이미지 {len(validation)}장 기준 (배치 1, CPU 스레드 {os.cpu_count()}개)")
+    print(f"{'model':<16}{'file MB':>9}{'RSS MB':>9}{'p50 ms':>9}{'p99 ms':>9}{'acc':>8}{'Δacc':>8}")
+    for r in rows:
+        print(f"{r['name']:<16}{r['file_mb']:9.1f}{r['rss_delta_mb']:9.1f}{r['p50_ms']:9.2f}"
+              f"{r['p99_ms']:9.2f}{r['accuracy']:8.4f}{r['accuracy'] - base_accuracy:+8.4f}")
+    if out_path:
+        with open(out_path, 'w') as f:
+            json.dump(rows, f, indent=2)
+    return rows
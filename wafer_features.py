@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import EarlyStopping
+from tensorflow.keras.layers import Dense, Dropout, Flatten, Input
+from tensorflow.keras.models import Sequential
+from wafer_config import IMG_HEIGHT, IMG_WIDTH, TRAIN_DIR, SAVE_PATH, FEATURE_CACHE_DIR
+from wafer_dataset import ThroughputCallback, decode_image, list_split, make_datasets, random_affine
+
+HEAD_EPOCHS = 30
+HEAD_BATCH_SIZE = 64
+HEAD_LR = 1e-3
+FINE_TUNE_LR = 1e-5
+FINE_TUNE_LAYERS = 30  # 미세 조정 때 풀어 주는 MobileNetV2 뒤쪽 층 수
+
+
+def file_hash(path):
+    """이미지 파일 내용의 SHA-1 (캐시 키, 파일을 옮기거나 이름을 바꿔도 같음)"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class FeatureCache:
+    """고정된 MobileNetV2 백본의 특징 맵을 이미지 파일 해시별로 한 번만 계산해 두는 메모리 맵 캐시
+
+    cache_dir 안의 파일:
+      backbone.keras  캐시를 만들 때 쓴 백본 (나중에 같은 백본으로 전체 모델을 조립)
+      features.f16    특징 맵 (행, 7, 7, 1280) float16, 새 이미지는 뒤에 이어 씀
+      index.json      해시별 행 번호 [원본, 증강 1, 증강 2, ...] 와 경로별 (수정 시각, 크기, 해시)
+
+    라벨은 캐시에 넣지 않고 매번 폴더 구조에서 읽으므로, 이미지를 다른 클래스 폴더로
+    옮겨 라벨을 고쳐도 특징을 다시 계산하지 않는다.
+    """
+
+    def __init__(self, cache_dir=FEATURE_CACHE_DIR, weights='imagenet'):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.data_path = os.path.join(cache_dir, 'features.f16')
+        self.backbone_path = os.path.join(cache_dir, 'backbone.keras')
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {'shape': None, 'count': 0, 'rows': {}, 'files': {}}
+        self.weights = weights
+        self._backbone = None
+
+    @property
+    def backbone(self):
+        """캐시를 만든 백본 (처음이면 MobileNetV2 를 만들어 저장)"""
+        if self._backbone is None:
+            if os.path.exists(self.backbone_path):
+                self._backbone = tf.keras.models.load_model(self.backbone_path, compile=False)
+            else:
+                from tensorflow.keras.applications import MobileNetV2
+                self._backbone = MobileNetV2(weights=self.weights, include_top=False,
+                                             input_shape=(IMG_WIDTH, IMG_HEIGHT, 3))
+                self._backbone.save(self.backbone_path)
+            self._backbone.trainable = False
+        return self._backbone
+
+    @property
+    def shape(self):
+        return tuple(self.index['shape']) if self.index['shape'] else None
+
+    def features(self):
+        """전체 특징 맵을 읽기 전용 memmap 으로 반환하는 함수"""
+        return np.memmap(self.data_path, np.float16, 'r', shape=(self.index['count'],) + self.shape)
+
+    def hash_of(self, path):
+        """경로의 파일 해시 (수정 시각과 크기가 같으면 이전에 계산한 값 사용)"""
+        stat = os.stat(path)
+        known = self.index['files'].get(path)
+        if known and known[0] == stat.st_mtime and known[1] == stat.st_size:
+            return known[2]
+        digest = file_hash(path)
+        self.index['files'][path] = [stat.st_mtime, stat.st_size, digest]
+        return digest
+
+    def update(self, paths, augment=0, batch_size=32):
+        """캐시에 없는 이미지(또는 증강 수가 모자란 이미지)만 백본을 통과시켜 추가하는 함수
+
+        증강 특징은 wafer_dataset.random_affine 을 한 번 적용한 결과로, 이미지마다 augment 개를
+        고정해 둔다. 추가한 행 수를 반환한다.
+        """
+        todo = {}
+        for path in paths:
+            digest = self.hash_of(path)
+            have = len(self.index['rows'].get(digest, []))
+            if have < augment + 1 and digest not in todo:
+                todo[digest] = (path, have)
+        if not todo:
+            self._save_index()
+            return 0
+
+        t0 = time.perf_counter()
+        added = 0
+        items = list(todo.items())
+        if os.path.exists(self.data_path):
+            # 이전 실행이 중간에 끊겨 인덱스에 없는 행이 남았으면 잘라 내고 그 뒤부터 씀
+            row_bytes = int(np.prod(self.shape)) * 2 if self.shape else 0
+            os.truncate(self.data_path, self.index['count'] * row_bytes)
+        with open(self.data_path, 'ab') as out:
+            for start in range(0, len(items), batch_size):
+                chunk = items[start:start + batch_size]
+                images = tf.stack([decode_image(path, 0)[0] for _, (path, _) in chunk])
+                # 이미지마다 이미 있는 증강 번호 다음부터 계산
+                for variant in range(augment + 1):
+                    selected = [i for i, (_, (_, have)) in enumerate(chunk) if have <= variant]
+                    if not selected:
+                        continue
+                    batch = tf.gather(images, selected)
+                    if variant > 0:
+                        batch = random_affine(batch)
+                    feats = self.backbone(batch, training=False).numpy().astype(np.float16)
+                    if self.index['shape'] is None:
+                        self.index['shape'] = list(feats.shape[1:])
+                    out.write(feats.tobytes())
+                    for i in selected:
+                        self.index['rows'].setdefault(chunk[i][0], []).append(self.index['count'])
+                        self.index['count'] += 1
+                    added += len(selected)
+                out.flush()
+                self._save_index()  # 묶음마다 저장 (끊겨도 기록된 행까지는 그대로 씀)
+                print(f"특징 캐시: {min(start + batch_size, len(items))}/{len(items)} 이미지")
+        self._save_index()
+        print(f"특징 캐시에 {added}행 추가 ({time.perf_counter() - t0:.1f} s, 전체 {self.index['count']}행)")
+        return added
+
+    def rows(self, items, augment=0):
+        """(경로, 라벨) 목록을 (캐시 행 번호, 라벨) 배열로 바꾸는 함수 (이미지마다 원본 + 증강 augment 개)"""
+        rows, labels = [], []
+        for path, label in items:
+            cached = self.index['rows'][self.hash_of(path)][:augment + 1]
+            rows += cached
+            labels += [label] * len(cached)
+        return np.array(rows, np.int64), np.array(labels, np.int32)
+
+    def _save_index(self):
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+
+
+def feature_dataset(features, rows, labels, batch_size=HEAD_BATCH_SIZE, shuffle=False, seed=0):
+    """memmap 특징에서 배치마다 필요한 행만 읽는 tf.data 데이터셋을 만드는 함수"""
+    shape = features.shape[1:]
+
+    def gather(batch_rows):
+        order = np.argsort(batch_rows)  # memmap 은 정렬된 순서로 읽는 편이 빠름
+        out = np.empty((len(batch_rows),) + shape, np.float32)
+        out[order] = features[batch_rows[order]]
+        return out
+
+    ds = tf.data.Dataset.from_tensor_slices((rows, labels))
+    if shuffle:
+        ds = ds.shuffle(len(rows), seed=seed, reshuffle_each_iteration=True)
+
+    def load(batch_rows, batch_labels):
+        x = tf.numpy_function(gather, [batch_rows], tf.float32)
+        x.set_shape((None,) + shape)
+        return x, batch_labels
+    return ds.batch(batch_size).map(load, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def build_head(shape, lr=HEAD_LR):
+    """build_model 의 Flatten + Dense(64) + Dropout + Dense(2) 부분만 특징 맵 입력으로 만드는 함수"""
+    head = Sequential([Input(shape), Flatten(), Dense(64, activation='relu'), Dropout(0.5),
+                       Dense(2, activation='softmax')])
+    head.compile(loss='sparse_categorical_crossentropy', optimizer=tf.keras.optimizers.Adam(lr), metrics=['accuracy'])
+    return head
+
+
+def assemble(backbone, head):
+    """백본과 학습한 헤드를 build_model 과 같은 구조의 전체 모델로 합치는 함수 (serve/export 에서 그대로 사용)"""
+    model = Sequential()
+    model.add(backbone)
+    for layer in head.layers:
+        model.add(layer)
+    model.compile(loss='sparse_categorical_crossentropy', optimizer=tf.keras.optimizers.Adam(1e-4),
+                  metrics=['accuracy'])
+    return model
+
+
+def fine_tune(model, train_dir=TRAIN_DIR, epochs=3, batch_size=HEAD_BATCH_SIZE, layers=FINE_TUNE_LAYERS,
+              lr=FINE_TUNE_LR, cache=''):
+    """헤드를 학습한 뒤 백본 뒤쪽 layers 개 층만 풀어 원본 이미지로 짧게 미세 조정하는 함수"""
+    backbone = model.layers[0]
+    backbone.trainable = True
+    for layer in backbone.layers[:-layers]:
+        layer.trainable = False
+    for layer in backbone.layers:
+        if isinstance(layer, tf.keras.layers.BatchNormalization):
+            layer.trainable = False  # 작은 배치에서 통계가 흔들리지 않도록 고정
+    model.compile(loss='sparse_categorical_crossentropy', optimizer=tf.keras.optimizers.Adam(lr),
+                  metrics=['accuracy'])
+    train_data, validation_data, num_train, _ = make_datasets(train_dir, batch_size, cache)
+    return model.fit(train_data, validation_data=validation_data, epochs=epochs,
+                     callbacks=[ThroughputCallback(num_train)])
+
+
+def train_head(train_dir=TRAIN_DIR, save_path=SAVE_PATH, cache_dir=FEATURE_CACHE_DIR, augment=0,
+               epochs=HEAD_EPOCHS, batch_size=HEAD_BATCH_SIZE, fine_tune_epochs=0, weights='imagenet'):
+    """특징 캐시를 새 이미지만큼 갱신하고 헤드를 캐시에서 학습해 전체 모델로 저장하는 함수
+
+    학습/검증 분할은 wafer_dataset.list_split 과 같다. 검증은 원본 특징만 쓴다.
+    fine_tune_epochs 를 주면 저장 전에 백본 뒤쪽을 원본 이미지로 미세 조정한다.
+    """
+    training, validation = list_split(train_dir)
+    cache = FeatureCache(cache_dir, weights)
+    cache.update([p for p, _ in training], augment)
+    cache.update([p for p, _ in validation], 0)
+
+    features = cache.features()
+    train_rows, train_labels = cache.rows(training, augment)
+    val_rows, val_labels = cache.rows(validation, 0)
+    train_ds = feature_dataset(features, train_rows, train_labels, batch_size, shuffle=True)
+    val_ds = feature_dataset(features, val_rows, val_labels, batch_size)
+
+    head = build_head(cache.shape)
+    t0 = time.perf_counter()
+    history = head.fit(train_ds, validation_data=val_ds if len(val_rows) else None, epochs=epochs,
+                       callbacks=[EarlyStopping(monitor='val_loss' if len(val_rows) else 'loss', patience=5,
+                                                restore_best_weights=True)], verbose=2)
+    print(f"헤드 학습 완료: {time.perf_counter() - t0:.1f} s ({len(train_rows)}행, {len(history.epoch)} 에폭)")
+
+    model = assemble(cache.backbone, head)
+    if fine_tune_epochs:
+        fine_tune(model, train_dir, fine_tune_epochs, batch_size)
+    model.save(save_path)
+    print(f"모델 저장 완료: {save_path}")
+    return model, history
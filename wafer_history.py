@@ -0,0 +1,268 @@
+import argparse
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# 같은 장비의 브리지/카메라/분류기가 함께 쓰는 웨이퍼 이력 DB (빈 문자열이면 기록하지 않음)
+HISTORY_PATH = os.environ.get('MOAS_HISTORY', '/home/moas/wafer_history.db')
+
+# 교대 시작 시각 (현지 시각 기준, 이름, 시작 시)
+SHIFTS = (('A', 6), ('B', 14), ('C', 22))
+
+# 웨이퍼 한 장의 열 (wafer_id 는 wafer_trace.new_wafer_id 로 만든 epoch 마이크로초)
+COLUMNS = (
+    'ts',            # 사이클 시작 시각 (epoch 초)
+    'cell',          # 셀 ID (여러 셀을 한 장비에서 돌릴 때)
+    'weight', 'weight_state',
+    'wafer',         # 아두이노 무게 판정 (normal/broken)
+    'seq',           # 시리얼 프레임 번호
+    'slot',          # 적재 칸 번호
+    'prescreen',     # 깊이 사전 검사 판정 (normal/broken/cnn)
+    'cnn_class', 'probability',
+    'depth_ref', 'image_path', 'frame_ref',
+)
+_COLUMN_TYPES = {'ts': 'REAL', 'weight': 'REAL', 'probability': 'REAL', 'seq': 'INTEGER', 'slot': 'INTEGER'}
+
+_ROLLUP_SELECT = (
+    'COUNT(*), '
+    "SUM(weight_state = 'good'), SUM(weight_state = 'bad'), "
+    "SUM(COALESCE(cnn_class, prescreen) = 'normal'), SUM(COALESCE(cnn_class, prescreen) = 'broken'), "
+    'COUNT(weight), SUM(weight), SUM(weight * weight), MIN(weight), MAX(weight)'
+)
+_ROLLUP_COLUMNS = ('count', 'good', 'bad', 'normal', 'broken', 'weighed', 'weight_sum', 'weight_sq', 'weight_min',
+                   'weight_max')
+
+
+def shift_of(ts):
+    """시각이 속한 교대를 'YYYY-MM-DD/이름' 으로 반환하는 함수 (자정을 넘는 교대는 시작한 날짜)"""
+    local = time.localtime(ts)
+    name, start = SHIFTS[-1], None
+    for shift_name, hour in SHIFTS:
+        if local.tm_hour >= hour:
+            name = shift_name
+            start = hour
+    if start is None:
+        # 첫 교대 시작 전이면 전날 마지막 교대
+        day = time.localtime(ts - 86400)
+        return time.strftime('%Y-%m-%d', day) + '/' + SHIFTS[-1][0]
+    return time.strftime('%Y-%m-%d', local) + '/' + name
+
+
+class WaferHistory:
+    """웨이퍼 사이클마다 한 행을 남기는 추가 전용 SQLite 이력 저장소
+
+    한 웨이퍼의 값은 브리지(무게), 카메라(깊이 참조, 사전 검사), 분류기(CNN 결과)가 각각
+    다른 시점에 record() 로 보내며 같은 wafer_id 행에 합쳐진다. record() 는 대기열에 넣고
+    바로 반환하고, 쓰기 스레드가 모인 것을 한 트랜잭션으로 반영한 뒤 바뀐 시간/교대의
+    집계 행(hourly, shifts)을 다시 계산한다. 여러 프로세스가 같은 파일을 열어도 된다 (WAL).
+    """
+
+    def __init__(self, path=HISTORY_PATH, linger=0.2):
+        self.path = path
+        self.linger = linger
+        self._queue = queue.Queue()
+        self._conn = None
+        self._thread = None
+        if path:
+            self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._create_tables()
+            self._thread = threading.Thread(target=self._run, name='wafer-history', daemon=True)
+            self._thread.start()
+
+    def _create_tables(self):
+        columns = ', '.join(f'{c} {_COLUMN_TYPES.get(c, "TEXT")}' for c in COLUMNS)
+        rollup = ', '.join(f'{c} {"REAL" if c.startswith("weight_") else "INTEGER"}' for c in _ROLLUP_COLUMNS)
+        self._conn.executescript(f'''
+            CREATE TABLE IF NOT EXISTS wafers (wafer_id INTEGER PRIMARY KEY, hour INTEGER, shift TEXT, {columns});
+            CREATE INDEX IF NOT EXISTS wafers_ts ON wafers (ts);
+            CREATE INDEX IF NOT EXISTS wafers_hour ON wafers (hour);
+            CREATE INDEX IF NOT EXISTS wafers_shift ON wafers (shift);
+            CREATE INDEX IF NOT EXISTS wafers_result ON wafers (weight_state, cnn_class, ts);
+            CREATE TABLE IF NOT EXISTS hourly (hour INTEGER PRIMARY KEY, {rollup});
+            CREATE TABLE IF NOT EXISTS shifts (shift TEXT PRIMARY KEY, start REAL, {rollup});
+        ''')
+        # 이전 버전에서 만든 파일에 나중에 추가된 열을 붙임
+        existing = {row[1] for row in self._conn.execute('PRAGMA table_info(wafers)')}
+        for c in COLUMNS:
+            if c not in existing:
+                self._conn.execute(f'ALTER TABLE wafers ADD COLUMN {c} {_COLUMN_TYPES.get(c, "TEXT")}')
+        self._conn.commit()
+
+    def record(self, wafer_id, **fields):
+        """웨이퍼 한 장의 값 일부를 기록하는 함수 (None 인 값은 기존 값을 유지)"""
+        if self._conn is None or not wafer_id or wafer_id < 0:
+            return
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"알 수 없는 이력 항목: {sorted(unknown)}")
+        self._queue.put((int(wafer_id), fields))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            # 같은 사이클의 다른 값이 도착할 시간을 주고 모인 것을 한 번에 반영
+            time.sleep(self.linger)
+            items = [item]
+            stop = False
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                items.append(item)
+            try:
+                self._write(items)
+            except sqlite3.Error as e:
+                print(f"웨이퍼 이력 기록 중 오류 ({len(items)}건): {e}")
+            for _ in range(len(items) + stop):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, items):
+        hours, shifts = set(), set()
+        with self._conn:
+            for wafer_id, fields in items:
+                ts = fields.get('ts')
+                if ts is None:
+                    # 사이클 시작 시각을 모르면 웨이퍼 ID(epoch 마이크로초)에서 구함
+                    row = self._conn.execute('SELECT ts FROM wafers WHERE wafer_id = ?', (wafer_id,)).fetchone()
+                    ts = row[0] if row and row[0] is not None else wafer_id / 1e6
+                    fields = dict(fields, ts=ts)
+                hour, shift = int(ts // 3600), shift_of(ts)
+                names = ['wafer_id', 'hour', 'shift'] + list(fields)
+                updates = ', '.join(f'{n} = COALESCE(excluded.{n}, {n})' for n in names[1:])
+                self._conn.execute(
+                    f'INSERT INTO wafers ({", ".join(names)}) VALUES ({", ".join("?" * len(names))}) '
+                    f'ON CONFLICT(wafer_id) DO UPDATE SET {updates}',
+                    [wafer_id, hour, shift] + list(fields.values()))
+                hours.add(hour)
+                shifts.add(shift)
+            for hour in hours:
+                self._conn.execute(
+                    f'INSERT OR REPLACE INTO hourly (hour, {", ".join(_ROLLUP_COLUMNS)}) '
+                    f'SELECT ?, {_ROLLUP_SELECT} FROM wafers WHERE hour = ?', (hour, hour))
+            for shift in shifts:
+                self._conn.execute(
+                    f'INSERT OR REPLACE INTO shifts (shift, start, {", ".join(_ROLLUP_COLUMNS)}) '
+                    f'SELECT ?, MIN(ts), {_ROLLUP_SELECT} FROM wafers WHERE shift = ?', (shift, shift))
+
+    def flush(self, timeout=10.0):
+        """대기 중인 기록이 반영될 때까지 기다리는 함수"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(10)
+            self._thread = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def _rows(conn, sql, args):
+    cur = conn.execute(sql, args)
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur]
+
+
+def _with_stats(row):
+    """집계 행에 수율과 무게 평균/표준편차를 붙이는 함수"""
+    n = row['weighed'] or 0
+    mean = row['weight_sum'] / n if n else None
+    var = max(row['weight_sq'] / n - mean * mean, 0.0) if n else None
+    classified = (row['normal'] or 0) + (row['broken'] or 0)
+    row.update({
+        'weight_yield': (row['good'] or 0) / row['count'] if row['count'] else None,
+        'class_yield': (row['normal'] or 0) / classified if classified else None,
+        'weight_mean': mean,
+        'weight_std': var ** 0.5 if var is not None else None,
+    })
+    return row
+
+
+def open_readonly(path=HISTORY_PATH):
+    """조회용 연결을 여는 함수 (쓰는 프로세스와 동시에 읽을 수 있음)"""
+    return sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+
+
+def hourly(conn, start, end):
+    """[start, end) 시각 구간의 시간별 집계 목록"""
+    return [_with_stats(r) for r in _rows(
+        conn, 'SELECT * FROM hourly WHERE hour >= ? AND hour < ? ORDER BY hour', (int(start // 3600), int(end // 3600) + 1))]
+
+
+def by_shift(conn, start, end):
+    """[start, end) 시각 구간에 시작한 교대별 집계 목록"""
+    return [_with_stats(r) for r in _rows(
+        conn, 'SELECT * FROM shifts WHERE start >= ? AND start < ? ORDER BY start', (start, end))]
+
+
+def wafers(conn, start, end, weight_state=None, cnn_class=None, limit=1000):
+    """[start, end) 시각 구간의 웨이퍼 목록 (결과로 거를 수 있음, 최근 것부터)"""
+    sql, args = 'SELECT * FROM wafers WHERE ts >= ? AND ts < ?', [start, end]
+    if weight_state:
+        sql += ' AND weight_state = ?'
+        args.append(weight_state)
+    if cnn_class:
+        sql += ' AND cnn_class = ?'
+        args.append(cnn_class)
+    return _rows(conn, sql + ' ORDER BY ts DESC LIMIT ?', args + [limit])
+
+
+def _print_rollups(rows, label):
+    print(f"{label:<16}{'count':>7}{'good':>7}{'bad':>6}{'normal':>8}{'broken':>8}{'w.yield':>9}{'c.yield':>9}"
+          f"{'w.mean':>9}{'w.std':>8}")
+    fmt = lambda v, f: format(v, f) if v is not None else '-'
+    for r in rows:
+        print(f"{r['key']:<16}{r['count']:7d}{r['good'] or 0:7d}{r['bad'] or 0:6d}{r['normal'] or 0:8d}"
+              f"{r['broken'] or 0:8d}{fmt(r['weight_yield'], '9.3f'):>9}{fmt(r['class_yield'], '9.3f'):>9}"
+              f"{fmt(r['weight_mean'], '9.2f'):>9}{fmt(r['weight_std'], '8.3f'):>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='웨이퍼 이력 조회')
+    parser.add_argument('--db', default=HISTORY_PATH)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('hourly', help='시간별 수율/무게 집계')
+    p.add_argument('--days', type=float, default=1)
+    p = sub.add_parser('shifts', help='교대별 수율/무게 집계')
+    p.add_argument('--days', type=float, default=7)
+    p = sub.add_parser('recent', help='최근 웨이퍼 목록')
+    p.add_argument('-n', type=int, default=20)
+    p.add_argument('--weight-state', choices=('good', 'bad'))
+    p.add_argument('--cnn-class', choices=('normal', 'broken'))
+    args = parser.parse_args()
+
+    conn = open_readonly(args.db)
+    now = time.time()
+    t0 = time.perf_counter()
+    if args.command == 'hourly':
+        rows = hourly(conn, now - args.days * 86400, now)
+        for r in rows:
+            r['key'] = time.strftime('%m-%d %H:00', time.localtime(r['hour'] * 3600))
+        _print_rollups(rows, 'hour')
+    elif args.command == 'shifts':
+        rows = by_shift(conn, now - args.days * 86400, now)
+        for r in rows:
+            r['key'] = r['shift']
+        _print_rollups(rows, 'shift')
+    else:
+        for r in wafers(conn, 0, now + 1, args.weight_state, args.cnn_class, args.n):
+            print(f"{time.strftime('%m-%d %H:%M:%S', time.localtime(r['ts']))}  {r['wafer_id']}  "
+                  f"{format(r['weight'], '6.2f') if r['weight'] is not None else '-':>6}  {r['weight_state'] or '-':<5} "
+                  f"{r['cnn_class'] or r['prescreen'] or '-':<7} {r['probability'] if r['probability'] is not None else '-'}")
+    print(f"조회 {1000 * (time.perf_counter() - t0):.1f} ms")
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+import argparse
+import os
+import queue
+import threading
+import time
+import numpy as np
+import tensorflow as tf
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from wafer_config import IMG_WIDTH, CLASS_NAMES, BACKENDS, MODEL_PATH, CAPTURE_DIR, CRED_PATH, DATABASE_URL, per_cell
+from wafer_history import WaferHistory
+from wafer_trace import Tracer, wafer_id_from_path
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+IDLE_WARN_SEC = 60  # PNG 감시 모드에서 이 시간 동안 이미지가 없으면 카메라 설정을 확인하라고 경고
+
+
+def load_predict_fn(model_path=MODEL_PATH, backend='keras', roi=False):
+    """저장된 모델을 한 번 불러와 numpy 배치 -> 확률 배열 예측 함수를 만드는 함수
+
+    backend 는 keras(.keras), tflite(.tflite), onnx(.onnx) 중 하나이며,
+    세 경우 모두 (N, size, size, 3) float32 입력과 (N, 2) 소프트맥스 출력을 쓴다.
+    size 는 모델의 입력 모양에서 읽어 predict.input_size 에 붙인다. 모델 파일만으로는 wafer_roi.py 로
+    크롭 학습한 모델인지 알 수 없으므로 roi 로 지정하며 predict.roi 에 붙인다 (depth_to_input 참고).
+    """
+    if backend == 'keras':
+        predict, size = _load_keras(model_path)
+    elif backend == 'tflite':
+        predict, size = _load_tflite(model_path)
+    elif backend == 'onnx':
+        predict, size = _load_onnx(model_path)
+    else:
+        raise ValueError(f"알 수 없는 추론 백엔드: {backend}")
+    predict.input_size = size
+    predict.roi = roi
+    predict(np.zeros([1, size, size, 3], dtype=np.float32))  # 워밍업
+    return predict
+
+
+def _input_size(shape):
+    """(N, H, W, 3) 입력 모양에서 한 변 크기를 읽는 함수 (정해지지 않았으면 IMG_WIDTH)"""
+    size = shape[1] if len(shape) == 4 else None
+    return int(size) if isinstance(size, (int, np.integer)) and size > 0 else IMG_WIDTH
+
+
+def _load_keras(model_path):
+    """Keras 모델을 tf.function으로 감싼 예측 함수와 입력 크기
+
+    model.predict는 호출마다 데이터 어댑터와 콜백을 새로 만들어 단건 예측에서 오버헤드가 크므로,
+    배치 크기가 가변인 입력 시그니처로 한 번만 트레이싱한 그래프를 재사용한다.
+    """
+    model = tf.keras.models.load_model(model_path)
+    size = _input_size(model.input_shape)
+
+    @tf.function(input_signature=[tf.TensorSpec([None, size, size, 3], tf.float32)])
+    def predict_graph(images):
+        return model(images, training=False)
+
+    return lambda images: predict_graph(tf.constant(images)).numpy(), size
+
+
+def _load_tflite(model_path):
+    """TFLite 인터프리터 예측 함수와 입력 크기 (tflite_runtime 이 있으면 우선 사용)"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        Interpreter = tf.lite.Interpreter
+    interpreter = Interpreter(model_path=model_path, num_threads=os.cpu_count())
+    input_details = interpreter.get_input_details()[0]
+    input_index = input_details['index']
+    output_index = interpreter.get_output_details()[0]['index']
+    lock = threading.Lock()
+    shape = [None]
+
+    def predict(images):
+        with lock:  # 인터프리터는 스레드 안전하지 않음
+            if shape[0] != images.shape:
+                # 배치 크기가 바뀔 때만 텐서를 다시 할당
+                interpreter.resize_tensor_input(input_index, images.shape)
+                interpreter.allocate_tensors()
+                shape[0] = images.shape
+            interpreter.set_tensor(input_index, images)
+            interpreter.invoke()
+            return interpreter.get_tensor(output_index).copy()
+    return predict, _input_size(list(input_details['shape']))
+
+
+def _load_onnx(model_path):
+    """ONNX Runtime CPU 세션 예측 함수와 입력 크기"""
+    import onnxruntime as ort
+    session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+    model_input = session.get_inputs()[0]
+    input_name = model_input.name
+    return lambda images: session.run(None, {input_name: images})[0], _input_size(model_input.shape)
+
+
+def load_image(image_path, size=IMG_WIDTH):
+    """이미지 파일을 읽어 모델 입력 (size x size, 0~1 정규화) 으로 바꾸는 함수"""
+    img = tf.io.read_file(image_path)
+    # IMAGE_EXTENSIONS 의 PNG/JPEG 모두 읽음 (형식은 파일 내용으로 판단)
+    img = tf.image.decode_image(img, channels=3, expand_animations=False)
+    img = tf.image.resize(img, [size, size])
+    return (img / 255.0).numpy()
+
+
+def depth_to_input(depth, size=IMG_WIDTH, roi=False):
+    """원본 깊이 프레임을 카메라의 PNG 와 같은 컬러맵으로 바꿔 모델 입력으로 만드는 함수 (PNG 인코딩/디코딩 없음)
+
+    roi 가 거짓이면 프레임 전체를 size x size 로 줄이고, 참이면 wafer_roi 로 웨이퍼 부분만 정사각형으로
+    잘라 그 크기로 만든다. 모델에 맞춰 부를 때는 model_input_args(predict_fn) 을 그대로 넘기면 된다.
+    """
+    if roi:
+        from wafer_roi import roi_input
+        return roi_input(np.asarray(depth), size)
+    from depth_archive import colorize_depth
+    img = tf.image.resize(colorize_depth(np.asarray(depth)), [size, size])
+    return (img / 255.0).numpy()
+
+
+def model_input_args(predict_fn):
+    """예측 함수에 맞는 depth_to_input 의 (size, roi) 를 반환하는 함수 (load_predict_fn 이 아닌 함수는 224 전체 프레임)"""
+    return getattr(predict_fn, 'input_size', IMG_WIDTH), getattr(predict_fn, 'roi', False)
+
+
+def predict_batch(predict_fn, images):
+    """(N, 224, 224, 3) 이미지 배열을 예측해 소프트맥스 확률 배열을 반환하는 함수"""
+    return predict_fn(np.ascontiguousarray(images, dtype=np.float32))
+
+
+def format_prediction(probs):
+    """소프트맥스 출력을 (클래스 이름, 정확도 문자열) 로 바꾸는 함수"""
+    pred_str = CLASS_NAMES[int(np.argmax(probs))]
+    probability = "{0:0.2f}".format(100 * float(np.max(probs)))
+    return pred_str, probability
+
+
+class MicroBatcher:
+    """도착한 요청을 최대 배치 크기와 최대 대기 시간 기준으로 묶어 한 번에 예측하는 클래스
+
+    첫 요청이 오면 max_wait 동안만 추가 요청을 기다리므로, 단건은 max_wait 이내의 지연으로
+    바로 처리되고 여러 셀이나 재검사 작업이 몰리면 배치 처리량으로 소화된다.
+    """
+
+    def __init__(self, predict_fn, on_result, max_batch=16, max_wait=0.01):
+        self.predict_fn = predict_fn
+        self.on_result = on_result  # on_result(key, pred_str, probability, latency)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, key, image):
+        """전처리된 이미지 하나를 예측 대기열에 넣는 함수"""
+        self._queue.put((key, image, time.monotonic()))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        """첫 요청을 기다린 뒤 max_wait 동안 max_batch 까지 요청을 모으는 함수"""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # 남은 배치를 처리한 뒤 종료
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            images = np.stack([image for _, image, _ in batch])
+            try:
+                probs = predict_batch(self.predict_fn, images)
+            except Exception as e:
+                print(f"배치 예측 중 오류 ({len(batch)}장): {e}")
+                continue
+            now = time.monotonic()
+            print(f"배치 예측 완료: {len(batch)}장")
+            for (key, _, submitted), p in zip(batch, probs):
+                pred_str, probability = format_prediction(p)
+                try:
+                    self.on_result(key, pred_str, probability, now - submitted)
+                except Exception as e:
+                    print(f"예측 결과 보고 중 오류 ({key}): {e}")
+
+
+class CaptureDirHandler(FileSystemEventHandler):
+    """캡처 디렉터리에 쓰기가 끝난 이미지를 배처에 넘기는 watchdog 핸들러"""
+
+    def __init__(self, batcher, size=IMG_WIDTH):
+        super().__init__()
+        self.batcher = batcher
+        self.size = size
+        self.last_image = time.monotonic()  # 마지막으로 이미지가 들어온 시각 (없으면 시작 시각)
+
+    def on_closed(self, event):
+        self.handle(event.src_path)
+
+    def on_moved(self, event):
+        self.handle(event.dest_path)
+
+    def handle(self, path):
+        """이미지 파일이면 전처리해서 예측 대기열에 넣는 함수"""
+        if not path.lower().endswith(IMAGE_EXTENSIONS) or os.path.isdir(path):
+            return
+        self.last_image = time.monotonic()
+        try:
+            self.batcher.submit(path, load_image(path, self.size))
+        except Exception as e:
+            print(f"이미지 로드 중 오류 ({path}): {e}")
+
+
+def update_firebase(image_path, pred_str, probability):
+    """예측 결과를 Firestore에 이미지별 문서와 마지막 예측으로 기록하는 함수"""
+    from firebase_admin import firestore
+    db = firestore.client()
+    result = {'prediction': pred_str, 'accuracy': probability, 'image_path': image_path}
+    batch = db.batch()
+    batch.set(db.collection('predictions').document('last_prediction'), result)
+    batch.set(db.collection('predictions').document(os.path.basename(image_path)), result)
+    batch.commit()
+
+
+def open_state(state=None):
+    """분류 결과(cnn_probability)를 올릴 상태 저장소를 열고, 접근할 수 없으면 시작할 때 바로 실패하는 함수
+
+    웨이퍼마다 report 안에서 실패하면 MicroBatcher 가 오류만 출력하고 넘어가 GUI 신뢰도 분위수가
+    조용히 비게 되므로, 시작할 때 한 번 읽어 확인한다 (Firebase 는 databaseURL 이 없으면 여기서 실패).
+    """
+    from state_bus import open_backend
+    state = state or open_backend()
+    try:
+        state.get('cnn_probability')
+    except Exception as e:
+        raise RuntimeError(f"상태 저장소에 접근할 수 없습니다 (Firebase databaseURL 확인): {e}") from e
+    return state
+
+
+def serve(model_path=MODEL_PATH, watch_dir=CAPTURE_DIR, max_batch=16, max_wait=0.01, on_result=None,
+          predict_fn=None, backend='keras', roi=False, state=None):
+    """모델을 한 번 올려 두고 캡처 디렉터리를 감시하며 도착하는 이미지를 분류하는 함수
+
+    PNG 에는 깊이가 없어 웨이퍼 ROI 를 자를 수 없으므로 ROI 크롭 모델은 받지 않는다 (serve_handoff 사용).
+    camera.py 는 공유 메모리 링(MOAS_HANDOFF=1)을 쓰면 PNG 를 쓰지 않으므로, IDLE_WARN_SEC 동안 이미지가 없으면 경고한다.
+    """
+    if roi or getattr(predict_fn, 'roi', False):
+        raise ValueError("ROI 크롭 모델은 깊이 프레임이 필요해 PNG 감시 모드로 쓸 수 없습니다 (--handoff 사용)")
+    state = open_state(state)
+    tracer = Tracer('inference')
+    history = WaferHistory()
+
+    def report(image_path, pred_str, probability, latency):
+        print(f"Predicted: {pred_str}, Accuracy: {probability}% ({image_path}, {1000 * latency:.1f} ms)")
+        now = time.monotonic()
+        wafer_id = wafer_id_from_path(image_path)
+        tracer.record(wafer_id, 'inference', now - latency, now)
+        history.record(wafer_id, cnn_class=pred_str, probability=float(probability))
+        update_firebase(image_path, pred_str, probability)
+        state.set('cnn_probability', float(probability))
+
+    predict_fn = predict_fn or load_predict_fn(model_path, backend)
+    batcher = MicroBatcher(predict_fn, on_result or report, max_batch, max_wait)
+    observer = Observer()
+    handler = CaptureDirHandler(batcher, model_input_args(predict_fn)[0])
+    observer.schedule(handler, watch_dir, recursive=False)
+    observer.start()
+    print(f"캡처 디렉터리 감시 시작: {watch_dir}")
+    warned = False
+    try:
+        while observer.is_alive():
+            observer.join(1)
+            idle = time.monotonic() - handler.last_image
+            if idle > IDLE_WARN_SEC and not warned:
+                print(f"{watch_dir} 에 {idle:.0f}초 동안 이미지가 없습니다. camera.py 를 MOAS_HANDOFF=1 로 "
+                      f"실행했다면 serve --handoff 로 공유 메모리 프레임을 받으세요")
+            warned = idle > IDLE_WARN_SEC
+    finally:
+        observer.stop()
+        observer.join()
+        batcher.close()
+        history.close()
+        state.close()
+
+
+def serve_handoff(model_path=MODEL_PATH, max_batch=16, max_wait=0.01, on_result=None, predict_fn=None,
+                  backend='keras', state=None, ring_name=None, roi=False):
+    """카메라가 공유 메모리 링(frame_handoff)에 올린 깊이 프레임을 PNG 없이 바로 분류하는 함수
+
+    상태의 frame_ref('링 이름:번호')가 바뀔 때마다 공유 메모리의 프레임에서 바로 컬러맵 변환과
+    리사이즈를 수행하므로 파일 쓰기/읽기와 PNG 인코딩/디코딩이 없다. ring_name(기본: 이 셀의 링)
+    이 아닌 링의 참조는 다른 셀의 프레임이므로 무시한다.
+    """
+    from frame_handoff import DEFAULT_NAME, FrameRing, parse_ref
+    ring_name = ring_name or per_cell(DEFAULT_NAME)
+    state = open_state(state)
+    tracer = Tracer('inference')
+    history = WaferHistory()
+    attached = {'ring': None, 'last_seq': -1}
+
+    def report(key, pred_str, probability, latency):
+        ref, wafer_id = key
+        print(f"Predicted: {pred_str}, Accuracy: {probability}% ({ref}, {1000 * latency:.1f} ms)")
+        now = time.monotonic()
+        tracer.record(wafer_id, 'inference', now - latency, now)
+        history.record(wafer_id, cnn_class=pred_str, probability=float(probability))
+        update_firebase(f"wafer_{wafer_id}", pred_str, probability)
+        state.set('cnn_probability', float(probability))
+
+    predict_fn = predict_fn or load_predict_fn(model_path, backend, roi)
+    input_args = model_input_args(predict_fn)
+    batcher = MicroBatcher(predict_fn, on_result or report, max_batch, max_wait)
+
+    def on_frame_ref(key, ref):
+        if not ref:
+            return
+        name, seq = parse_ref(ref)
+        if name != ring_name:
+            return
+        ring = attached['ring']
+        if ring is None or ring.name != name or seq <= attached['last_seq']:
+            # 처음이거나 카메라가 다시 시작해 링을 새로 만든 경우 다시 붙음
+            if ring is not None:
+                ring.close()
+            ring = attached['ring'] = FrameRing(name)
+        attached['last_seq'] = seq
+        try:
+            record, frame = ring.view(seq)
+            if frame is None:
+                print(f"프레임이 이미 덮어쓰여 건너뜀: {ref}")
+                return
+            image = depth_to_input(frame, *input_args)
+            if not ring.still_valid(seq):
+                print(f"전처리 중 프레임이 덮어쓰여 건너뜀: {ref}")
+                return
+            batcher.submit((ref, int(record['wafer_id'])), image)
+        except Exception as e:
+            print(f"프레임 전처리 중 오류 ({ref}): {e}")
+
+    state.subscribe('frame_ref', on_frame_ref)
+    print("공유 메모리 프레임 대기 시작")
+    try:
+        threading.Event().wait()
+    finally:
+        batcher.close()
+        history.close()
+        if attached['ring'] is not None:
+            attached['ring'].close()
+        state.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='웨이퍼 분류 상주 서비스')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--backend', choices=BACKENDS, default='keras')
+    parser.add_argument('--watch-dir', default=CAPTURE_DIR)
+    parser.add_argument('--cred', default=CRED_PATH)
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=10.0)
+    parser.add_argument('--handoff', action='store_true', help='캡처 디렉터리 대신 카메라 공유 메모리에서 프레임 수신')
+    parser.add_argument('--roi', action='store_true', help='wafer_roi.py 로 크롭 학습한 모델 (--handoff 전용)')
+    args = parser.parse_args()
+
+    import firebase_admin
+    from firebase_admin import credentials
+    firebase_admin.initialize_app(credentials.Certificate(args.cred), {'databaseURL': DATABASE_URL})
+
+    if args.handoff:
+        serve_handoff(args.model, args.max_batch, args.max_wait_ms / 1000.0, backend=args.backend, roi=args.roi)
+    else:
+        serve(args.model, args.watch_dir, args.max_batch, args.max_wait_ms / 1000.0, backend=args.backend,
+              roi=args.roi)
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""캡처 -> 전처리 -> 분류 -> 결과 기록 -> 표시 단계를 작업 스레드로 나눈 한 프로세스 파이프라인
+
+단계 사이는 크기가 정해진 대기열로 이어져 있어 뒤 단계가 밀리면 앞 단계가 기다리고(배압),
+웨이퍼 N 을 분류/기록하는 동안 웨이퍼 N+1 을 캡처/전처리한다. Tk 표시 창은 별도 프로세스에서
+돌고, 표시 단계는 최신 결과만 넘기므로 화면이 느려도 분류가 밀리지 않는다.
+
+python wafer_pipeline.py --model saved_model.keras                 # 상태 백엔드의 trigger 로 동작
+python wafer_pipeline.py --simulate 200 --interval 0.05 --no-gui   # 가짜 깊이 프레임/트리거로 처리량 측정
+"""
+import argparse
+import multiprocessing
+import queue
+import threading
+import time
+import numpy as np
+
+STOP = object()        # 단계 종료 표시
+QUEUE_DEPTH = 4        # 단계 사이 대기열 크기
+MAX_BATCH = 8          # 분류 단계 최대 배치
+METRICS_SEC = 5.0      # 대기열 길이 출력 주기
+DISPLAY_SIZE = (850, 850)
+DRAIN_MS = 50          # 표시 프로세스가 대기열을 확인하는 주기
+
+
+class Stage:
+    """입력 대기열에서 항목을 꺼내 처리하고 다음 단계 대기열에 넣는 작업 스레드
+
+    fn(items) 는 처리한 항목 목록을 돌려준다. batch > 1 이면 대기열에 쌓인 만큼(최대 batch)
+    한 번에 꺼낸다. 다음 대기열이 가득 차면 빈자리가 날 때까지 기다리며, 그 시간을 blocked 로 센다.
+    lossy 이면 이 단계의 대기열이 가득 찰 때 앞 단계를 기다리게 하지 않고 가장 오래된 항목을 버린다
+    (최신 항목만 의미 있는 표시 단계용, 버린 수는 dropped).
+    """
+
+    def __init__(self, name, fn, maxsize=QUEUE_DEPTH, batch=1, lossy=False):
+        self.name = name
+        self.fn = fn
+        self.batch = batch
+        self.lossy = lossy
+        self.dropped = 0
+        self.inbox = queue.Queue(maxsize)
+        self.next = None
+        self.processed = 0
+        self.busy = 0.0      # 처리에 쓴 시간 (초)
+        self.blocked = 0.0   # 다음 단계가 가득 차서 기다린 시간 (초)
+        self.max_depth = 0
+        self._thread = threading.Thread(target=self._run, name=f'pipeline-{name}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def put(self, item):
+        while self.lossy:
+            try:
+                self.inbox.put_nowait(item)
+                break
+            except queue.Full:
+                try:
+                    self.inbox.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+        else:
+            self.inbox.put(item)
+        self.max_depth = max(self.max_depth, self.inbox.qsize())
+
+    def _run(self):
+        while True:
+            items = [self.inbox.get()]
+            while items[-1] is not STOP and len(items) < self.batch:
+                try:
+                    items.append(self.inbox.get_nowait())
+                except queue.Empty:
+                    break
+            stop = items[-1] is STOP
+            if stop:
+                items.pop()
+            if items:
+                t0 = time.perf_counter()
+                try:
+                    results = self.fn(items)
+                except Exception as e:
+                    print(f"{self.name} 단계 오류 ({len(items)}건): {e}")
+                    results = []
+                self.busy += time.perf_counter() - t0
+                self.processed += len(items)
+                if self.next is not None:
+                    t0 = time.perf_counter()
+                    for result in results:
+                        self.next.put(result)
+                    self.blocked += time.perf_counter() - t0
+            if stop:
+                if self.next is not None:
+                    self.next.put(STOP)
+                return
+
+
+class WaferPipeline:
+    """트리거마다 깊이 프레임을 잡아 분류하고 결과를 기록/표시하는 단계별 파이프라인
+
+    state 의 trigger 가 1 이 되면 그 시각과 wafer_id 를 캡처 단계에 넣는다. 캡처 단계는 링 버퍼에서
+    트리거 이후 첫 프레임을 꺼내고 trigger 를 0 으로 되돌린다. report(item) 은 결과 기록 단계에서
+    호출되며 (Firestore 등), display 가 있으면 표시 단계가 최신 결과를 그쪽으로 넘긴다.
+    """
+
+    def __init__(self, service, predict_fn, state=None, report=None, display=None, tracer=None, history=None,
+                 depth=QUEUE_DEPTH, max_batch=MAX_BATCH):
+        from wafer_inference import depth_to_input, format_prediction, model_input_args, predict_batch
+        self.service = service
+        self.state = state
+        self.report = report
+        self.display = display
+        self.tracer = tracer
+        self.history = history
+        input_args = model_input_args(predict_fn)
+        self._depth_to_input = lambda depth: depth_to_input(depth, *input_args)
+        self._format = format_prediction
+        self._predict = lambda images: predict_batch(predict_fn, images)
+
+        # 트리거는 잃으면 안 되므로 크기 제한 없이 받고, 그 뒤 단계부터 배압을 건다
+        self.stages = [
+            Stage('capture', self._capture, maxsize=0),
+            Stage('preprocess', self._preprocess, depth),
+            Stage('infer', self._infer, depth, batch=max_batch),
+            Stage('publish', self._publish, depth),
+        ]
+        if display is not None:
+            # 쌓인 결과를 한 번에 모두 꺼내 최신 것만 그리고, 표시가 밀리면 오래된 결과를 버려
+            # 결과 기록/분류 단계가 표시를 기다리지 않게 함
+            self.stages.append(Stage('display', self._display, depth, batch=depth, lossy=True))
+        for stage, following in zip(self.stages, self.stages[1:]):
+            stage.next = following
+        self.done = 0
+        self.latencies = []
+        self._stopped = threading.Event()
+        self._metrics = None
+
+    def start(self, metrics_sec=METRICS_SEC):
+        for stage in self.stages:
+            stage.start()
+        if self.state is not None:
+            self.state.subscribe('trigger', self.on_trigger)
+        if metrics_sec:
+            self._metrics = threading.Thread(target=self._print_metrics, args=(metrics_sec,), daemon=True)
+            self._metrics.start()
+        return self
+
+    def on_trigger(self, key, value):
+        """상태 구독 콜백: trigger 가 1 이 된 시각과 그때의 wafer_id 를 캡처 단계에 넣는 함수"""
+        if value == 1:
+            self.trigger(self.state.get('wafer_id', -1))
+
+    def trigger(self, wafer_id, t=None):
+        self.stages[0].put({'wafer_id': wafer_id, 'trigger_time': time.monotonic() if t is None else t})
+
+    def _capture(self, items):
+        out = []
+        for item in items:
+            frame_time, depth = self.service.capture_at(item['trigger_time'])
+            if depth is None:
+                print(f"트리거 이후 프레임을 받지 못했습니다 (wafer {item['wafer_id']})")
+                continue
+            if self.state is not None:
+                self.state.set('trigger', 0)
+            if self.tracer is not None:
+                self.tracer.record(item['wafer_id'], 'frame_acquired', item['trigger_time'], frame_time)
+            item.update({'frame_time': frame_time, 'depth': depth})
+            out.append(item)
+        return out
+
+    def _preprocess(self, items):
+        for item in items:
+            with self._span(item, 'preprocess'):
+                item['image'] = self._depth_to_input(item['depth'])
+        return items
+
+    def _infer(self, items):
+        t0 = time.monotonic()
+        probs = self._predict(np.stack([item.pop('image') for item in items]))
+        for item, p in zip(items, probs):
+            item['prediction'], item['accuracy'] = self._format(p)
+            if self.tracer is not None:
+                self.tracer.record(item['wafer_id'], 'inference', t0, batch=len(items))
+        return items
+
+    def _publish(self, items):
+        for item in items:
+            with self._span(item, 'publish'):
+                if self.report is not None:
+                    self.report(item)
+                if self.history is not None:
+                    self.history.record(item['wafer_id'], cnn_class=item['prediction'],
+                                        probability=float(item['accuracy']))
+                if self.state is not None:
+                    self.state.set('cnn_probability', float(item['accuracy']))  # GUI 신뢰도 분위수
+            self.latencies.append(time.monotonic() - item['trigger_time'])
+            self.done += 1
+            if self.display is None:
+                item.pop('depth')
+        return items
+
+    def _display(self, items):
+        # 표시 창은 최신 웨이퍼만 보면 되므로 마지막 항목만 변환해서 넘김
+        from PIL import Image
+        from depth_archive import colorize_depth
+        item = items[-1]
+        image = Image.fromarray(colorize_depth(item.pop('depth'))).resize(DISPLAY_SIZE)
+        info = {key: item[key] for key in ('wafer_id', 'prediction', 'accuracy')}
+        try:
+            self.display.put_nowait((info, image.tobytes()))
+        except queue.Full:
+            pass  # 표시 창이 밀리면 이번 웨이퍼는 건너뜀
+        return []
+
+    def _span(self, item, stage):
+        import contextlib
+        return self.tracer.span(item['wafer_id'], stage) if self.tracer is not None else contextlib.nullcontext()
+
+    def depths(self):
+        """단계별 입력 대기열 길이"""
+        return {stage.name: stage.inbox.qsize() for stage in self.stages}
+
+    def _print_metrics(self, interval):
+        while not self._stopped.wait(interval):
+            print("대기열: " + ', '.join(f"{name} {depth}" for name, depth in self.depths().items())
+                  + f" (완료 {self.done})")
+
+    def stop(self, timeout=10.0):
+        """남은 항목을 끝까지 처리하고 단계 스레드를 멈추는 함수"""
+        self.stages[0].put(STOP)
+        for stage in self.stages:
+            stage.join(timeout)
+        self._stopped.set()
+        if self.display is not None:
+            self.display.put(None)
+
+    def summary(self):
+        """단계별 처리 수, 평균 처리/대기 시간, 최대 대기열 길이를 출력하는 함수"""
+        print(f"{'stage':<12}{'items':>7}{'busy ms':>10}{'blocked ms':>12}{'max queue':>11}{'dropped':>9}")
+        for stage in self.stages:
+            n = max(stage.processed, 1)
+            print(f"{stage.name:<12}{stage.processed:7d}{1000 * stage.busy / n:10.2f}{1000 * stage.blocked / n:12.2f}"
+                  f"{stage.max_depth:11d}{stage.dropped:9d}")
+        if self.latencies:
+            lat = np.array(self.latencies) * 1000
+            print(f"트리거 -> 결과 기록: p50 {np.percentile(lat, 50):.1f} ms, p95 {np.percentile(lat, 95):.1f} ms")
+
+
+def run_display(display_queue, title='Wafer Pipeline'):
+    """표시 프로세스: 파이프라인이 넘긴 최신 이미지와 결과를 Tk 창에 띄우는 함수 (None 을 받으면 종료)"""
+    import tkinter as tk
+    from PIL import Image, ImageTk
+    root = tk.Tk()
+    root.title(title)
+    image_label = tk.Label(root)
+    image_label.pack()
+    text = tk.StringVar()
+    tk.Label(root, textvariable=text, font=('Helvetica', 28, 'bold')).pack(fill=tk.X)
+
+    def poll():
+        latest = None
+        try:
+            while True:
+                latest = display_queue.get_nowait()
+                if latest is None:
+                    root.destroy()
+                    return
+        except queue.Empty:
+            pass
+        if latest is not None:
+            info, data = latest
+            img_tk = ImageTk.PhotoImage(Image.frombytes('RGB', DISPLAY_SIZE, data))
+            image_label.config(image=img_tk)
+            image_label.image = img_tk
+            text.set(f"Wafer {info['wafer_id']}  :  {info['prediction']}  ({info['accuracy']} %)")
+        root.after(DRAIN_MS, poll)
+
+    poll()
+    root.mainloop()
+
+
+def main(argv=None):
+    from wafer_config import BACKENDS, CRED_PATH, DATABASE_URL, MODEL_PATH
+    parser = argparse.ArgumentParser(description='단계별 웨이퍼 분류 파이프라인')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--backend', choices=BACKENDS, default='keras')
+    parser.add_argument('--cred', default=CRED_PATH)
+    parser.add_argument('--depth', type=int, default=QUEUE_DEPTH, help='단계 사이 대기열 크기')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    parser.add_argument('--no-gui', action='store_true', help='표시 프로세스 없이 실행')
+    parser.add_argument('--roi', action='store_true', help='wafer_roi.py 로 크롭 학습한 모델')
+    parser.add_argument('--simulate', type=int, metavar='N', help='가짜 깊이 프레임으로 N개 트리거 후 종료')
+    parser.add_argument('--interval', type=float, default=0.1, help='--simulate 트리거 간격 (초)')
+    args = parser.parse_args(argv)
+
+    from capture_service import DepthCaptureService, RealSenseSource
+    from wafer_history import WaferHistory
+    from wafer_inference import load_predict_fn, update_firebase
+    from wafer_trace import Tracer
+
+    if args.simulate:
+        from simulator import WaferDepthSource
+        source = WaferDepthSource()
+        state = report = history = None
+        if args.model == MODEL_PATH:
+            # 모델 경로를 주지 않았으면 같은 구조의 무작위 가중치 모델로 측정
+            import tempfile
+            from wafer_training import build_model
+            args.model = tempfile.mktemp(suffix='.keras')
+            build_model(weights=None).save(args.model)
+    else:
+        import firebase_admin
+        from firebase_admin import credentials
+        from state_bus import open_backend
+        firebase_admin.initialize_app(credentials.Certificate(args.cred), {'databaseURL': DATABASE_URL})
+        source = RealSenseSource()
+        state = open_backend()
+        history = WaferHistory()
+        report = lambda item: update_firebase(f"wafer_{item['wafer_id']}", item['prediction'], item['accuracy'])
+
+    display = display_process = None
+    if not args.no_gui:
+        # Tk 는 자기 프로세스의 메인 스레드에서 돌림
+        display = multiprocessing.Queue(maxsize=2)
+        display_process = multiprocessing.Process(target=run_display, args=(display,), daemon=True)
+        display_process.start()
+
+    service = DepthCaptureService(source, capacity=30).start()
+    tracer = Tracer('pipeline')
+    pipeline = WaferPipeline(service, load_predict_fn(args.model, args.backend, args.roi), state, report, display, tracer,
+                             history, args.depth, args.max_batch).start()
+    print("파이프라인 시작")
+    t0 = time.perf_counter()
+    try:
+        if args.simulate:
+            for i in range(args.simulate):
+                source.set_wafer('broken' if i % 10 == 0 else 'normal')
+                time.sleep(args.interval)
+                pipeline.trigger(i + 1)
+        else:
+            threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+        elapsed = time.perf_counter() - t0
+        service.stop()
+        tracer.close()
+        if history is not None:
+            history.close()
+        if state is not None:
+            state.close()
+        pipeline.summary()
+        if args.simulate:
+            busy = sum(stage.busy / max(stage.processed, 1) for stage in pipeline.stages)
+            print(f"처리량: {pipeline.done / elapsed:.1f} wafers/s "
+                  f"(단계를 차례로 실행하면 최대 {1 / busy:.1f} wafers/s)")
+        if display_process is not None:
+            display_process.join(2)
+
+
+if __name__ == "__main__":
+    main()
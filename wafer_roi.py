@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""깊이 프레임에서 웨이퍼 원판을 찾아 정사각형 ROI 만 분류기에 넣는 전처리
+
+1280x720 프레임 전체를 224x224 로 줄이면 가로세로 비율이 찌그러지고 화소 대부분이 배경이라 금이 뭉개진다.
+깊이 대역(배경보다 MIN_HEIGHT_MM 이상 가까운 화소)과 연결 요소로 원판을 찾아 정사각형으로 자른 뒤
+96/160/224 중 하나로 줄인다. 해상도마다 크롭으로 학습한 모델이 필요하며, 입력 해상도는 모델에서 읽고
+ROI 크롭 모델인지는 서비스의 --roi 로 지정한다.
+
+python wafer_roi.py train --train-dir <깊이 학습셋> --sizes 96 160 224
+python wafer_roi.py report --train-dir <깊이 학습셋> --models 96=m_roi96.keras 160=m_roi160.keras [--full saved_model.keras]
+"""
+import argparse
+import os
+import time
+import cv2
+import numpy as np
+from depth_archive import colorize_depth
+from depth_prescreen import MIN_AREA_PX, MIN_HEIGHT_MM, load_labeled_frames
+from wafer_config import INPUT_SIZES, SAVE_PATH, TRAIN_DEPTH_DIR
+
+ROI_STRIDE = 4          # 위치 찾기용 다운샘플 간격 (1280x720 -> 320x180)
+ROI_MARGIN = 0.08       # 원판 지름 대비 사방 여백
+FRAGMENT_RATIO = 0.05   # 가장 큰 요소의 이 비율 이상이고 그 근처에 있으면 같은 웨이퍼 조각으로 봄
+
+
+def locate(depth, depth_scale=0.001, stride=ROI_STRIDE):
+    """웨이퍼 원판을 감싸는 정사각형 (y0, x0, 한 변) 을 원본 해상도 좌표로 반환하는 함수 (못 찾으면 None)
+
+    파손 웨이퍼의 떨어진 조각도 함께 담도록, 가장 큰 연결 요소 근처의 큰 요소는 같은 상자에 넣는다.
+    """
+    z = depth[::stride, ::stride].astype(np.float32) * (depth_scale * 1000)  # mm
+    valid = z > 0
+    if np.count_nonzero(valid) < MIN_AREA_PX:
+        return None
+    background = np.percentile(z[valid], 95)
+    mask = (valid & (z < background - MIN_HEIGHT_MM)).astype(np.uint8)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if count < 2:
+        return None
+    stats = stats[1:]  # 0 번은 배경
+    areas = stats[:, cv2.CC_STAT_AREA]
+    best = stats[np.argmax(areas)]
+    if best[cv2.CC_STAT_AREA] < MIN_AREA_PX:
+        return None
+
+    # 가장 큰 요소의 상자를 절반만큼 넓힌 범위 안에 중심이 있는 큰 요소만 합침
+    bx, by, bw, bh = best[:4]
+    cx = stats[:, 0] + stats[:, 2] / 2
+    cy = stats[:, 1] + stats[:, 3] / 2
+    keep = (areas >= FRAGMENT_RATIO * best[cv2.CC_STAT_AREA]) & \
+        (np.abs(cx - (bx + bw / 2)) <= bw) & (np.abs(cy - (by + bh / 2)) <= bh)
+    x0, y0 = stats[keep, 0].min(), stats[keep, 1].min()
+    x1, y1 = (stats[keep, 0] + stats[keep, 2]).max(), (stats[keep, 1] + stats[keep, 3]).max()
+
+    side = int(max(x1 - x0, y1 - y0) * stride * (1 + 2 * ROI_MARGIN))
+    center_y, center_x = (y0 + y1) / 2 * stride, (x0 + x1) / 2 * stride
+    return int(round(center_y - side / 2)), int(round(center_x - side / 2)), side
+
+
+def crop_square(image, box):
+    """(y0, x0, 한 변) 상자로 자르는 함수 (프레임 밖으로 나간 부분은 0 = 측정 실패로 채움)"""
+    y0, x0, side = box
+    h, w = image.shape[:2]
+    crop = image[max(y0, 0):min(y0 + side, h), max(x0, 0):min(x0 + side, w)]
+    if crop.shape[:2] != (side, side):
+        pad = ((max(-y0, 0), max(y0 + side - h, 0)), (max(-x0, 0), max(x0 + side - w, 0)))
+        crop = np.pad(crop, pad + ((0, 0),) * (image.ndim - 2))
+    return crop
+
+
+def roi_image(depth, size, depth_scale=0.001):
+    """깊이 프레임의 웨이퍼 ROI 를 컬러맵으로 바꿔 size x size uint8 RGB 로 만드는 함수
+
+    웨이퍼를 찾지 못하면 (빈 트레이 등) 프레임 전체를 그대로 줄인다.
+    """
+    box = locate(depth, depth_scale)
+    if box is not None:
+        depth = crop_square(depth, box)
+    return cv2.resize(colorize_depth(depth), (size, size), interpolation=cv2.INTER_AREA)
+
+
+def roi_input(depth, size, depth_scale=0.001):
+    """roi_image 를 모델 입력 (0~1 float32) 으로 바꾸는 함수"""
+    return roi_image(depth, size, depth_scale).astype(np.float32) / 255.0
+
+
+def roi_model_path(save_path, size):
+    """해상도별 ROI 모델 저장 경로 (saved_model.keras -> saved_model_roi160.keras)"""
+    base, ext = os.path.splitext(save_path)
+    return f"{base}_roi{size}{ext}"
+
+
+def load_crops(items, size):
+    """(아카이브, 번호, 라벨) 목록을 ROI 이미지 배열 (uint8), 라벨 번호 배열, 프레임당 전처리 시간으로 만드는 함수"""
+    from wafer_config import CLASS_NAMES
+    images, labels, seconds = [], [], []
+    for archive, number, label in items:
+        depth_scale = float(archive.index()[number]['depth_scale'])
+        depth = archive.frame(number)
+        t0 = time.perf_counter()
+        images.append(roi_image(depth, size, depth_scale))
+        seconds.append(time.perf_counter() - t0)
+        labels.append(CLASS_NAMES.index(label))
+    return np.stack(images), np.array(labels, np.int32), seconds
+
+
+def train(train_dir=TRAIN_DEPTH_DIR, sizes=INPUT_SIZES, save_path=SAVE_PATH, epochs=15, batch_size=32,
+          weights='imagenet'):
+    """해상도마다 깊이 학습셋의 ROI 크롭으로 build_model 을 학습해 roi_model_path 에 저장하는 함수"""
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import EarlyStopping
+    from wafer_training import build_model
+    training, validation = load_labeled_frames(train_dir)
+    paths = {}
+    for size in sizes:
+        x_train, y_train, _ = load_crops(training, size)
+        x_val, y_val, _ = load_crops(validation, size)
+        to_float = lambda x, y: (tf.cast(x, tf.float32) / 255.0, y)
+        train_ds = tf.data.Dataset.from_tensor_slices((x_train, y_train)).shuffle(len(x_train), seed=0) \
+            .batch(batch_size).map(to_float).prefetch(tf.data.AUTOTUNE)
+        val_ds = tf.data.Dataset.from_tensor_slices((x_val, y_val)).batch(batch_size).map(to_float)
+
+        model = build_model(weights, size)
+        t0 = time.perf_counter()
+        history = model.fit(train_ds, validation_data=val_ds if len(x_val) else None, epochs=epochs, verbose=2,
+                            callbacks=[EarlyStopping(monitor='val_loss' if len(x_val) else 'loss', patience=4,
+                                                     restore_best_weights=True)])
+        paths[size] = roi_model_path(save_path, size)
+        model.save(paths[size])
+        print(f"{size}x{size} ROI 모델 저장: {paths[size]} ({time.perf_counter() - t0:.1f} s, "
+              f"{len(history.epoch)} 에폭, 학습 {len(x_train)}장)")
+    return paths
+
+
+def _evaluate(predict_fn, validation, to_input):
+    """검증 프레임을 한 장씩 전처리/분류해 (정확도, 전처리 시간 목록, 분류 시간 목록) 을 반환하는 함수"""
+    from wafer_inference import format_prediction, predict_batch
+    correct, prep, infer = [], [], []
+    for archive, number, label in validation:
+        depth_scale = float(archive.index()[number]['depth_scale'])
+        depth = archive.frame(number)
+        t0 = time.perf_counter()
+        image = to_input(depth, depth_scale)
+        t1 = time.perf_counter()
+        probs = predict_batch(predict_fn, image[None])[0]
+        t2 = time.perf_counter()
+        correct.append(format_prediction(probs)[0] == label)
+        prep.append(t1 - t0)
+        infer.append(t2 - t1)
+    return float(np.mean(correct)) if correct else float('nan'), prep, infer
+
+
+def report(models, train_dir=TRAIN_DEPTH_DIR, full_model=None, backend='keras'):
+    """검증 분할에서 해상도별 ROI 모델의 정확도와 웨이퍼 한 장 지연 (전처리 + 분류) 을 비교 출력하는 함수
+
+    models 는 {해상도: 모델 경로}, full_model 을 주면 기존 전체 프레임 224 모델도 같은 표에 넣는다.
+    """
+    from wafer_inference import depth_to_input, load_predict_fn
+    _, validation = load_labeled_frames(train_dir)
+    found = [locate(archive.frame(n), float(archive.index()[n]['depth_scale'])) is not None
+             for archive, n, _ in validation]
+    print(f"검증 {len(validation)}장, 웨이퍼 위치 찾음 {sum(found)}장")
+
+    rows = []
+    if full_model:
+        predict_fn = load_predict_fn(full_model, backend)
+        rows.append((f"full {predict_fn.input_size}", predict_fn,
+                     lambda d, s, size=predict_fn.input_size: depth_to_input(d, size)))
+    for size, path in sorted(models.items()):
+        predict_fn = load_predict_fn(path, backend, roi=True)
+        if predict_fn.input_size != size:
+            print(f"{path}: 모델 입력이 {predict_fn.input_size}x{predict_fn.input_size} 라 그 크기로 자릅니다")
+        rows.append((f"roi {predict_fn.input_size}", predict_fn,
+                     lambda d, s, size=predict_fn.input_size: roi_input(d, size, s)))
+
+    print(f"{'input':<10}{'accuracy':>10}{'prep p50':>10}{'infer p50':>11}{'total p50':>11}{'total p99':>11}")
+    results = {}
+    for name, predict_fn, to_input in rows:
+        accuracy, prep, infer = _evaluate(predict_fn, validation, to_input)
+        total = np.add(prep, infer)
+        results[name] = {'accuracy': accuracy, 'prep_ms': 1000 * np.median(prep),
+                         'infer_ms': 1000 * np.median(infer), 'total_ms': 1000 * np.median(total)}
+        print(f"{name:<10}{accuracy:10.4f}{1000 * np.median(prep):8.2f}ms{1000 * np.median(infer):9.2f}ms"
+              f"{1000 * np.median(total):9.2f}ms{1000 * np.percentile(total, 99):9.2f}ms")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='웨이퍼 ROI 크롭 학습과 해상도별 비교')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('train', help='해상도별 ROI 크롭 모델 학습')
+    p.add_argument('--train-dir', default=TRAIN_DEPTH_DIR)
+    p.add_argument('--sizes', type=int, nargs='+', default=list(INPUT_SIZES))
+    p.add_argument('--save-path', default=SAVE_PATH, help='해상도별로 _roi<크기> 를 붙여 저장')
+    p.add_argument('--epochs', type=int, default=15)
+    p.add_argument('--batch-size', type=int, default=32)
+    p.add_argument('--no-imagenet', action='store_true', help='사전 학습 가중치 없이 무작위 초기화')
+    p = sub.add_parser('report', help='해상도별 정확도/지연 비교')
+    p.add_argument('--train-dir', default=TRAIN_DEPTH_DIR)
+    p.add_argument('--models', nargs='+', required=True, help='해상도=경로 (예: 96=m_roi96.keras)')
+    p.add_argument('--full', help='기존 전체 프레임 224 모델 (같은 표에 비교)')
+    p.add_argument('--backend', default='keras')
+    args = parser.parse_args(argv)
+
+    if args.command == 'train':
+        train(args.train_dir, args.sizes, args.save_path, args.epochs, args.batch_size,
+              None if args.no_imagenet else 'imagenet')
+    else:
+        models = {int(size): path for size, path in (item.split('=', 1) for item in args.models)}
+        report(models, args.train_dir, args.full, args.backend)
+
+
+if __name__ == "__main__":
+    main()
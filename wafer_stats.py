@@ -0,0 +1,242 @@
+"""GUI 통계 패널용 웨이퍼 롤링 집계 (이벤트마다 O(1))
+
+상태 구독으로 들어오는 키 하나하나(weight, wafer, cnn_probability)를 그대로 넣으면 되고, 이력 DB 를 다시
+조회하지 않는다. 신뢰도 분위수는 분류기가 올리는 cnn_probability 로 계산한다 (스케치가 보내는 accuracy 는
+고정값이라 쓰지 않음). 화면은 snapshot() 을 원하는 주기로 읽어 그리면 된다.
+
+python wafer_stats.py   # 이벤트당 처리 시간 측정
+"""
+import math
+import threading
+import time
+from collections import deque
+from wafer_config import MAX_WEIGHT, MIN_WEIGHT  # 스케치의 정상 무게 범위 (30~35 g)
+
+HIST_LOW, HIST_HIGH, HIST_BIN = 25.0, 40.0, 0.5  # 무게 히스토그램 범위 (g)
+WINDOW_WAFERS = 500      # 히스토그램과 정상/파손 비율을 계산하는 최근 웨이퍼 수
+RATE_SECONDS = 60        # wafers/min 을 계산하는 구간
+EWMA_ALPHA = 0.05
+QUANTILES = (0.05, 0.5, 0.95)
+KEYS = ('weight', 'wafer', 'cnn_probability')  # 집계에 쓰는 상태 키
+
+
+class RateCounter:
+    """최근 seconds 초 동안의 이벤트 수를 초 단위 고리 버퍼로 세는 클래스"""
+
+    def __init__(self, seconds=RATE_SECONDS):
+        self.seconds = seconds
+        self.buckets = [0] * seconds
+        self.total = 0
+        self.last = None  # 마지막으로 반영한 초
+
+    def _advance(self, now):
+        second = int(now)
+        if self.last is None:
+            self.last = second
+        # 지난 초의 칸을 비움 (한 번에 최대 seconds 칸)
+        for s in range(self.last + 1, min(second, self.last + self.seconds) + 1):
+            self.total -= self.buckets[s % self.seconds]
+            self.buckets[s % self.seconds] = 0
+        self.last = max(self.last, second)
+
+    def add(self, now):
+        self._advance(now)
+        self.buckets[int(now) % self.seconds] += 1
+        self.total += 1
+
+    def per_minute(self, now):
+        self._advance(now)
+        return self.total * 60.0 / self.seconds
+
+
+class P2Quantile:
+    """P² 알고리즘 (Jain & Chlamtac) 으로 값을 저장하지 않고 분위수 하나를 추정하는 클래스"""
+
+    def __init__(self, q):
+        self.q = q
+        self.heights = []
+        self.pos = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5]
+        self.step = [0, q / 2, q, (1 + q) / 2, 1]
+
+    def add(self, x):
+        h = self.heights
+        if len(h) < 5:
+            h.append(x)
+            h.sort()
+            return
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if h[i] <= x < h[i + 1])
+        for i in range(k + 1, 5):
+            self.pos[i] += 1
+        for i in range(5):
+            self.desired[i] += self.step[i]
+        for i in (1, 2, 3):
+            d = self.desired[i] - self.pos[i]
+            if (d >= 1 and self.pos[i + 1] - self.pos[i] > 1) or (d <= -1 and self.pos[i - 1] - self.pos[i] < -1):
+                d = 1 if d > 0 else -1
+                new = self._parabolic(i, d)
+                if not h[i - 1] < new < h[i + 1]:
+                    new = h[i] + d * (h[i + d] - h[i]) / (self.pos[i + d] - self.pos[i])
+                h[i] = new
+                self.pos[i] += d
+
+    def _parabolic(self, i, d):
+        h, n = self.heights, self.pos
+        return h[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self):
+        h = self.heights
+        if not h:
+            return None
+        if len(h) < 5:
+            return h[min(len(h) - 1, int(self.q * len(h)))]
+        return h[2]
+
+
+class WaferStats:
+    """웨이퍼 이벤트 스트림의 롤링 집계 (처리량, 정상/파손, 무게 EWMA/히스토그램, 신뢰도 분위수)
+
+    observe() 는 상태 구독 스레드에서, snapshot() 은 화면 스레드에서 불러도 된다.
+    """
+
+    def __init__(self, window=WINDOW_WAFERS, alpha=EWMA_ALPHA, quantiles=QUANTILES, clock=time.monotonic):
+        self.clock = clock
+        self.alpha = alpha
+        self.rate = RateCounter()
+        self.total = 0
+        self.kinds = {'normal': 0, 'broken': 0}          # 시작 후 전체
+        self.recent_kinds = {'normal': 0, 'broken': 0}   # 최근 window 장
+        self.recent = deque(maxlen=window)
+        self.bins = [0] * int(round((HIST_HIGH - HIST_LOW) / HIST_BIN))
+        self.under = self.over = 0   # 히스토그램 범위 밖
+        self.in_spec = 0             # 최근 window 장 중 MIN_WEIGHT~MAX_WEIGHT
+        self.recent_weights = deque(maxlen=window)
+        self.ewma = self.ewm_var = None
+        self.sketches = [P2Quantile(q) for q in quantiles]
+        self.version = 0  # 값이 바뀔 때마다 증가 (화면은 바뀐 경우에만 다시 그림)
+        self._skip = {}
+        self._lock = threading.Lock()
+
+    def seed(self, snapshot):
+        """구독 직후 다시 오는 현재 상태(최초 이벤트)를 새 웨이퍼로 세지 않도록 기억하는 함수
+
+        구독할 때 현재 값을 다시 보내는 백엔드(state.replays_on_subscribe)에서만 불러야 한다.
+        그렇지 않은 백엔드에서 부르면 같은 값으로 들어오는 첫 실제 이벤트를 버리게 된다.
+        """
+        with self._lock:
+            self._skip = {key: snapshot[key] for key in KEYS if key in snapshot}
+
+    def observe(self, key, value):
+        """상태 구독의 (키, 값) 하나를 반영하는 함수 (관계없는 키는 무시)"""
+        if key not in KEYS or value in (None, ''):
+            return
+        with self._lock:
+            if key in self._skip:
+                if self._skip.pop(key) == value:
+                    return
+            try:
+                if key == 'weight':
+                    self._add_weight(float(value))
+                elif key == 'wafer':
+                    self._add_kind(value)
+                else:
+                    for sketch in self.sketches:
+                        sketch.add(float(value))
+            except (TypeError, ValueError):
+                return
+            self.version += 1
+
+    def _add_weight(self, weight):
+        # weight 가 새 웨이퍼 사이클의 시작 (MoAS_Final_python_code.handle_record 와 같은 규칙)
+        self.total += 1
+        self.rate.add(self.clock())
+        if self.ewma is None:
+            self.ewma, self.ewm_var = weight, 0.0
+        else:
+            diff = weight - self.ewma
+            self.ewma += self.alpha * diff
+            self.ewm_var = (1 - self.alpha) * (self.ewm_var + self.alpha * diff * diff)
+        if len(self.recent_weights) == self.recent_weights.maxlen:
+            self._count_weight(self.recent_weights[0], -1)
+        self.recent_weights.append(weight)
+        self._count_weight(weight, 1)
+
+    def _count_weight(self, weight, delta):
+        if MIN_WEIGHT <= weight <= MAX_WEIGHT:
+            self.in_spec += delta
+        if weight < HIST_LOW:
+            self.under += delta
+        elif weight >= HIST_HIGH:
+            self.over += delta
+        else:
+            self.bins[int((weight - HIST_LOW) / HIST_BIN)] += delta
+
+    def _add_kind(self, kind):
+        if kind not in self.kinds:
+            return
+        self.kinds[kind] += 1
+        if len(self.recent) == self.recent.maxlen:
+            self.recent_kinds[self.recent[0]] -= 1
+        self.recent.append(kind)
+        self.recent_kinds[kind] += 1
+
+    def snapshot(self):
+        """화면에 그릴 값을 dict 로 반환하는 함수 (히스토그램 칸 수만큼만 복사)"""
+        with self._lock:
+            recent = len(self.recent)
+            weights = len(self.recent_weights)
+            return {
+                'version': self.version,
+                'total': self.total,
+                'per_minute': self.rate.per_minute(self.clock()),
+                'normal': self.kinds['normal'],
+                'broken': self.kinds['broken'],
+                'recent': recent,
+                'recent_yield': 100.0 * self.recent_kinds['normal'] / recent if recent else None,
+                'ewma': self.ewma,
+                'ewm_std': math.sqrt(self.ewm_var) if self.ewm_var is not None else None,
+                'in_spec': 100.0 * self.in_spec / weights if weights else None,
+                'bins': list(self.bins),
+                'under': self.under,
+                'over': self.over,
+                'quantiles': {s.q: s.value() for s in self.sketches},
+            }
+
+
+def main():
+    import random
+    rng = random.Random(0)
+    stats = WaferStats()
+    n = 200000
+    events = []
+    for i in range(n):
+        good = rng.random() > 0.1
+        events += [('weight', rng.gauss(32.5, 1.5)), ('wafer', 'normal' if good else 'broken'),
+                   ('cnn_probability', min(100.0, rng.gauss(97, 2)))]
+    t0 = time.perf_counter()
+    for key, value in events:
+        stats.observe(key, value)
+    elapsed = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    snap = stats.snapshot()
+    snap_ms = 1000 * (time.perf_counter() - t0)
+    print(f"이벤트 {len(events)}개: {1e6 * elapsed / len(events):.2f} us/이벤트, snapshot {snap_ms:.3f} ms")
+    print(f"EWMA {snap['ewma']:.2f} g (std {snap['ewm_std']:.2f}), 규격 내 {snap['in_spec']:.1f} %, "
+          f"최근 수율 {snap['recent_yield']:.1f} %")
+    accuracies = sorted(v for k, v in events if k == 'cnn_probability')
+    for q, value in snap['quantiles'].items():
+        exact = accuracies[int(q * (len(accuracies) - 1))]
+        print(f"신뢰도 p{int(q * 100)}: {value:.2f} (정확한 값 {exact:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+from wafer_config import per_cell
+
+# 구간 기록 파일 (빈 문자열이면 기록하지 않음), 프로세스마다 moas_trace.<프로세스>.jsonl 로 따로 쓰고 요약할 때 합침
+TRACE_PATH = os.environ.get('MOAS_TRACE', '/tmp/moas_trace.jsonl')
+MAX_BYTES = 16 * 1024 * 1024  # 넘으면 .1 로 돌려 쓰는 링 파일
+
+# 한 웨이퍼 사이클의 단계 (표시 순서)
+STAGES = ('serial_parse', 'db_write', 'trigger_observed', 'frame_acquired', 'prescreen', 'handoff', 'encode',
+          'encode_png', 'preprocess', 'inference', 'publish', 'ui_shown')
+
+
+def new_wafer_id():
+    """웨이퍼 상관관계 ID (epoch 마이크로초, 정렬 가능한 정수) 를 만드는 함수"""
+    return time.time_ns() // 1000
+
+
+def process_path(path, process):
+    """프로세스별 기록 파일 경로 (/tmp/moas_trace.jsonl -> /tmp/moas_trace.camera.jsonl)"""
+    base, ext = os.path.splitext(path)
+    return f"{base}.{process}{ext}"
+
+
+def wafer_id_from_path(path):
+    """'..._<wafer_id>.png' 형식의 파일 이름에서 웨이퍼 ID를 꺼내는 함수"""
+    match = re.search(r'_(\d+)\.\w+$', path or '')
+    return int(match.group(1)) if match else None
+
+
+class Tracer:
+    """웨이퍼별 단계 구간을 단조 시계(time.monotonic) 기준으로 JSONL 파일에 남기는 클래스
+
+    time.monotonic 은 같은 장비의 프로세스끼리 공유되는 시계라서 브리지에서 기록한 시각과
+    카메라/분류기/GUI 에서 기록한 시각을 그대로 빼서 비교할 수 있다. 파일은 프로세스(셀)마다
+    따로 써서 돌려 쓸 때 다른 프로세스가 연 파일을 건드리지 않는다.
+    """
+
+    def __init__(self, process, path=TRACE_PATH, max_bytes=MAX_BYTES):
+        self.process = process
+        self.path = process_path(path, per_cell(process)) if path else path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'a', buffering=1) if self.path else None
+
+    def record(self, wafer_id, stage, start, end=None, **attrs):
+        """구간 하나를 기록하는 함수 (start/end 는 time.monotonic 값)"""
+        if self._file is None or wafer_id is None:
+            return
+        end = time.monotonic() if end is None else end
+        span = {'wafer': wafer_id, 'stage': stage, 'start': start, 'end': end,
+                'ms': round(1000 * (end - start), 3), 'proc': self.process, 'wall': time.time()}
+        span.update(attrs)
+        line = json.dumps(span) + '\n'
+        with self._lock:
+            self._file.write(line)
+            if self._file.tell() > self.max_bytes:
+                self._rotate()
+
+    @contextlib.contextmanager
+    def span(self, wafer_id, stage, **attrs):
+        """with 블록 구간을 기록하는 함수"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(wafer_id, stage, start, **attrs)
+
+    def _rotate(self):
+        """기록 파일이 커지면 .1 로 옮기고 새로 시작하는 함수"""
+        self._file.close()
+        os.replace(self.path, self.path + '.1')
+        self._file = open(self.path, 'a', buffering=1)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def load_spans(path=TRACE_PATH):
+    """프로세스별 기록 파일(및 돌려 쓴 .1 파일)을 모두 읽어 구간 목록으로 합치는 함수"""
+    spans = []
+    base, ext = os.path.splitext(path)
+    files = sorted(glob.glob(f"{glob.escape(base)}.*{ext}")) + [path]
+    for p in [f + '.1' for f in files] + files:
+        if not os.path.exists(p):
+            continue
+        with open(p) as f:
+            for line in f:
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    pass  # 다른 프로세스가 쓰는 중이던 마지막 줄
+    return spans
+
+
+def summarize(spans, out=sys.stdout):
+    """단계별 p50/p95/p99 지연과 시간당 웨이퍼 수를 출력하는 함수"""
+    by_stage = defaultdict(list)
+    by_wafer = defaultdict(list)
+    for s in spans:
+        by_stage[s['stage']].append(s['ms'])
+        by_wafer[s['wafer']].append(s)
+
+    print(f"{'stage':<18}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}", file=out)
+    stages = [st for st in STAGES if st in by_stage] + sorted(set(by_stage) - set(STAGES))
+    for stage in stages:
+        p50, p95, p99 = np.percentile(by_stage[stage], [50, 95, 99])
+        print(f"{stage:<18}{len(by_stage[stage]):7d}{p50:10.2f}{p95:10.2f}{p99:10.2f}", file=out)
+
+    # 웨이퍼별 종단 간 지연: 첫 구간 시작부터 마지막 구간 끝까지
+    e2e = [1000 * (max(s['end'] for s in ss) - min(s['start'] for s in ss)) for ss in by_wafer.values()]
+    if e2e:
+        p50, p95, p99 = np.percentile(e2e, [50, 95, 99])
+        print(f"{'end_to_end':<18}{len(e2e):7d}{p50:10.2f}{p95:10.2f}{p99:10.2f}", file=out)
+
+    walls = [s['wall'] for s in spans]
+    if len(by_wafer) > 1 and max(walls) > min(walls):
+        rate = (len(by_wafer) - 1) / (max(walls) - min(walls)) * 3600
+        print(f"처리량: {rate:.1f} wafers/hour ({len(by_wafer)} wafers)", file=out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='웨이퍼 사이클 구간 기록 요약')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('summary', help='단계별 p50/p95/p99 지연과 시간당 웨이퍼 수 출력')
+    p.add_argument('path', nargs='?', default=TRACE_PATH or '/tmp/moas_trace.jsonl')
+    args = parser.parse_args()
+    summarize(load_spans(args.path))
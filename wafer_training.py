@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import tensorflow as tf
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.layers import Dense, Dropout, Flatten
+from tensorflow.keras.applications import MobileNetV2
+from tensorflow.keras.preprocessing.image import ImageDataGenerator
+from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
+from wafer_config import IMG_WIDTH, IMG_HEIGHT, TRAIN_DIR, SAVE_PATH
+from wafer_dataset import ThroughputCallback, make_datasets, measure_input_rate
+
+BATCH_SIZE = 64  # 적절한 배치 크기 설정
+EPOCHS = 15
+
+
+def build_model(weights='imagenet', size=IMG_WIDTH):
+    """MobileNetV2 + Flatten + Dense(64) + Dense(2) 분류 모델을 만들고 컴파일하는 함수 (weights=None 이면 무작위 초기화)"""
+    base_model = MobileNetV2(weights=weights, include_top=False, input_shape=(size, size, 3))
+    model = Sequential()
+    model.add(base_model)
+    model.add(Flatten())
+    model.add(Dense(64, activation='relu'))
+    model.add(Dropout(0.5))
+    model.add(Dense(2, activation='softmax'))
+
+    # 모델 컴파일
+    model.compile(
+        loss='sparse_categorical_crossentropy',
+        optimizer=tf.keras.optimizers.Adam(1e-4),
+        metrics=['accuracy']
+    )
+    return model
+
+
+def make_generators(train_dir=TRAIN_DIR, batch_size=BATCH_SIZE):
+    """데이터 증강을 포함한 학습/검증 데이터 생성기를 만드는 함수"""
+    train_datagen = ImageDataGenerator(
+        rescale=1./255,
+        rotation_range=20,
+        width_shift_range=0.2,
+        height_shift_range=0.2,
+        shear_range=0.2,
+        zoom_range=0.2,
+        validation_split=0.15  # 15%는 검증 데이터
+    )
+
+    train_generator = train_datagen.flow_from_directory(
+        train_dir,
+        target_size=(IMG_WIDTH, IMG_HEIGHT),
+        batch_size=batch_size,
+        class_mode='sparse',
+        subset='training'
+    )
+
+    validation_generator = train_datagen.flow_from_directory(
+        train_dir,
+        target_size=(IMG_WIDTH, IMG_HEIGHT),
+        batch_size=batch_size,
+        class_mode='sparse',
+        subset='validation'
+    )
+    return train_generator, validation_generator
+
+
+def train(train_dir=TRAIN_DIR, save_path=SAVE_PATH, epochs=EPOCHS, batch_size=BATCH_SIZE,
+          pipeline='tfdata', cache=''):
+    """모델을 학습하고 Keras 형식으로 저장하는 함수
+
+    pipeline='tfdata' 이면 병렬 디코딩/캐시/그래프 증강을 쓰는 tf.data 입력을,
+    'keras' 이면 기존 ImageDataGenerator 입력을 쓴다.
+    """
+    callbacks = [EarlyStopping(monitor='val_loss', patience=5), ModelCheckpoint('best_model.keras', monitor='val_accuracy', save_best_only=True)]
+    if pipeline == 'tfdata':
+        train_data, validation_data, num_train, _ = make_datasets(train_dir, batch_size, cache)
+        callbacks.append(ThroughputCallback(num_train))
+    else:
+        train_data, validation_data = make_generators(train_dir, batch_size)
+        callbacks.append(ThroughputCallback(train_data.samples))
+    model = build_model()
+
+    # 모델 학습
+    history = model.fit(
+        train_data,
+        validation_data=validation_data,
+        epochs=epochs,
+        callbacks=callbacks
+    )
+    if pipeline == 'tfdata':
+        measure_input_rate(train_data)  # 캐시가 채워진 뒤 입력 단독 처리량 비교용
+
+    # Keras 형식으로 모델 저장
+    model.save(save_path)
+    print(f"모델 저장 완료: {save_path}")
+    return model, history